@@ -0,0 +1,102 @@
+"""
+bench_import.py
+---------------
+Cold-import benchmark for the summariser module.
+
+Each sample imports the module in a fresh interpreter and records wall time
+plus the number of outbound socket connections made during the import.
+Pass --baseline <git rev> to run the same measurement against an older
+checkout (exported to a temp dir) for a before/after comparison.
+
+    python benchmarks/bench_import.py
+    python benchmarks/bench_import.py --baseline HEAD~1 --runs 10
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+from io import BytesIO
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+DEFAULT_MODULE = "step2_summarisation_with_easier_reading"
+
+# Runs inside the child interpreter. Counts socket connects and reports
+# import time (or the exception) as JSON on stdout.
+_PROBE = r"""
+import json, socket, sys, time
+connects = 0
+_orig = socket.socket.connect
+def _counting_connect(self, *a, **kw):
+    global connects
+    connects += 1
+    return _orig(self, *a, **kw)
+socket.socket.connect = _counting_connect
+
+start = time.perf_counter()
+error = None
+try:
+    __import__(sys.argv[1])
+except BaseException as e:
+    error = f"{type(e).__name__}: {str(e)[:120]}"
+elapsed = time.perf_counter() - start
+print(json.dumps({"seconds": elapsed, "connects": connects, "error": error}))
+"""
+
+
+def _sample(module: str, cwd: Path) -> dict:
+    out = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", _PROBE, module],
+        cwd=cwd, capture_output=True, text=True, timeout=120,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def measure(module: str, cwd: Path, runs: int) -> dict:
+    samples = [_sample(module, cwd) for _ in range(runs)]
+    times = [s["seconds"] for s in samples]
+    return {
+        "median_s": statistics.median(times),
+        "min_s": min(times),
+        "connects": max(s["connects"] for s in samples),
+        "error": next((s["error"] for s in samples if s["error"]), None),
+    }
+
+
+def _export_rev(rev: str, dest: Path) -> Path:
+    archive = subprocess.run(
+        ["git", "archive", "--format=tar", rev],
+        cwd=REPO_ROOT, capture_output=True, check=True,
+    ).stdout
+    with tarfile.open(fileobj=BytesIO(archive)) as tar:
+        tar.extractall(dest, filter="data")
+    return dest
+
+
+def _report(label: str, r: dict) -> None:
+    status = f"FAILED ({r['error']})" if r["error"] else "ok"
+    print(f"{label:<10} median {r['median_s'] * 1000:8.1f} ms   "
+          f"min {r['min_s'] * 1000:8.1f} ms   connects {r['connects']:<3} {status}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--module", default=DEFAULT_MODULE)
+    ap.add_argument("--runs", type=int, default=5)
+    ap.add_argument("--baseline", help="git revision to compare against")
+    args = ap.parse_args()
+
+    current = measure(args.module, REPO_ROOT, args.runs)
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            before = measure(args.module, _export_rev(args.baseline, Path(tmp)), args.runs)
+        _report(args.baseline, before)
+    _report("current", current)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,466 @@
+"""
+bench_pipeline.py
+-----------------
+Offline benchmark for the briefing pipeline.
+
+Recorded SerpAPI responses, article HTML and an LLM reply (benchmarks/
+fixtures) are replayed through fakes for GoogleSearch, the httpx meta
+client (an httpx.MockTransport stub server), gspread and the OpenAI
+client, so no network access or secrets are needed. Each stage is timed
+at several scales, where the scale is the number of scraped articles,
+split between Google News and Top Stories (the CAP_* limits are raised
+to match):
+
+    meta_cold     fetch_meta_descriptions, empty meta cache
+    meta_warm     fetch_meta_descriptions, every URL cached
+    sheets_store  store_data_in_google_sheets (warm meta cache)
+    prompt        format_data_for_prompt on the scraped tabs
+    parse_briefs  parse + render the recorded reply (and a truncated one)
+    end_to_end    briefing.refresh(force=True) on an empty state store
+
+Results can be saved as a baseline and later runs compared against it;
+a stage that got slower than --tolerance exits non-zero.
+
+    python benchmarks/bench_pipeline.py --save benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --compare benchmarks/baseline.json
+    python benchmarks/bench_pipeline.py --scales 40,400,4000 --http-ms 5
+
+Telemetry is off unless PORTAL_TELEMETRY is set explicitly. With --record
+(run from the repo root, with live secrets) the SerpAPI fixtures are
+refreshed from real responses instead.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
+sys.path.insert(0, str(REPO_ROOT))
+os.environ.setdefault("PORTAL_TELEMETRY", "0")
+
+import httpx  # noqa: E402
+
+DEFAULT_SCALES = (40, 400, 4000)
+HOSTS = 60            # distinct publisher hosts the scaled URLs are spread over
+ERROR_EVERY = 25      # every Nth article URL answers 403
+
+
+def _load(name: str):
+    return json.loads((FIXTURES / name).read_text(encoding="utf-8"))
+
+
+# ---------------------------------------------------------------------
+# Fixtures, scaled
+# ---------------------------------------------------------------------
+def _scaled_articles(items: List[dict], n: int, kind: str) -> List[dict]:
+    """`n` distinct articles cloned from the recorded ones, spread over HOSTS hosts."""
+    out = []
+    for i in range(n):
+        a = dict(items[i % len(items)])
+        path = a["link"].split("/", 3)[3]
+        a["link"] = f"https://www.pub{i % HOSTS:02d}.example.com.au/{kind}/{i}/{path}"
+        if i >= len(items):
+            a["title"] = f"{a['title']} ({i})"
+        out.append(a)
+    return out
+
+
+class Fixtures:
+    def __init__(self, scale: int):
+        n_news = scale // 2
+        self.news = _scaled_articles(_load("serpapi_google_news.json")["news_results"], n_news, "news")
+        self.top = _scaled_articles(_load("serpapi_top_stories.json")["top_stories"], scale - n_news, "top")
+        self.trends = _load("serpapi_trends.json")
+        self.reply = json.dumps(_load("briefing_reply.json"))
+        self.html = (FIXTURES / "article.html").read_text(encoding="utf-8")
+
+    @property
+    def urls(self) -> List[str]:
+        return [a["link"] for a in self.news + self.top]
+
+
+# ---------------------------------------------------------------------
+# Fakes
+# ---------------------------------------------------------------------
+class Counters:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.values: Dict[str, int] = {}
+
+    def add(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.values[name] = self.values.get(name, 0) + n
+
+
+def fake_google_search(fx: Fixtures, counters: Counters, latency_s: float):
+    class FakeGoogleSearch:
+        def __init__(self, params: dict):
+            self.params = params
+            self.timeout = None
+
+        def get_dict(self) -> dict:
+            counters.add("serpapi_calls")
+            time.sleep(latency_s)
+            if self.params.get("engine") == "google_trends":
+                return json.loads(json.dumps(fx.trends))
+            if self.params.get("tbm") == "nws":
+                return {"news_results": [dict(a) for a in fx.news]}
+            return {"top_stories": [dict(a) for a in fx.top]}
+
+    return FakeGoogleSearch
+
+
+def meta_client_factory(fx: Fixtures, counters: Counters, latency_s: float) -> Callable:
+    """Replacement for _build_meta_client: same limits, but served by a stub transport."""
+    import data_retrieval_storage_news_engine as engine
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        counters.add("http_requests")
+        if latency_s:
+            await asyncio.sleep(latency_s)
+        i = int(request.url.path.split("/")[2])
+        if i % ERROR_EVERY == ERROR_EVERY - 1:
+            return httpx.Response(403)
+        body = (fx.html.replace("%%URL%%", str(request.url))
+                       .replace("%%TITLE%%", f"Article {i}")
+                       .replace("%%DESCRIPTION%%", f"Recorded description for article {i}."))
+        return httpx.Response(200, content=body.encode("utf-8"),
+                              headers={"content-type": "text/html; charset=utf-8", "etag": f'"{i}"'})
+
+    def build() -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            transport=httpx.MockTransport(handler),
+            follow_redirects=True,
+            timeout=engine.META_TIMEOUT,
+            limits=httpx.Limits(max_connections=engine.META_CONCURRENCY,
+                                max_keepalive_connections=engine.META_CONCURRENCY),
+        )
+
+    return build
+
+
+class FakeWorksheet:
+    def __init__(self, book: "FakeSpreadsheet", title: str):
+        self.book, self.title = book, title
+
+    def cell(self, row: int, col: int):
+        self.book.call("cell")
+        rows = self.book.values.get(self.title, [])
+        value = rows[row - 1][col - 1] if len(rows) >= row and len(rows[row - 1]) >= col else None
+        return SimpleNamespace(value=value)
+
+    def update(self, range_name: str, values: List[List]) -> None:
+        self.book.call("update")
+        self.book.values[self.title] = [[]] + [list(v) for v in values]
+
+    def append_row(self, row: List) -> None:
+        self.book.call("append_row")
+        self.book.values.setdefault(self.title, []).append(list(row))
+
+
+class FakeSpreadsheet:
+    """The slice of gspread.Spreadsheet that sheets_io and briefing use."""
+
+    def __init__(self, counters: Counters, latency_s: float = 0.0):
+        self.id = "bench"
+        self.counters = counters
+        self.latency_s = latency_s
+        self.values: Dict[str, List[List]] = {}
+        self.grid: Dict[str, dict] = {}
+
+    def call(self, name: str) -> None:
+        self.counters.add("sheets_calls")
+        self.counters.add(f"sheets_{name}")
+        time.sleep(self.latency_s)
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        return FakeWorksheet(self, title)
+
+    def fetch_sheet_metadata(self, params=None) -> dict:
+        self.call("metadata")
+        return {"sheets": [{"properties": {"title": t, "sheetId": i, "gridProperties": g}}
+                           for i, (t, g) in enumerate(self.grid.items())]}
+
+    def batch_update(self, body: dict) -> None:
+        self.call("batch_update")
+        for req in body["requests"]:
+            props = (req.get("addSheet") or req.get("updateSheetProperties"))["properties"]
+            title = props.get("title") or list(self.grid)[props["sheetId"]]
+            self.grid[title] = props["gridProperties"]
+
+    def values_batch_update(self, body: dict) -> None:
+        self.call("values_batch_update")
+        for item in body["data"]:
+            title = item["range"].rsplit("!", 1)[0].strip("'").replace("''", "'")
+            self.values[title] = item["values"]
+            self.counters.add("sheets_cells", sum(len(r) for r in item["values"]))
+
+    def values_batch_get(self, ranges: List[str], params=None) -> dict:
+        self.call("values_batch_get")
+        return {"valueRanges": [{"values": self.values.get(r.strip("'").replace("''", "'"), [])}
+                                for r in ranges]}
+
+
+def fake_openai(reply: str, counters: Counters, latency_s: float, piece_chars: int = 24):
+    def create(model, messages, stream=False, **kwargs):
+        counters.add("llm_calls")
+        time.sleep(latency_s)
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        chunks = [SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=reply[i:i + piece_chars]))],
+                                  usage=None)
+                  for i in range(0, len(reply), piece_chars)]
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=len(reply) // 4)
+        return iter(chunks + [SimpleNamespace(choices=[], usage=usage)])
+
+    return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+def install_fakes(fx: Fixtures, counters: Counters, args) -> FakeSpreadsheet:
+    import briefing
+    import data_retrieval_storage_news_engine as engine
+    import step2_summarisation_with_easier_reading as step2
+
+    sheet = FakeSpreadsheet(counters, args.sheets_ms / 1000)
+    client = fake_openai(fx.reply, counters, args.llm_ms / 1000)
+    engine.GoogleSearch = fake_google_search(fx, counters, args.serpapi_ms / 1000)
+    engine.get_api_key = lambda: "bench"
+    engine._build_meta_client = meta_client_factory(fx, counters, args.http_ms / 1000)
+    engine.CAP_NEWS = engine.CAP_TOP_STORIES = len(fx.urls)
+    for module in (engine, step2, briefing):
+        module.get_spreadsheet = lambda _id=None: sheet
+    step2.configure_openai = lambda: client
+    return sheet
+
+
+# ---------------------------------------------------------------------
+# Cases
+# ---------------------------------------------------------------------
+def _fresh_workdir(root: Path) -> Path:
+    """Empty cwd so the meta cache and state store start from nothing."""
+    import state_store
+
+    path = Path(tempfile.mkdtemp(dir=root))
+    os.chdir(path)
+    state_store._shared = None
+    return path
+
+
+def case_meta_cold(fx, run_async, root):
+    from data_retrieval_storage_news_engine import fetch_meta_descriptions
+
+    def run():
+        run_async(fetch_meta_descriptions(fx.urls, use_cache=False))
+    return None, run
+
+
+def case_meta_warm(fx, run_async, root):
+    from data_retrieval_storage_news_engine import fetch_meta_descriptions
+
+    def setup():
+        _fresh_workdir(root)
+        run_async(fetch_meta_descriptions(fx.urls))
+
+    def run():
+        run_async(fetch_meta_descriptions(fx.urls))
+    return setup, run
+
+
+def case_sheets_store(fx, run_async, root, sheet):
+    from data_retrieval_storage_news_engine import fetch_meta_descriptions, store_data_in_google_sheets
+    related = fx.trends["related_queries"]
+
+    def setup():
+        _fresh_workdir(root)
+        run_async(fetch_meta_descriptions(fx.urls))
+
+    def run():
+        store_data_in_google_sheets(sheet, fx.news, fx.top, related["rising"], related["top"])
+    return setup, run
+
+
+def case_prompt(fx, run_async, root):
+    from data_retrieval_storage_news_engine import build_tabs
+    from step2_summarisation_with_easier_reading import format_data_for_prompt, read_data
+    related = fx.trends["related_queries"]
+    _fresh_workdir(root)
+    tabs = build_tabs(fx.news, fx.top, related["rising"], related["top"])
+
+    def run():
+        format_data_for_prompt(*read_data(None, tabs))
+    return None, run
+
+
+def case_parse_briefs(fx, run_async, root):
+    from briefing_format import parse_briefing, render_brief, render_overview
+    truncated = fx.reply[: int(len(fx.reply) * 0.8)]
+
+    def run():
+        # What the Intelligence page's parse_briefs does, for a whole and a cut-off reply
+        for text in (fx.reply, truncated):
+            parsed = parse_briefing(text)
+            render_overview(parsed)
+            [render_brief(b) for b in parsed["briefs"]]
+    return None, run
+
+
+def case_end_to_end(fx, run_async, root):
+    import briefing
+
+    def setup():
+        _fresh_workdir(root)
+
+    def run():
+        briefing.refresh(force=True).result()
+        # The Sheets export runs off the hot path; wait for it outside the timing
+        return lambda: briefing._export_executor.submit(lambda: None).result()
+    return setup, run
+
+
+SCALED_CASES = ("meta_cold", "meta_warm", "sheets_store", "prompt", "end_to_end")
+FIXED_CASES = ("parse_briefs",)
+
+
+def measure(setup: Optional[Callable], run: Callable, runs: int, counters: Counters,
+            verbose: bool = False) -> dict:
+    times, counts = [], {}
+    for _ in range(runs):
+        # The pipeline's own progress prints would drown the report
+        with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+            if setup:
+                setup()
+            counters.values.clear()
+            start = time.perf_counter()
+            finish = run()
+            times.append(time.perf_counter() - start)
+            if finish:
+                finish()
+        counts = dict(counters.values)
+    return {"median_s": statistics.median(times), "min_s": min(times), "counts": counts}
+
+
+def run_benchmarks(args) -> Dict[str, dict]:
+    import step2_summarisation_with_easier_reading as step2
+    from utils import run_async
+
+    # store_summary_in_google_sheets sleeps 1s for the real quota; not here
+    step2.time = SimpleNamespace(sleep=lambda s: None)
+    step2.count_tokens("warm up")  # load the tokenizer outside any timed case
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        root = Path(tmp)
+        _fresh_workdir(root)
+        todo = [(name, s) for s in args.scales for name in SCALED_CASES if name in args.cases]
+        todo += [(name, 0) for name in FIXED_CASES if name in args.cases]
+        for name, scale in todo:
+            fx = Fixtures(scale or DEFAULT_SCALES[0])
+            counters = Counters()
+            sheet = install_fakes(fx, counters, args)
+            factory = globals()[f"case_{name}"]
+            setup, run = (factory(fx, run_async, root, sheet) if name == "sheets_store"
+                          else factory(fx, run_async, root))
+            key = f"{name}@{scale}" if scale else name
+            results[key] = measure(setup, run, args.runs, counters, args.verbose)
+            _print_row(key, results[key])
+        os.chdir(REPO_ROOT)
+    return results
+
+
+# ---------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------
+def _print_row(key: str, r: dict, base: Optional[dict] = None, tolerance: float = 0.0) -> None:
+    counts = " ".join(f"{k}={v}" for k, v in sorted(r["counts"].items())
+                      if not k.startswith("sheets_") or k in ("sheets_calls", "sheets_cells"))
+    line = f"{key:<22} median {r['median_s'] * 1000:9.1f} ms   min {r['min_s'] * 1000:9.1f} ms"
+    if base:
+        change = r["median_s"] / base["median_s"] - 1 if base["median_s"] else 0.0
+        flag = "  REGRESSION" if change > tolerance else ""
+        line += f"   {change:+7.1%} vs baseline{flag}"
+    print(f"{line}   {counts}")
+
+
+def compare(results: Dict[str, dict], baseline: dict, tolerance: float) -> List[str]:
+    """Prints every case against the baseline; returns the keys that regressed."""
+    base = baseline["results"]
+    print(f"\nvs baseline from {baseline['meta']['created']} ({baseline['meta']['python']}, "
+          f"tolerance {tolerance:.0%}):")
+    regressed = []
+    for key, r in results.items():
+        if key not in base:
+            print(f"{key:<22} (not in baseline)")
+            continue
+        _print_row(key, r, base[key], tolerance)
+        if base[key]["median_s"] and r["median_s"] / base[key]["median_s"] - 1 > tolerance:
+            regressed.append(key)
+    return regressed
+
+
+def record_fixtures() -> None:
+    """Replaces the SerpAPI fixtures with live responses (needs .streamlit/secrets.toml)."""
+    import data_retrieval_storage_news_engine as engine
+
+    sources = engine.fetch_all_sources()
+    rising, top = sources["trends"]
+    (FIXTURES / "serpapi_google_news.json").write_text(json.dumps({"news_results": sources["news"]}, indent=2))
+    (FIXTURES / "serpapi_top_stories.json").write_text(json.dumps({"top_stories": sources["top_stories"]}, indent=2))
+    (FIXTURES / "serpapi_trends.json").write_text(
+        json.dumps({"related_queries": {"rising": rising, "top": top}}, indent=2))
+    print(f"recorded {len(sources['news'])} news, {len(sources['top_stories'])} top stories, "
+          f"{len(rising)}/{len(top)} trends into {FIXTURES}")
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--scales", default=",".join(map(str, DEFAULT_SCALES)),
+                    help="comma-separated article counts")
+    ap.add_argument("--cases", default=",".join(SCALED_CASES + FIXED_CASES))
+    ap.add_argument("--runs", type=int, default=3)
+    ap.add_argument("--serpapi-ms", type=float, default=0, help="simulated latency per SerpAPI call")
+    ap.add_argument("--http-ms", type=float, default=2, help="simulated latency per article fetch")
+    ap.add_argument("--sheets-ms", type=float, default=0, help="simulated latency per Sheets API call")
+    ap.add_argument("--llm-ms", type=float, default=0, help="simulated latency per completion")
+    ap.add_argument("--save", type=Path, help="write results as a baseline JSON")
+    ap.add_argument("--compare", type=Path, help="baseline JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.20, help="allowed slowdown before flagging")
+    ap.add_argument("--record", action="store_true", help="refresh the SerpAPI fixtures from live calls")
+    ap.add_argument("--verbose", action="store_true", help="show the pipeline's own output")
+    args = ap.parse_args()
+    args.scales = [int(s) for s in args.scales.split(",") if s]
+    args.cases = set(args.cases.split(","))
+
+    if args.record:
+        record_fixtures()
+        return
+
+    results = run_benchmarks(args)
+    if args.save:
+        args.save.write_text(json.dumps({
+            "meta": {"created": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                     "machine": platform.machine(), "args": {k: v for k, v in vars(args).items()
+                                                              if k.endswith("_ms") or k == "runs"}},
+            "results": results,
+        }, indent=2))
+        print(f"\nbaseline saved to {args.save}")
+    if args.compare:
+        regressed = compare(results, json.loads(args.compare.read_text()), args.tolerance)
+        if regressed:
+            print(f"\n{len(regressed)} regression(s): {', '.join(regressed)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
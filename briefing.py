@@ -0,0 +1,328 @@
+"""
+briefing.py
+-----------
+Precomputed market briefing: the scrape → summarise pipeline that used to
+run inside the Intelligence page's button click.
+
+Run state lives in the local SQLite state_store. The cooldown is an
+atomic compare-and-set there, so across sessions and processes (the page
+and briefing_worker.py) exactly one caller runs the pipeline; within a
+process, later callers join the in-flight run's Future, and callers in
+other processes wait for the running row to finish and read its result.
+Google Sheets (source tabs, Summaries, Metadata) is written afterwards on
+an export thread and is never read on the hot path.
+
+Runs are incremental: articles already seen by an earlier run are left
+out of the prompt, which instead carries a short digest of the previous
+briefing. A full run happens at least every FULL_RUN_EVERY_HOURS.
+Syndicated copies of a story are merged into one prompt row with a
+coverage count (see near_dupes).
+
+Every enabled market in sources.json has its own briefing, cooldown and
+article history. One refresh scrapes all due markets together and then
+summarises them in parallel, so more markets don't mean proportionally
+longer refreshes.
+"""
+
+import datetime as dt
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from briefing_format import carry_over_digest, parse_briefing
+from source_registry import Market, load_registry
+from state_store import DEFAULT_MARKET, get_store
+from telemetry import span
+from utils import get_spreadsheet
+
+# ---------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------
+COOLDOWN_HOURS       = 3
+WAIT_POLL_S          = 5
+INCREMENTAL          = True   # send only new/changed articles plus a digest of the last briefing
+FULL_RUN_EVERY_HOURS = 24     # …but re-read everything at least this often
+ARTICLE_TABS         = ("Google News", "Top Stories")
+TIME_FORMAT          = "%Y-%m-%d %H:%M:%S"
+SUMMARY_CONCURRENCY  = 4      # markets summarised at once in a multi-market refresh
+
+
+@dataclass
+class Briefing:
+    summary: str
+    generated_at: Optional[dt.datetime]
+    market: str = DEFAULT_MARKET
+
+    def age_hours(self) -> float:
+        if self.generated_at is None:
+            return float("inf")
+        return (dt.datetime.now(dt.timezone.utc) - self.generated_at).total_seconds() / 3600.0
+
+    def is_stale(self, cooldown_hours: float = COOLDOWN_HOURS) -> bool:
+        return self.age_hours() >= cooldown_hours
+
+
+# ---------------------------------------------------------------------
+# Metadata tab
+# ---------------------------------------------------------------------
+def get_last_run_info(sheet_obj):
+    with span("sheets_read", tab="Metadata"):
+        metadata_ws = sheet_obj.worksheet("Metadata")
+        last_run_time_str = metadata_ws.cell(2, 1).value
+        last_summary_text = metadata_ws.cell(2, 2).value
+    if last_run_time_str:
+        naive_dt = dt.datetime.strptime(last_run_time_str, TIME_FORMAT)
+        last_run_utc = naive_dt.replace(tzinfo=dt.timezone.utc)
+    else:
+        last_run_utc = None
+    return last_run_utc, last_summary_text
+
+
+def set_last_run_info(sheet_obj, summary_text, when: Optional[dt.datetime] = None):
+    when = when or dt.datetime.now(dt.timezone.utc)
+    with span("sheets_write", tab="Metadata"):
+        metadata_ws = sheet_obj.worksheet("Metadata")
+        metadata_ws.update(range_name="A2:B2", values=[[when.strftime(TIME_FORMAT), summary_text]])
+
+
+# ---------------------------------------------------------------------
+# Sheets export
+# ---------------------------------------------------------------------
+_export_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="briefing-export")
+
+
+def _export(market: Market, run_id: int, tabs: dict, summary_text: str, when: dt.datetime,
+            new_summary: bool = True) -> None:
+    from sheets_io import write_tabs
+    from step2_summarisation_with_easier_reading import store_summary_in_google_sheets
+    from data_retrieval_storage_news_engine import DIFF_WRITES
+
+    if not market.spreadsheet_id:
+        return  # this market has no sheet; the state store is its only copy
+    try:
+        sheet = get_spreadsheet(market.spreadsheet_id)
+        write_tabs(sheet, tabs, diff=DIFF_WRITES)
+        if new_summary:  # a reused briefing is already on the Summaries tab
+            store_summary_in_google_sheets(sheet, summary_text)
+        set_last_run_info(sheet, summary_text, when)
+        get_store().mark_exported(run_id)
+    except Exception as e:
+        print(f"[briefing] Sheets export of run {run_id} ({market.id}) failed: {e}")
+        get_store().mark_exported(run_id, error=str(e))
+
+
+def export_async(market: Market, run_id: int, tabs: dict, summary_text: str,
+                 when: dt.datetime, new_summary: bool = True) -> Future:
+    return _export_executor.submit(_export, market, run_id, tabs, summary_text, when, new_summary)
+
+
+# ---------------------------------------------------------------------
+# Single-flight refresh
+# ---------------------------------------------------------------------
+_inflight: Optional[Future] = None
+_state_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="briefing")
+
+
+def markets() -> List[Market]:
+    """Markets with a briefing (the enabled ones in sources.json)."""
+    return load_registry().enabled()
+
+
+def _market(market_id: Optional[str]) -> Market:
+    registry = load_registry()
+    return registry.get(market_id) if market_id else registry.default
+
+
+def _seed_from_sheet(market: Market) -> None:
+    """One-off: carry the last briefing over from the Metadata tab into an empty store."""
+    if not market.spreadsheet_id:
+        return
+    try:
+        when, summary = get_last_run_info(get_spreadsheet(market.spreadsheet_id))
+    except Exception as e:
+        print(f"[briefing] could not read Metadata tab ({market.id}): {e}")
+        return
+    if when and summary:
+        get_store().import_run(when, summary, market.id)
+
+
+def latest(market_id: Optional[str] = None) -> Briefing:
+    """The most recent briefing of a market (the default one unless given), from the state store."""
+    market = _market(market_id)
+    store = get_store()
+    record = store.latest(market.id)
+    if record is None and not store.history(limit=1, market=market.id):
+        _seed_from_sheet(market)
+        record = store.latest(market.id)
+    if record is None:
+        return Briefing("", None, market.id)
+    return Briefing(record.summary, record.finished_at, market.id)
+
+
+def _article_items(tabs: dict):
+    for title in ARTICLE_TABS:
+        _, rows = tabs.get(title, ([], []))
+        for row in rows:
+            yield title, row[1], row[0]
+
+
+def _last_full_run_age_h(store, market_id: str) -> float:
+    for record in store.history(limit=50, market=market_id):
+        if record.status == "done" and record.token_stats.get("mode") == "full":
+            return (dt.datetime.now(dt.timezone.utc) - record.finished_at).total_seconds() / 3600.0
+    return float("inf")
+
+
+def _summarise_market(market: Market, run_id: int, scraped_tabs: dict) -> Briefing:
+    from step2_summarisation_with_easier_reading import (
+        format_data_for_prompt, read_data, summarize_data,
+    )
+
+    store = get_store()
+    previous = store.latest(market.id)  # this run is still 'running', so this is the last finished one
+    store.save_payloads(run_id, scraped_tabs)
+    articles = list(_article_items(scraped_tabs))
+    status = store.classify_articles(articles, market.id)
+    fresh = sum(1 for v in status.values() if v != "seen")
+
+    prev_parsed = parse_briefing(previous.summary) if previous else None
+    carry_over = carry_over_digest(prev_parsed) if prev_parsed else None
+    incremental = bool(INCREMENTAL and carry_over
+                       and _last_full_run_age_h(store, market.id) < FULL_RUN_EVERY_HOURS)
+
+    if incremental and fresh == 0:
+        # Nothing new since the last briefing: keep it rather than pay for the same answer
+        print(f"[briefing] {market.id}: no new or changed articles; reusing previous briefing")
+        summary_text = previous.summary
+        stats = {"mode": "reused", "new_articles": 0, "prompt_tokens": 0}
+    else:
+        # Incremental runs send only the stories with a new or changed
+        # article; coverage is still counted over everything scraped
+        fresh_links = {link for link, s in status.items() if s != "seen"} if incremental else None
+        prompt_data = format_data_for_prompt(*read_data(None, scraped_tabs), only_links=fresh_links)
+        print(f"[briefing] {market.id}: {prompt_data.report()}")
+        with span("briefing_summarize", run_id=run_id, market=market.id, incremental=incremental):
+            summary_text = summarize_data(prompt_data.text, carry_over=carry_over,
+                                          incremental=incremental, market=market)
+        stats = {
+            "mode": "incremental" if incremental else "full",
+            "new_articles": fresh,
+            "prompt_tokens": prompt_data.total_tokens,
+            "tokens": prompt_data.tokens,
+            "rows_kept": prompt_data.rows_kept,
+            "rows_dropped": prompt_data.rows_dropped,
+            "rows_merged": prompt_data.rows_merged,
+            "summary_chars": len(summary_text),
+            "structured": parse_briefing(summary_text) is not None,
+        }
+    store.finish_run(run_id, summary_text, stats, articles=articles, market=market.id)
+
+    now = dt.datetime.now(dt.timezone.utc)
+    export_async(market, run_id, scraped_tabs, summary_text, now,
+                 new_summary=stats["mode"] != "reused")
+    return Briefing(summary_text, now, market.id)
+
+
+def _run_pipeline(runs: Dict[str, int]) -> Dict[str, Briefing]:
+    """
+    One scrape for every claimed market (a single SerpAPI fan-out and meta
+    pass), then the markets are summarised concurrently. A market whose
+    summary fails is marked failed without holding up the others.
+    """
+    # Imported here so reading the briefing doesn't pull in the scraper
+    from data_retrieval_storage_news_engine import scrape_markets
+
+    registry = load_registry()
+    claimed = [registry.get(m) for m in runs]
+    with span("briefing_scrape", markets=len(claimed)):
+        scraped = scrape_markets(claimed)
+
+    results: Dict[str, Briefing] = {}
+    workers = max(1, min(SUMMARY_CONCURRENCY, len(claimed)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="briefing-market") as pool:
+        futures = {pool.submit(_summarise_market, m, runs[m.id], scraped[m.id]): m for m in claimed}
+        for future, market in futures.items():
+            try:
+                results[market.id] = future.result()
+            except Exception as e:
+                print(f"[briefing] {market.id}: refresh {runs[market.id]} failed: {e}")
+                get_store().fail_run(runs[market.id], str(e) or type(e).__name__)
+    return results
+
+
+def _refresh_once(cooldown_hours: float, force: bool) -> Dict[str, Briefing]:
+    store = get_store()
+    enabled = markets()
+    runs = {}
+    for market in enabled:
+        run_id = store.try_begin_run(0 if force else cooldown_hours * 3600, market.id)
+        if run_id is not None:
+            runs[market.id] = run_id
+    if not runs:
+        if any(store.is_running(m.id) for m in enabled):
+            # Another process holds the run: wait for it, then read what it wrote
+            print("[briefing] refresh running elsewhere; waiting")
+            while any(store.is_running(m.id) for m in enabled):
+                time.sleep(WAIT_POLL_S)
+        return {m.id: latest(m.id) for m in enabled}
+
+    started = time.perf_counter()
+    label = ", ".join(f"{m} #{r}" for m, r in runs.items())
+    print(f"[briefing] refresh started ({label})")
+    try:
+        results = _run_pipeline(runs)
+    except BaseException as e:
+        for run_id in runs.values():
+            store.fail_run(run_id, str(e) or type(e).__name__)
+        raise
+    print(f"[briefing] refresh finished in {time.perf_counter() - started:.1f}s ({label})")
+    # Markets that weren't due, or whose summary failed, keep their last briefing
+    return {m.id: results.get(m.id) or latest(m.id) for m in enabled}
+
+
+def refresh(cooldown_hours: float = COOLDOWN_HOURS, force: bool = False) -> Future:
+    """
+    Starts a refresh of every stale market (every market if `force`), or
+    joins the one already running. Returns a Future resolving to
+    {market id: Briefing} for all enabled markets.
+    """
+    global _inflight
+    with _state_lock:
+        if _inflight is not None and not _inflight.done():
+            return _inflight
+        _inflight = _executor.submit(_refresh_once, cooldown_hours, force)
+        return _inflight
+
+
+def is_refreshing(market_id: Optional[str] = None) -> bool:
+    return get_store().is_running(market_id)
+
+
+# ---------------------------------------------------------------------
+# In-app background refresher
+# ---------------------------------------------------------------------
+_refresher: Optional[threading.Thread] = None
+
+
+def start_background_refresher(interval_hours: float = COOLDOWN_HOURS,
+                               check_every_s: float = 300) -> None:
+    """Starts (once per process) a daemon thread that keeps every market's briefing fresh."""
+    global _refresher
+    with _state_lock:
+        if _refresher is not None and _refresher.is_alive():
+            return
+
+        def loop():
+            while True:
+                try:
+                    if any(latest(m.id).is_stale(interval_hours) for m in markets()):
+                        refresh(interval_hours).result()
+                except Exception as e:
+                    print(f"[briefing] background refresh failed: {e}")
+                time.sleep(check_every_s)
+
+        _refresher = threading.Thread(target=loop, name="briefing-refresher", daemon=True)
+        _refresher.start()
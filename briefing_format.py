@@ -0,0 +1,269 @@
+"""
+briefing_format.py
+------------------
+Structured briefing output: the JSON schema the summariser requests, a
+validating parser with a local repair pass, and markdown rendering.
+
+Parsing never calls the model again. Malformed JSON (code fences, trailing
+commas, a reply cut off mid-object) is repaired locally. A field of the
+wrong shape is coerced or dropped. Summaries from before the JSON format
+fall back to the old separator-based split.
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional
+
+LEGACY_SEPARATOR = "-" * 50
+
+_STR_LIST = {"type": "array", "items": {"type": "string"}}
+
+BRIEF_FIELDS = ("title", "synopsis", "themes", "entities", "sources", "angles", "is_new")
+
+BRIEFING_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "market_briefing",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "date": {"type": "string"},
+                "trends": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {"query": {"type": "string"}, "volume": {"type": "string"}},
+                        "required": ["query", "volume"],
+                        "additionalProperties": False,
+                    },
+                },
+                "key_themes": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "theme": {"type": "string"},
+                            "description": {"type": "string"},
+                            "volume": {"type": "string"},
+                        },
+                        "required": ["theme", "description", "volume"],
+                        "additionalProperties": False,
+                    },
+                },
+                "notable_entities": _STR_LIST,
+                "briefs": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "title": {"type": "string"},
+                            "synopsis": {"type": "string"},
+                            "themes": _STR_LIST,
+                            "entities": _STR_LIST,
+                            "sources": _STR_LIST,
+                            "angles": _STR_LIST,
+                            "is_new": {"type": "boolean"},
+                        },
+                        "required": list(BRIEF_FIELDS),
+                        "additionalProperties": False,
+                    },
+                },
+            },
+            "required": ["date", "trends", "key_themes", "notable_entities", "briefs"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+
+# ---------------------------------------------------------------------
+# Repair
+# ---------------------------------------------------------------------
+_FENCE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$", re.IGNORECASE)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+
+
+def _close_truncated(blob: str) -> str:
+    """Closes an unterminated string and any open brackets, e.g. after a max_tokens cut-off."""
+    stack, in_str, escaped, str_start = [], False, False, 0
+    for i, ch in enumerate(blob):
+        if in_str:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str, str_start = True, i
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_str:
+        blob += '"'
+    blob = blob.rstrip()
+    if blob.endswith(":"):
+        blob += " null"
+    elif blob.endswith('"') and stack and stack[-1] == "}":
+        # A bare trailing string inside an object is a key with no value: drop it
+        before = blob[:str_start].rstrip()
+        if before.endswith((",", "{")):
+            blob = before
+    blob = re.sub(r",\s*$", "", blob)
+    return blob + "".join(reversed(stack))
+
+
+def repair_json(text: str) -> Optional[Any]:
+    if not text:
+        return None
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    blob = _FENCE.sub("", text.strip())
+    start = blob.find("{")
+    if start == -1:
+        return None
+    blob = blob[start:]
+    trimmed = blob[: blob.rfind("}") + 1]
+    # Complete object with chatter around it, then a cut-off reply closed as-is
+    for attempt in (trimmed, _close_truncated(blob), _close_truncated(trimmed)):
+        try:
+            return json.loads(_TRAILING_COMMA.sub(r"\1", attempt))
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+# ---------------------------------------------------------------------
+# Validation
+# ---------------------------------------------------------------------
+def _str(value: Any) -> str:
+    if value is None:
+        return ""
+    return value.strip() if isinstance(value, str) else str(value)
+
+
+def _str_list(value: Any) -> List[str]:
+    if isinstance(value, str):
+        # "A, B; C" → ["A", "B", "C"]
+        return [v.strip() for v in re.split(r"[;,\n]", value) if v.strip()]
+    if isinstance(value, list):
+        return [_str(v) for v in value if _str(v)]
+    return []
+
+
+def _objects(value: Any, fields: tuple) -> List[Dict[str, str]]:
+    out = []
+    for item in value if isinstance(value, list) else []:
+        if isinstance(item, dict):
+            out.append({f: _str(item.get(f)) for f in fields})
+    return [o for o in out if o[fields[0]]]
+
+
+def validate_briefing(data: Any) -> Optional[dict]:
+    """Coerces parsed JSON into the briefing shape; None if there are no usable briefs."""
+    if not isinstance(data, dict):
+        return None
+    briefs = []
+    for item in data.get("briefs") or []:
+        if not isinstance(item, dict):
+            continue
+        brief = {
+            "title": _str(item.get("title")),
+            "synopsis": _str(item.get("synopsis")),
+            **{f: _str_list(item.get(f)) for f in ("themes", "entities", "sources", "angles")},
+            # Only incremental runs mark briefs; None means "not known"
+            "is_new": item["is_new"] if isinstance(item.get("is_new"), bool) else None,
+        }
+        if brief["title"] and brief["synopsis"]:
+            briefs.append(brief)
+    if not briefs:
+        return None
+    return {
+        "date": _str(data.get("date")),
+        "trends": _objects(data.get("trends"), ("query", "volume")),
+        "key_themes": _objects(data.get("key_themes"), ("theme", "description", "volume")),
+        "notable_entities": _str_list(data.get("notable_entities")),
+        "briefs": briefs,
+    }
+
+
+def parse_briefing(text: str) -> Optional[dict]:
+    return validate_briefing(repair_json(text))
+
+
+def legacy_briefs(summary_text: str) -> List[str]:
+    """Pre-JSON summaries: sections between 50-hyphen separators that look like briefs."""
+    briefs = []
+    for section in (summary_text or "").split(LEGACY_SEPARATOR):
+        clean_sec = section.strip()
+        if len(clean_sec) > 100 and ("1. *Synopsis*" in clean_sec or "*Brief Title*" in clean_sec):
+            briefs.append(clean_sec)
+    return briefs
+
+
+# ---------------------------------------------------------------------
+# Rendering
+# ---------------------------------------------------------------------
+def carry_over_digest(briefing: dict, max_chars: int = 1500) -> str:
+    """Compact recap of a previous briefing for an incremental run's prompt."""
+    lines = [f"PREVIOUS BRIEFING ({briefing['date'] or 'last run'})"]
+    if briefing["key_themes"]:
+        lines.append("Themes: " + "; ".join(t["theme"] for t in briefing["key_themes"]))
+    for b in briefing["briefs"]:
+        first_sentence = re.split(r"(?<=[.!?])\s", b["synopsis"], maxsplit=1)[0]
+        lines.append(f"- {b['title']}: {first_sentence}")
+    digest = "\n".join(lines)
+    return digest if len(digest) <= max_chars else digest[: max_chars - 1].rstrip() + "…"
+
+
+def _join(items: List[str]) -> str:
+    return ", ".join(items) if items else "—"
+
+
+def render_brief(brief: dict) -> str:
+    lines = [
+        f"**{brief['title']}**",
+        "",
+        f"1. **Synopsis**: {brief['synopsis']}",
+        f"2. **Key Themes**: {_join(brief['themes'])}",
+        f"3. **Entities**: {_join(brief['entities'])}",
+        f"4. **Source Insights**: {_join(brief['sources'])}",
+        "5. **Suggested Angles**:",
+    ]
+    lines += [f"    - {a}" for a in brief["angles"]] or ["    - —"]
+    return "\n".join(lines)
+
+
+def render_overview(briefing: dict) -> str:
+    lines = [f"**📊 Summary of Findings [{briefing['date']}]**" if briefing["date"]
+             else "**📊 Summary of Findings**", ""]
+    if briefing["trends"]:
+        lines += ["**📈 Google Trends Insights**", ""]
+        lines += [f"{i}. {t['query']} ({t['volume']})" if t["volume"] else f"{i}. {t['query']}"
+                  for i, t in enumerate(briefing["trends"], 1)]
+        lines.append("")
+    if briefing["key_themes"]:
+        lines += ["**🔁 Key Trends & Recurring Themes**", ""]
+        lines += [f"- **{t['theme']}**: {t['description']}" + (f" ({t['volume']})" if t["volume"] else "")
+                  for t in briefing["key_themes"]]
+        lines.append("")
+    if briefing["notable_entities"]:
+        lines += ["**🏢 Notable Entities**", "", _join(briefing["notable_entities"])]
+    return "\n".join(lines).strip()
+
+
+def render_markdown(briefing: dict) -> str:
+    parts = [render_overview(briefing), "---", "**📰 Detailed Briefs for Journalists**"]
+    for brief in briefing["briefs"]:
+        parts += ["---", render_brief(brief)]
+    return "\n\n".join(parts)
+
+
+def summary_markdown(summary_text: str) -> str:
+    """Readable markdown for any stored summary, JSON or legacy plain text."""
+    parsed = parse_briefing(summary_text)
+    return render_markdown(parsed) if parsed else (summary_text or "")
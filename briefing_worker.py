@@ -0,0 +1,47 @@
+"""
+briefing_worker.py
+------------------
+Refreshes the market briefing on a schedule, outside the Streamlit app.
+
+Run from the repo root (so .streamlit/secrets.toml is picked up), e.g. from
+cron with --once or as a long-running process:
+
+    python briefing_worker.py --once
+    python briefing_worker.py --interval-hours 3
+
+Every enabled market in sources.json is refreshed. It claims runs through
+the same local state store as the app's background refresher, so the two
+never scrape the same market at the same time.
+"""
+
+import argparse
+import time
+
+import briefing
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Keep the precomputed market briefing fresh.")
+    ap.add_argument("--once", action="store_true", help="refresh if stale, then exit")
+    ap.add_argument("--force", action="store_true", help="refresh even if the briefing is fresh")
+    ap.add_argument("--interval-hours", type=float, default=briefing.COOLDOWN_HOURS)
+    ap.add_argument("--check-every", type=float, default=300, help="seconds between staleness checks")
+    args = ap.parse_args()
+
+    force = args.force
+    while True:
+        try:
+            results = briefing.refresh(args.interval_hours, force=force).result()
+            for market_id, result in results.items():
+                print(f"[worker] {market_id}: briefing from {result.generated_at} "
+                      f"({result.age_hours():.2f}h old, {len(result.summary)} chars)")
+        except Exception as e:
+            print(f"[worker] refresh failed: {e}")
+        if args.once:
+            return
+        force = False
+        time.sleep(args.check_every)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,16 +6,25 @@ Refactored for Portal Integration
 
 import asyncio
 import datetime as dt
+import re
+import threading
 import time
-from typing import List
-import gspread
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait as wait_futures
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
 import httpx
-from bs4 import BeautifulSoup
 import streamlit as st
-from google.oauth2.service_account import Credentials
 # NOTE: We use the google-search-results library, but the import is 'serpapi'
 from serpapi import GoogleSearch 
-from utils import get_gspread_client 
+from llm_gateway import TokenBucket
+from meta_cache import (
+    FETCH_ERROR, INVALID_URL, NO_DESCRIPTION, CachedMeta, MetaCache, is_placeholder, normalize_url,
+)
+from sheets_io import write_tabs
+from source_registry import Market, Query, default_market, load_registry
+from telemetry import span
+from utils import get_spreadsheet, run_async
 
 # ---------------------------------------------------------------------
 # CONFIG
@@ -24,6 +33,28 @@ CAP_NEWS         = 40
 CAP_TOP_STORIES  = 40   
 CAP_TRENDS       = 20   
 DEBUG_COUNTS     = False  
+# Only send rows that changed since this process last wrote each tab.
+# Leave off if anything else (another worker, a human) edits these tabs.
+DIFF_WRITES      = False
+
+# Per-query budgets (seconds) for the concurrent fetch stage, counted from
+# when the query is sent. Trends gets more headroom because it retries on
+# rate limits.
+SOURCE_TIMEOUTS = {
+    "news":        30,
+    "top_stories": 30,
+    "trends":      90,
+}
+SERPAPI_HTTP_TIMEOUT = 30
+
+# Meta scraping: one pooled HTTP/2 client shared by every article URL.
+META_CONCURRENCY = 20   # total in-flight requests
+META_PER_HOST    = 4    # in-flight requests per publisher host
+META_TIMEOUT     = 10
+META_MAX_BYTES   = 128 * 1024  # stop reading an article after this much
+
+# Tags tried in order when the page has no plain meta description.
+META_KEYS = ("description", "og:description", "twitter:description", "og:title")
 
 BROWSER_HEADERS = {
     "User-Agent": (
@@ -34,58 +65,47 @@ BROWSER_HEADERS = {
     "Accept-Language": "en-US,en;q=0.9",
 }
 
+# Default market's sheet; each market's own is its spreadsheet_id in sources.json
 SPREADSHEET_ID = "1BzTJgX7OgaA0QNfzKs5AgAx2rvZZjDdorgAz0SD9NZg"
 
 # ---------------------------------------------------------------------
 # 1. SerpAPI Fetch Helpers (Lazy Loaded)
 # ---------------------------------------------------------------------
+# Queries come from the market registry (sources.json). Every query of
+# every market in a refresh shares one budget: a requests/minute bucket
+# and a cap on requests in flight.
+_budget: Optional[TokenBucket] = None
+_budget_lock = threading.Lock()
+
 def get_api_key():
     """Safely get the API key only when needed."""
     return st.secrets["serpapi"]["api_key"]
 
-def fetch_google_news() -> List[dict]:
-    params = {
-        "api_key": get_api_key(),
-        "engine": "google",
-        "no_cache": "true",
-        "q": "asx 200",
-        "google_domain": "google.com.au",
-        "tbs": "qdr:d",
-        "gl": "au",
-        "hl": "en",
-        "location": "Australia",
-        "tbm": "nws",
-        "num": "40",
-    }
-    return GoogleSearch(params).get_dict().get("news_results", [])
-
-def fetch_google_top_stories() -> List[dict]:
-    params = {
-        "api_key": get_api_key(),
-        "q": "asx+200",
-        "hl": "en",
-        "gl": "au",
-    }
-    return GoogleSearch(params).get_dict().get("top_stories", [])
-
-def fetch_google_trends():
-    params = {
-        "api_key": get_api_key(),
-        "engine": "google_trends",
-        "q": "/m/0bl5c2",
-        "geo": "AU",
-        "data_type": "RELATED_QUERIES",
-        "tz": "-600",
-        "date": "now 4-H",
-    }
+def _serpapi_budget(per_minute: float) -> TokenBucket:
+    global _budget
+    with _budget_lock:
+        if _budget is None or _budget.capacity != per_minute:
+            _budget = TokenBucket(per_minute)
+        return _budget
 
+def _serpapi_search(params: dict) -> dict:
+    with span("serpapi", engine=params.get("engine", "google"), q=params.get("q")) as sp:
+        search = GoogleSearch(params)
+        search.timeout = SERPAPI_HTTP_TIMEOUT
+        result = search.get_dict()
+        if "error" in result:
+            sp.ok = False
+            sp.set(api_error=result["error"])
+        return result
+
+def _fetch_trends(params: dict):
     attempts = 0
     # Use the lazy import here to avoid top-level dependency issues if installed late
     from pytrends.exceptions import TooManyRequestsError
     
     while attempts < 5:
         try:
-            results = GoogleSearch(params).get_dict()
+            results = _serpapi_search(params)
             rising = results.get("related_queries", {}).get("rising", [])
             top    = results.get("related_queries", {}).get("top",    [])
             return rising, top
@@ -101,22 +121,145 @@ def fetch_google_trends():
             
     return [], [] # Return empty if failed
 
+def run_query(query: Query, api_key: str):
+    """One registry query: a list of articles, or (rising, top) for trends."""
+    params = {"api_key": api_key, **query.params}
+    if query.kind == "trends":
+        return _fetch_trends(params)
+    key = "news_results" if query.kind == "news" else "top_stories"
+    return _serpapi_search(params).get(key, [])
+
+def fetch_google_news(api_key: Optional[str] = None, market: Optional[Market] = None) -> List[dict]:
+    market = market or default_market()
+    return merge_articles([run_query(q, api_key or get_api_key())
+                           for q in market.queries() if q.kind == "news"])
+
+def fetch_google_top_stories(api_key: Optional[str] = None, market: Optional[Market] = None) -> List[dict]:
+    market = market or default_market()
+    return merge_articles([run_query(q, api_key or get_api_key())
+                           for q in market.queries() if q.kind == "top_stories"])
+
+def fetch_google_trends(api_key: Optional[str] = None, market: Optional[Market] = None):
+    market = market or default_market()
+    return merge_trends([run_query(q, api_key or get_api_key())
+                         for q in market.queries() if q.kind == "trends"])
+
+def merge_articles(result_lists: List[List[dict]]) -> List[dict]:
+    """
+    Interleaves several queries' results by rank (1st of each, then 2nd
+    of each, ...) and drops repeats of the same canonical URL, so a
+    second query can't be crowded out by the first under the row caps.
+    """
+    seen, out = set(), []
+    for rank in range(max((len(r) for r in result_lists), default=0)):
+        for results in result_lists:
+            if rank < len(results):
+                item = results[rank]
+                link = item.get("link") or ""
+                key = normalize_url(link) if link.startswith("http") else link or id(item)
+                if key not in seen:
+                    seen.add(key)
+                    out.append(item)
+    return out
+
+def merge_trends(results: List[tuple]) -> tuple:
+    """Merges (rising, top) pairs from several topics, one row per query string."""
+    merged = []
+    for i in (0, 1):
+        lists = [r[i] for r in results]
+        seen, out = set(), []
+        for rank in range(max((len(l) for l in lists), default=0)):
+            for l in lists:
+                if rank < len(l):
+                    key = str(l[rank].get("query", "")).strip().lower()
+                    if key not in seen:
+                        seen.add(key)
+                        out.append(l[rank])
+        merged.append(out)
+    return tuple(merged)
+
+def _empty_sources() -> dict:
+    return {"news": [], "top_stories": [], "trends": ([], [])}
+
+def fetch_markets(markets: Optional[List[Market]] = None,
+                  timeouts: Optional[dict] = None) -> Dict[str, dict]:
+    """
+    Sends every News, Top Stories and Trends query of every market at
+    once, within the shared SerpAPI budget, and returns
+    {market id: {"news": [...], "top_stories": [...], "trends": (rising, top)}}
+    with each kind merged and deduplicated across its queries.
+
+    A query's timeout (per kind) runs from when it is actually sent, so
+    queries queued behind the budget aren't timed out early. A query that
+    errors or runs out of time contributes nothing instead of failing
+    the whole run.
+    """
+    registry = load_registry()
+    markets = markets if markets is not None else registry.enabled()
+    timeouts = {**SOURCE_TIMEOUTS, **(timeouts or {})}
+    api_key = get_api_key()  # resolve secrets on the calling thread
+    budget = _serpapi_budget(registry.requests_per_minute)
+    queries = [q for m in markets for q in m.queries()]
+
+    sent_at: Dict[int, float] = {}
+
+    def send(i: int, query: Query):
+        wait = budget.reserve(1)
+        if wait:
+            time.sleep(wait)
+        sent_at[i] = time.monotonic()
+        return run_query(query, api_key)
+
+    start = time.monotonic()
+    pool = ThreadPoolExecutor(max_workers=max(1, min(registry.max_in_flight, len(queries))),
+                              thread_name_prefix="serpapi")
+    futures = {pool.submit(send, i, q): i for i, q in enumerate(queries)}
+    results: Dict[int, object] = {}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait_futures(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"{queries[i].label} fetch error: {e}")
+            now = time.monotonic()
+            for future in list(pending):
+                i = futures[future]
+                if i in sent_at and now - sent_at[i] > timeouts[queries[i].kind]:
+                    print(f"{queries[i].label} timed out after {timeouts[queries[i].kind]}s "
+                          f"– continuing without it")
+                    pending.discard(future)
+    finally:
+        # Don't block on stragglers; their results are discarded.
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    out = {m.id: _empty_sources() for m in markets}
+    for m in markets:
+        mine = [(q, results[i]) for i, q in enumerate(queries) if q.market == m.id and i in results]
+        out[m.id] = {
+            "news":        merge_articles([r for q, r in mine if q.kind == "news"]),
+            "top_stories": merge_articles([r for q, r in mine if q.kind == "top_stories"]),
+            "trends":      merge_trends([r for q, r in mine if q.kind == "trends"]),
+        }
+
+    if DEBUG_COUNTS:
+        print(f"{len(results)}/{len(queries)} queries for {len(markets)} market(s) "
+              f"in {time.monotonic() - start:.1f}s")
+    return out
+
+def fetch_all_sources(timeouts: Optional[dict] = None, market: Optional[Market] = None) -> dict:
+    """Single-market form of fetch_markets (the default market unless given)."""
+    market = market or default_market()
+    return fetch_markets([market], timeouts)[market.id]
 # ---------------------------------------------------------------------
 # 2. Worksheet Utilities
 # ---------------------------------------------------------------------
-def ensure_worksheet_exists(sheet_obj, title: str):
-    try:
-        return sheet_obj.worksheet(title)
-    except gspread.exceptions.WorksheetNotFound:
-        return sheet_obj.add_worksheet(title=title, rows="100", cols="20")
-
-def overwrite_worksheet(ws, header: List[str], rows: List[List]):
-    ws.resize(rows=len(rows) + 1, cols=len(header))
-    ws.update(
-        range_name="A1",
-        values=[header] + rows,
-        value_input_option="USER_ENTERED",
-    )
+# Tabs are written in one batch through sheets_io.write_tabs.
+ARTICLE_HEADER = ["Title", "Link", "Snippet", "Meta Description"]
+TRENDS_HEADER  = ["Query", "Value"]
 
 # ---------------------------------------------------------------------
 # 3. Data Hygiene Helpers
@@ -135,124 +278,248 @@ def dedupe_rows(rows: List[List], key_index: int, keep_n: int) -> List[List]:
 # ---------------------------------------------------------------------
 # 4. Async Meta Fetch
 # ---------------------------------------------------------------------
-async def _grab_desc(session: httpx.AsyncClient, url: str) -> str:
+_HEAD_END = re.compile(rb"</head\s*>|<body[\s>]", re.IGNORECASE)
+
+class _HeadMetaParser(HTMLParser):
+    """Collects <meta name/property=... content=...> pairs from a document head."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta = {}
+
+    def handle_starttag(self, tag, attrs):
+        if tag != "meta":
+            return
+        attrs = dict(attrs)
+        key = (attrs.get("name") or attrs.get("property") or "").strip().lower()
+        content = (attrs.get("content") or "").strip()
+        if key and content:
+            self.meta.setdefault(key, content)
+
+def extract_meta_description(head_html: str) -> str:
+    parser = _HeadMetaParser()
+    parser.feed(head_html)
+    for key in META_KEYS:
+        if key in parser.meta:
+            return parser.meta[key]
+    return NO_DESCRIPTION
+
+async def _read_head(response: httpx.Response, max_bytes: int = META_MAX_BYTES) -> bytes:
+    """Reads the body in chunks, stopping at the end of <head> or `max_bytes`."""
+    buf = bytearray()
+    async for chunk in response.aiter_bytes():
+        # Re-scan a few bytes of the previous chunk in case the tag was split
+        scan_from = max(0, len(buf) - 8)
+        buf.extend(chunk)
+        match = _HEAD_END.search(buf, scan_from)
+        if match:
+            return bytes(buf[:match.start()])
+        if len(buf) >= max_bytes:
+            return bytes(buf[:max_bytes])
+    return bytes(buf)
+
+async def _grab_desc(session: httpx.AsyncClient, url: str,
+                     cached: Optional[CachedMeta] = None) -> CachedMeta:
+    """
+    Fetches one article's meta description. When a stale cache entry is
+    passed in, the request is made conditional on its ETag/Last-Modified.
+    Results with status 0 (bad URL, network error) or a transient status
+    (429, 5xx) are never cached.
+    """
+    now = time.time()
     if not url or not url.startswith("http"):
-        return "Invalid URL"
+        return CachedMeta(INVALID_URL, 0, now)
+    with span("meta_fetch", host=urlsplit(url).netloc.lower(), conditional=cached is not None) as sp:
+        meta, status = await _fetch_desc(session, url, cached, now)
+        sp.set(status=status)
+        sp.ok = status in (200, 304)
+        return meta
+
+async def _fetch_desc(session: httpx.AsyncClient, url: str,
+                      cached: Optional[CachedMeta], now: float) -> Tuple[CachedMeta, int]:
+    """Returns the result plus the HTTP status actually seen (0 on a network error)."""
+    headers = {**BROWSER_HEADERS, **(cached.conditional_headers() if cached else {})}
     try:
-        r = await session.get(url, timeout=10, headers=BROWSER_HEADERS)
-        if r.status_code != 200:
-            return f"HTTP {r.status_code}"
-        soup = BeautifulSoup(r.content, "lxml")
-        tag  = soup.find("meta", attrs={"name": "description"})
-        return (
-            tag["content"].strip()
-            if tag and "content" in tag.attrs and tag["content"].strip()
-            else "No Meta Description"
-        )
+        async with session.stream("GET", url, headers=headers) as r:
+            etag = r.headers.get("etag")
+            last_modified = r.headers.get("last-modified")
+            if r.status_code == 304 and cached:
+                return CachedMeta(cached.description, cached.status, now,
+                                  etag or cached.etag,
+                                  last_modified or cached.last_modified), 304
+            if r.status_code != 200:
+                return (CachedMeta(f"HTTP {r.status_code}", r.status_code, now, etag, last_modified),
+                        r.status_code)
+            head = await _read_head(r)
+            encoding = r.charset_encoding or "utf-8"
+        desc = extract_meta_description(head.decode(encoding, errors="replace"))
+        return CachedMeta(desc, 200, now, etag, last_modified), 200
     except Exception:
-        return "Error Fetching Description"
+        return CachedMeta(FETCH_ERROR, 0, now), 0
+
+def _build_meta_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=True,
+        follow_redirects=True,
+        timeout=META_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=META_CONCURRENCY,
+            max_keepalive_connections=META_CONCURRENCY,
+        ),
+    )
+
+async def fetch_meta_descriptions(urls: List[str],
+                                  limit: int = META_CONCURRENCY,
+                                  per_host: int = META_PER_HOST,
+                                  use_cache: bool = True) -> List[str]:
+    """
+    Fetches meta descriptions for `urls` through one pooled client.
+    Fresh cache entries are served without a request, stale ones are
+    revalidated, and duplicate URLs are fetched once. The result is
+    aligned with `urls`.
+    """
+    # One request per canonical URL, however the link was decorated. The
+    # canonical form is only the key: the request goes to the first link
+    # given for it, since publishers may not serve the normalised URL.
+    canonical = {u: normalize_url(u) if u.startswith("http") else u for u in urls}
+    originals: Dict[str, str] = {}
+    for u in urls:
+        originals.setdefault(canonical[u], u)
+    unique = list(originals)
+    cache = MetaCache() if use_cache else None
+    try:
+        cached = cache.get_many(unique) if cache is not None else {}
+        results = {u: m for u, m in cached.items() if m.is_fresh(cache.ttl)}
+        to_fetch = [u for u in unique if u not in results]
+
+        if to_fetch:
+            sem = asyncio.Semaphore(limit)
+            host_sems = {}
+
+            async with _build_meta_client() as session:
+                async def bound(key):
+                    url = originals[key]
+                    host = urlsplit(url).netloc.lower()
+                    host_sem = host_sems.setdefault(host, asyncio.Semaphore(per_host))
+                    async with host_sem, sem:
+                        return await _grab_desc(session, url, cached.get(key))
+                fetched = dict(zip(to_fetch, await asyncio.gather(*(bound(u) for u in to_fetch))))
+
+            if cache is not None:
+                cache.put_many({u: m for u, m in fetched.items() if m.cacheable})
+            results.update(fetched)
 
-async def fetch_meta_descriptions(urls: List[str], limit: int = 10) -> List[str]:
-    sem = asyncio.Semaphore(limit)
-    async with httpx.AsyncClient(follow_redirects=True) as session:
-        async def bound(u):
-            async with sem:
-                return await _grab_desc(session, u)
-        return await asyncio.gather(*(bound(u) for u in urls))
+        if DEBUG_COUNTS:
+            print(f"Meta: {len(unique) - len(to_fetch)} cache hits, {len(to_fetch)} fetched")
+    finally:
+        if cache is not None:
+            cache.evict()
+            cache.close()
+
+    return [results[canonical[u]].description for u in urls]
 
 # ---------------------------------------------------------------------
 # 5. Storage Orchestrator
 # ---------------------------------------------------------------------
-def store_data_in_google_sheets(sheet, news_data, top_stories_data, rising_data, top_data):
-    # ---------- Google News ----------
-    news_rows = [
+def _article_rows(items: List[dict], keep_n: int) -> List[List]:
+    rows = [
         [a.get("title") or "No Title",
          a.get("link")  or "No Link",
          a.get("snippet") or "No Snippet"]
-        for a in news_data
+        for a in items
     ]
-    
-    news_rows = dedupe_rows(news_rows, key_index=1, keep_n=CAP_NEWS)
-    snippet_lookup_news = {r[1]: r[2] for r in news_rows}
+    return dedupe_rows(rows, key_index=1, keep_n=keep_n)
 
-    # Use a new loop just for metadata to ensure async loop is managed correctly
-    try:
-        news_meta = asyncio.run(fetch_meta_descriptions([r[1] for r in news_rows]))
-    except RuntimeError:
-        # If an event loop is already running (Streamlit sometimes does this), fallback
-        news_meta = ["No Meta (Async Error)"] * len(news_rows)
-
-    for row, meta in zip(news_rows, news_meta):
-        row.append(meta if meta else "No Meta Description")
-        if meta.startswith("HTTP") or meta.startswith("Error"):
-            row[-1] = snippet_lookup_news.get(row[1], "No Meta Description")
-
-    overwrite_worksheet(
-        ensure_worksheet_exists(sheet, "Google News"),
-        ["Title", "Link", "Snippet", "Meta Description"],
-        news_rows,
-    )
+def _attach_meta(rows: List[List], meta_by_url: dict) -> None:
+    for row in rows:
+        meta = meta_by_url.get(row[1]) or NO_DESCRIPTION
+        # Fall back to the SerpAPI snippet when the article couldn't be read
+        if meta != NO_DESCRIPTION and is_placeholder(meta):
+            meta = row[2] or NO_DESCRIPTION
+        row.append(meta)
 
-    # ---------- Top Stories ----------
-    top_rows = [
-        [s.get("title") or "No Title",
-         s.get("link")  or "No Link",
-         s.get("snippet") or "No Snippet"]
-        for s in top_stories_data
-    ]
-    
-    top_rows = dedupe_rows(top_rows, key_index=1, keep_n=CAP_TOP_STORIES)
-    snippet_lookup_top = {r[1]: r[2] for r in top_rows}
+def _capped_article_rows(news_data, top_stories_data) -> Tuple[List[List], List[List]]:
+    return _article_rows(news_data, CAP_NEWS), _article_rows(top_stories_data, CAP_TOP_STORIES)
 
-    try:
-        top_meta = asyncio.run(fetch_meta_descriptions([r[1] for r in top_rows]))
-    except RuntimeError:
-        top_meta = ["No Meta (Async Error)"] * len(top_rows)
-        
-    for row, meta in zip(top_rows, top_meta):
-        row.append(meta if meta else "No Meta Description")
-        if meta.startswith("HTTP") or meta.startswith("Error"):
-            row[-1] = snippet_lookup_top.get(row[1], "No Meta Description")
-
-    overwrite_worksheet(
-        ensure_worksheet_exists(sheet, "Top Stories"),
-        ["Title", "Link", "Snippet", "Meta Description"],
-        top_rows,
-    )
+def build_tabs(news_data, top_stories_data, rising_data, top_data, meta_by_url: Optional[dict] = None):
+    """
+    Cleans the raw SerpAPI results, attaches meta descriptions and returns
+    the four source tabs as {title: (header, rows)}. Pass `meta_by_url`
+    when the descriptions were already fetched (e.g. for several markets
+    in one pass).
+    """
+    news_rows, top_rows = _capped_article_rows(news_data, top_stories_data)
 
-    # ---------- Google Trends Rising ----------
+    # ---------- Meta descriptions (one pass over both sources) ----------
+    if meta_by_url is None:
+        urls = list(dict.fromkeys(r[1] for r in news_rows + top_rows))
+        meta_by_url = dict(zip(urls, run_async(fetch_meta_descriptions(urls))))
+    _attach_meta(news_rows, meta_by_url)
+    _attach_meta(top_rows, meta_by_url)
+
+    # ---------- Google Trends ----------
     rising_rows = [[q.get("query"), q.get("value")] for q in rising_data][:CAP_TRENDS]
-    overwrite_worksheet(
-        ensure_worksheet_exists(sheet, "Google Trends Rising"),
-        ["Query", "Value"],
-        rising_rows,
-    )
+    top_rows_q  = [[q.get("query"), q.get("value")] for q in top_data][:CAP_TRENDS]
 
-    # ---------- Google Trends Top ----------
-    top_rows_q = [[q.get("query"), q.get("value")] for q in top_data][:CAP_TRENDS]
-    overwrite_worksheet(
-        ensure_worksheet_exists(sheet, "Google Trends Top"),
-        ["Query", "Value"],
-        top_rows_q,
-    )
+    return {
+        "Google News":          (ARTICLE_HEADER, news_rows),
+        "Top Stories":          (ARTICLE_HEADER, top_rows),
+        "Google Trends Rising": (TRENDS_HEADER, rising_rows),
+        "Google Trends Top":    (TRENDS_HEADER, top_rows_q),
+    }
+
+def store_data_in_google_sheets(sheet, news_data, top_stories_data, rising_data, top_data):
+    """
+    Builds the four source tabs, writes them in one batch and returns the
+    written {title: (header, rows)} so a summary step running in the same
+    process can use them without reading the sheet back.
+    """
+    tabs = build_tabs(news_data, top_stories_data, rising_data, top_data)
+    write_tabs(sheet, tabs, diff=DIFF_WRITES)
+    return tabs
 
 # ---------------------------------------------------------------------
 # 6. Main Entry Point
 # ---------------------------------------------------------------------
-def main():
-    # Initialize connection ONLY when function is called
-    client = get_gspread_client()
-    sheet = client.open_by_key(SPREADSHEET_ID)
-    
+def scrape_markets(markets: Optional[List[Market]] = None) -> Dict[str, dict]:
+    """
+    Scrapes several markets in one pass and returns {market id: tabs}:
+    one SerpAPI fan-out for every query, then one meta-description pass
+    over every market's articles (a URL shared by markets is fetched
+    once), so adding markets doesn't add their runtimes end to end.
+    """
+    markets = markets if markets is not None else load_registry().enabled()
     now_utc = dt.datetime.now(dt.timezone.utc)
-    print(f"=== Data scrape started {now_utc.isoformat(timespec='seconds')}Z ===")
+    print(f"=== Data scrape started {now_utc.isoformat(timespec='seconds')}Z "
+          f"({', '.join(m.id for m in markets)}) ===")
 
-    news_data        = fetch_google_news()
-    top_stories_data = fetch_google_top_stories()
-    rising_data, top_data = fetch_google_trends()
+    sources = fetch_markets(markets)
+    urls = []
+    for src in sources.values():
+        news_rows, top_rows = _capped_article_rows(src["news"], src["top_stories"])
+        urls += [r[1] for r in news_rows + top_rows]
+    urls = list(dict.fromkeys(urls))
+    meta_by_url = dict(zip(urls, run_async(fetch_meta_descriptions(urls))))
 
-    store_data_in_google_sheets(sheet, news_data, top_stories_data, rising_data, top_data)
+    tabs = {
+        market_id: build_tabs(src["news"], src["top_stories"], *src["trends"], meta_by_url=meta_by_url)
+        for market_id, src in sources.items()
+    }
     print("=== Data scrape finished ===")
+    return tabs
+
+def main(export=True, market: Optional[Market] = None):
+    """
+    Scrapes every source of one market (the default market unless given)
+    and returns the tabs. With `export=False` nothing is written to
+    Sheets; the caller (e.g. briefing.py) exports later.
+    """
+    market = market or default_market()
+    tabs = scrape_markets([market])[market.id]
+    if export and market.spreadsheet_id:
+        # Initialize connection ONLY when we actually write
+        write_tabs(get_spreadsheet(market.spreadsheet_id), tabs, diff=DIFF_WRITES)
+    return tabs
 
 if __name__ == "__main__":
     main()
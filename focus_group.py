@@ -0,0 +1,153 @@
+"""
+focus_group.py
+--------------
+Focus-group prompts, parsing helpers and the concurrent persona panel
+used by the Validation page.
+
+A panel runs in two rounds: every persona reviews the creative at once,
+then every persona replies to the rest of the panel at once. Only the
+rebuttal round waits on the first, so a ten-persona panel takes about as
+long as a two-persona debate.
+"""
+
+import asyncio
+import json
+import re
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, List, Optional
+from llm_gateway import LLMError, chat
+
+if TYPE_CHECKING:  # persona_registry imports this module
+    from persona_registry import Persona
+
+# ────────────────────────────────────────────────────────────────────────────────
+# HELPERS
+# ────────────────────────────────────────────────────────────────────────────────
+DASH_CHARS = "\u2010\u2011\u2012\u2013\u2014\u2015\u2212"
+
+def normalize_dashes(s: str) -> str:
+    return re.sub(f"[{DASH_CHARS}]", "-", s or "")
+
+def extract_json_object(text: str) -> Optional[dict]:
+    if not text: return None
+    start = text.find("{")
+    end = text.rfind("}")
+    if start == -1 or end == -1 or end <= start: return None
+    blob = text[start : end + 1]
+    try:
+        return json.loads(blob)
+    except Exception:
+        return None
+
+# ────────────────────────────────────────────────────────────────────────────────
+# PROMPT LOGIC
+# ────────────────────────────────────────────────────────────────────────────────
+def build_persona_system_prompt(core):
+    return (
+        f"You are {core.get('name')}, {core.get('age')} years old, {core.get('occupation')}.\n"
+        f"Bio: {core.get('narrative')}\n"
+        f"Values: {', '.join(core.get('values', []))}\n"
+        f"Concerns: {', '.join(core.get('concerns', []))}\n"
+        "Respond in character. Be specific. Keep answers under 140 words."
+    )
+
+def moderator_prompt(transcript, creative):
+    return f"""
+    You are a Direct Response Copy Chief. Analyze this focus group debate.
+
+    TRANSCRIPT:
+    {transcript}
+
+    CREATIVE:
+    {creative}
+
+    Output JSON only:
+    {{
+        "executive_summary": "...",
+        "key_objections": ["..."],
+        "actionable_fixes": ["..."],
+        "rewrite": {{
+            "headline": "...",
+            "body": "..."
+        }}
+    }}
+    """
+
+def rebuttal_prompt(creative, others: List["PanelTurn"]):
+    said = "\n".join(f"- {t.name}: {t.text}" for t in others)
+    return (
+        f"Review this creative:\n{creative}\n\n"
+        f"The other panelists said:\n{said}\n\n"
+        "Respond to them: where do you agree, where do you push back, and has "
+        "anything changed your mind?"
+    )
+
+# ────────────────────────────────────────────────────────────────────────────────
+# PANEL
+# ────────────────────────────────────────────────────────────────────────────────
+@dataclass
+class PanelTurn:
+    uid: str
+    name: str
+    segment: str
+    round: int
+    text: str
+    error: Optional[str] = None  # set (and text empty) when the persona's call failed
+
+async def run_panel(client, personas: List["Persona"], creative: str,
+                    concurrency: int = 5, model: str = "gpt-4o",
+                    temperature: float = 0.7, rebuttal: bool = True,
+                    on_turn: Optional[Callable[[PanelTurn], None]] = None,
+                    regenerate: bool = False) -> List[PanelTurn]:
+    """
+    Runs `personas` (persona_registry.Persona records, system prompts
+    pre-rendered) against `creative` through an async OpenAI client, at most `concurrency`
+    requests in flight. `on_turn` is called as each reply lands. Replies
+    are served from the LLM cache unless `regenerate` is set. A persona
+    whose call fails gets a turn with `error` set and sits out the
+    rebuttal round; its failure never appears in the transcript.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def turn(p, round_no, user_msg):
+        messages = [
+            {"role": "system", "content": p.system_prompt},
+            {"role": "user", "content": user_msg},
+        ]
+        async with sem:
+            try:
+                text, error = await chat(client, messages, model, regenerate=regenerate,
+                                         temperature=temperature), None
+            except LLMError as e:
+                text, error = "", str(e)
+        t = PanelTurn(p.uid, p.name, p.segment_label, round_no, text, error)
+        if on_turn:
+            on_turn(t)
+        return t
+
+    # Round 1: independent first reactions, all at once
+    first = await asyncio.gather(*(
+        turn(p, 1, f"Review this creative:\n{creative}") for p in personas
+    ))
+    answered = [t for t in first if t.error is None]
+    if not rebuttal or len(answered) < 2:
+        return list(first)
+
+    # Round 2: each persona who answered replies to the rest of the panel
+    ok = {t.uid for t in answered}
+    second = await asyncio.gather(*(
+        turn(p, 2, rebuttal_prompt(creative, [t for t in answered if t.uid != p.uid]))
+        for p in personas if p.uid in ok
+    ))
+    return list(first) + list(second)
+
+def format_transcript(turns: List[PanelTurn]) -> str:
+    lines = []
+    for round_no, heading in ((1, "ROUND 1 — First reactions"), (2, "ROUND 2 — Rebuttals")):
+        block = [f"{t.name} ({t.segment}): {t.text}"
+                 for t in turns if t.round == round_no and t.error is None]
+        if block:
+            lines.append(heading)
+            lines.extend(block)
+            lines.append("")
+    return "\n".join(lines).strip()
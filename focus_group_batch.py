@@ -0,0 +1,208 @@
+"""
+focus_group_batch.py
+--------------------
+Headless focus-group runner for pre-screening creatives in bulk.
+
+Reads creatives from a JSONL or CSV file (an `id` column and a `creative`
+or `text` column), runs each one past a persona panel and the moderator,
+and writes the moderator's structured JSON to CSV or Parquet.
+
+Progress is checkpointed to a JSONL file after every creative, so an
+interrupted run picks up where it stopped when started again; creatives
+whose last attempt recorded an error are run again.
+
+    python focus_group_batch.py subject_lines.csv -o results.parquet \\
+        --segments next_generation_investors_18_24 --workers 4
+"""
+
+import argparse
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+import tomllib
+from pathlib import Path
+from typing import Dict, List
+
+import pandas as pd
+
+from focus_group import extract_json_object, format_transcript, moderator_prompt, run_panel
+from llm_gateway import LLMError, chat
+from persona_registry import PersonaRegistry
+
+SECRETS_PATH = Path(".streamlit") / "secrets.toml"
+
+
+# ---------------------------------------------------------------------
+# Inputs
+# ---------------------------------------------------------------------
+def read_creatives(path: Path) -> List[Dict[str, str]]:
+    if path.suffix.lower() == ".jsonl":
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+    else:
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+
+    creatives = []
+    for i, row in enumerate(rows, 1):
+        text = row.get("creative") or row.get("text") or ""
+        if text.strip():
+            creatives.append({"id": str(row.get("id") or i), "creative": text.strip()})
+    return creatives
+
+
+def openai_api_key() -> str:
+    key = os.environ.get("OPENAI_API_KEY")
+    if not key and SECRETS_PATH.exists():
+        key = tomllib.loads(SECRETS_PATH.read_text()).get("openai", {}).get("api_key")
+    if not key:
+        sys.exit("OpenAI key missing: set OPENAI_API_KEY or [openai] api_key in .streamlit/secrets.toml")
+    return key
+
+
+def load_checkpoint(path: Path) -> Dict[str, dict]:
+    """Latest checkpointed record per creative id, failed ones included."""
+    done = {}
+    if path.exists():
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                    done[rec["id"]] = rec
+                except (json.JSONDecodeError, KeyError):
+                    continue  # a half-written last line from an interrupted run
+    return done
+
+
+# ---------------------------------------------------------------------
+# Runner
+# ---------------------------------------------------------------------
+async def score_creative(client, item, panel, args, sem) -> dict:
+    turns = await run_panel(
+        client, panel, item["creative"],
+        concurrency=args.concurrency, model=args.model, rebuttal=not args.no_rebuttal,
+    )
+    transcript = format_transcript(turns)
+
+    analysis, error = None, None
+    # A persona counts as answered only if none of its turns failed
+    answered = len(panel) - len({t.uid for t in turns if t.error})
+    if turns and all(t.error for t in turns):
+        # Nothing for the moderator to read (e.g. the circuit breaker is open)
+        error = f"No persona could respond: {turns[0].error}"
+    else:
+        async with sem:
+            try:
+                reply = await chat(
+                    client,
+                    [{"role": "user", "content": moderator_prompt(transcript, item["creative"])}],
+                    args.model,
+                    cache_if=extract_json_object,
+                    response_format={"type": "json_object"},
+                )
+                analysis = extract_json_object(reply)
+            except LLMError as e:
+                error = str(e)
+    if analysis is None and error is None:
+        error = "Moderator returned no JSON"
+    if error is None and answered < len(panel):
+        # Keep the analysis, but flag it so a resumed run retries the full panel
+        failed = next(t.error for t in turns if t.error)
+        error = f"Partial panel: {answered}/{len(panel)} personas answered ({failed})"
+
+    analysis = analysis or {}
+    rewrite = analysis.get("rewrite") or {}
+    return {
+        "id": item["id"],
+        "creative": item["creative"],
+        "panel_size": len(panel),
+        "personas_answered": answered,
+        "executive_summary": analysis.get("executive_summary"),
+        "key_objections": json.dumps(analysis.get("key_objections", []), ensure_ascii=False),
+        "actionable_fixes": json.dumps(analysis.get("actionable_fixes", []), ensure_ascii=False),
+        "rewrite_headline": rewrite.get("headline") if isinstance(rewrite, dict) else None,
+        "rewrite_body": rewrite.get("body") if isinstance(rewrite, dict) else None,
+        "transcript": transcript,
+        "error": error,
+        "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+async def run_batch(creatives, panel, args, checkpoint: Path) -> None:
+    from openai import AsyncOpenAI
+
+    # One semaphore bounds creatives in flight; each panel bounds its own calls
+    creative_sem = asyncio.Semaphore(args.workers)
+    moderator_sem = asyncio.Semaphore(args.concurrency)
+    total, finished = len(creatives), 0
+
+    async with AsyncOpenAI(api_key=openai_api_key()) as client:
+        with open(checkpoint, "a", encoding="utf-8") as ckpt:
+            async def worker(item):
+                nonlocal finished
+                async with creative_sem:
+                    rec = await score_creative(client, item, panel, args, moderator_sem)
+                ckpt.write(json.dumps(rec, ensure_ascii=False) + "\n")
+                ckpt.flush()
+                finished += 1
+                flag = f" ERROR: {rec['error']}" if rec["error"] else ""
+                print(f"[{finished}/{total}] {item['id']}{flag}")
+
+            await asyncio.gather(*(worker(c) for c in creatives))
+
+
+def write_results(records: List[dict], output: Path) -> None:
+    df = pd.DataFrame(records)
+    if output.suffix.lower() == ".parquet":
+        df.to_parquet(output, index=False)
+    else:
+        df.to_csv(output, index=False)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Run creatives past a synthetic focus group in bulk.")
+    ap.add_argument("input", type=Path, help="JSONL or CSV with id + creative/text columns")
+    ap.add_argument("-o", "--output", type=Path, default=Path("focus_group_results.csv"),
+                    help=".csv or .parquet")
+    ap.add_argument("--checkpoint", type=Path, help="defaults to <output>.checkpoint.jsonl")
+    ap.add_argument("--personas", type=Path, default=Path("personas.json"))
+    ap.add_argument("--segments", nargs="*", help="segment ids to include (default: all)")
+    ap.add_argument("--uids", nargs="*", help="individual persona ids to include")
+    ap.add_argument("--workers", type=int, default=4, help="creatives processed at once")
+    ap.add_argument("--concurrency", type=int, default=8, help="LLM calls in flight per panel")
+    ap.add_argument("--model", default="gpt-4o")
+    ap.add_argument("--no-rebuttal", action="store_true", help="first reactions only")
+    args = ap.parse_args()
+
+    panel = PersonaRegistry.from_json(args.personas).select(segments=args.segments, uids=args.uids)
+    if not panel:
+        sys.exit("No personas matched the requested panel.")
+
+    checkpoint = args.checkpoint or args.output.with_suffix(args.output.suffix + ".checkpoint.jsonl")
+    done = load_checkpoint(checkpoint)
+    creatives = read_creatives(args.input)
+    # Failed records are retried; a later line in the checkpoint supersedes them
+    todo = [c for c in creatives if c["id"] not in done or done[c["id"]].get("error")]
+    retries = sum(1 for c in todo if c["id"] in done)
+    print(f"{len(creatives)} creatives, {len(creatives) - len(todo)} already done, {len(todo)} to run "
+          f"({retries} retrying earlier errors) against {len(panel)} personas")
+
+    if todo:
+        try:
+            asyncio.run(run_batch(todo, panel, args, checkpoint))
+        except KeyboardInterrupt:
+            print("Interrupted – progress is checkpointed; re-run the same command to resume.")
+            return
+
+    done = load_checkpoint(checkpoint)
+    order = {c["id"]: i for i, c in enumerate(creatives)}
+    records = sorted((r for r in done.values() if r["id"] in order), key=lambda r: order[r["id"]])
+    write_results(records, args.output)
+    print(f"Wrote {len(records)} results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+llm.py
+------
+Shared streaming completion helpers for the portal pages.
+
+Tokens are rendered progressively with st.write_stream while the full text
+is still returned for session state and downstream parsing. Each call
+records time-to-first-token and total time.
+
+Completions go through the content-addressed llm_cache first; pass
+`regenerate=True` to skip the lookup and overwrite the cached answer.
+Calls that do reach a provider go through llm_gateway's rate limits,
+retries and circuit breaker, and failures raise llm_gateway.LLMError.
+Every call, cached or not, is also recorded as a telemetry span with its
+token usage.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Iterable, Iterator, List, Optional
+import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from llm_cache import get_cache, make_key
+from llm_gateway import estimate_tokens, gemini_usage, guard_sync, openai_usage
+from telemetry import span
+
+
+@dataclass
+class StreamTiming:
+    label: str
+    model: str
+    ttft_s: Optional[float]
+    total_s: float
+    chars: int
+    cached: bool = False
+
+
+def _record(timing: StreamTiming) -> None:
+    ttft = f"{timing.ttft_s:.2f}s" if timing.ttft_s is not None else "n/a"
+    print(f"[llm] {timing.label} ({timing.model}): first token {ttft}, "
+          f"total {timing.total_s:.2f}s, {timing.chars} chars"
+          + (" [cache hit]" if timing.cached else ""))
+    # Keep a per-session history when running inside a Streamlit script
+    if get_script_run_ctx() is not None:
+        st.session_state.setdefault("llm_timings", []).append(timing)
+
+
+def last_timing() -> Optional[StreamTiming]:
+    timings = st.session_state.get("llm_timings") or []
+    return timings[-1] if timings else None
+
+
+class RateLimiter:
+    """Spaces out request starts to at most `per_minute`, across threads."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+def _from_cache(key: str, label: str, model: str, render: bool) -> Optional[str]:
+    start = time.perf_counter()
+    text = get_cache().get(key)
+    if text is None:
+        return None
+    if render:
+        st.markdown(text)
+    elapsed = time.perf_counter() - start
+    _record(StreamTiming(label, model, elapsed, elapsed, len(text), cached=True))
+    return text
+
+
+def _consume(pieces: Iterable[str], label: str, model: str, render: bool, sp=None) -> str:
+    start = time.perf_counter()
+    first = None
+
+    def timed() -> Iterator[str]:
+        nonlocal first
+        for piece in pieces:
+            if piece:
+                if first is None:
+                    first = time.perf_counter() - start
+                yield piece
+
+    # A stream that breaks part-way raises; the fragment is never returned as a reply
+    if render:
+        text = st.write_stream(timed())
+        if not isinstance(text, str):
+            text = "".join(str(t) for t in text)
+    else:
+        text = "".join(timed())
+
+    _record(StreamTiming(label, model, first, time.perf_counter() - start, len(text)))
+    if sp is not None and first is not None:
+        sp.set(ttft_ms=round(first * 1000, 1))
+    return text
+
+
+def _guarded_stream(provider: str, open_stream: Callable[[], Any],
+                    pieces: Callable[[Any], Iterable[str]], tokens: int,
+                    label: str, model: str, render: bool, sp) -> str:
+    """
+    Opens and reads a stream inside the gateway guard, so 429/5xx errors
+    reported while reading (Gemini's usual way) are retried and count
+    against the breaker. Only attempts that failed before the first token
+    are retried; a half-rendered reply isn't started over.
+    """
+    received = False
+
+    def tracked() -> Iterator[str]:
+        nonlocal received
+        for piece in pieces(open_stream()):
+            received = received or bool(piece)
+            yield piece
+
+    return guard_sync(provider, lambda: _consume(tracked(), label, model, render, sp),
+                      tokens, can_retry=lambda: not received)
+
+
+def stream_openai(client, messages: List[dict], model: str = "gpt-4o",
+                  render: bool = True, label: str = "openai",
+                  cache: bool = True, regenerate: bool = False, **kwargs) -> str:
+    """Streams a chat completion, rendering it if `render`; returns the full text."""
+    key = make_key("openai", model, messages, kwargs)
+    with span("llm", provider="openai", model=model, label=label, stream=True, cache_hit=False) as sp:
+        if cache and not regenerate:
+            hit = _from_cache(key, label, model, render)
+            if hit is not None:
+                sp.set(cache_hit=True)
+                return hit
+
+        def pieces(stream):
+            for chunk in stream:
+                if getattr(chunk, "usage", None):
+                    sp.set(**openai_usage(chunk))  # final chunk, no choices
+                if chunk.choices:
+                    yield chunk.choices[0].delta.content or ""
+
+        text = _guarded_stream(
+            "openai",
+            lambda: client.chat.completions.create(
+                model=model, messages=messages, stream=True,
+                stream_options={"include_usage": True}, **kwargs,
+            ),
+            pieces, estimate_tokens(messages), label, model, render, sp,
+        )
+    if cache and text:
+        get_cache().put(key, "openai", model, text)
+    return text
+
+
+def stream_gemini(genai_module, prompt: str, model: str = "gemini-1.5-pro",
+                  render: bool = True, label: str = "gemini",
+                  cache: bool = True, regenerate: bool = False) -> str:
+    """Streams a Gemini generate_content call; returns the full text."""
+    key = make_key("gemini", model, [{"role": "user", "content": prompt}])
+    with span("llm", provider="gemini", model=model, label=label, stream=True, cache_hit=False) as sp:
+        if cache and not regenerate:
+            hit = _from_cache(key, label, model, render)
+            if hit is not None:
+                sp.set(cache_hit=True)
+                return hit
+
+        def pieces(response):
+            for chunk in response:
+                if getattr(chunk, "usage_metadata", None):
+                    sp.set(**gemini_usage(chunk))  # running totals; the last chunk wins
+                yield chunk.text
+
+        text = _guarded_stream(
+            "gemini",
+            lambda: genai_module.GenerativeModel(model).generate_content(prompt, stream=True),
+            pieces, estimate_tokens([{"content": prompt}]), label, model, render, sp,
+        )
+    if cache and text:
+        get_cache().put(key, "gemini", model, text)
+    return text
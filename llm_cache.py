@@ -0,0 +1,112 @@
+"""
+llm_cache.py
+------------
+Content-addressed on-disk cache for LLM completions.
+
+The key is a SHA-256 of the provider, model, messages and sampling
+parameters, so an identical request (same system prompt, same brief,
+same persona/creative pair) is answered from disk instead of the API.
+Entries expire after a TTL and the least recently used are evicted once
+the cache grows past MAX_ENTRIES.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# ---------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------
+CACHE_PATH  = Path(".cache") / "llm_cache.sqlite"
+TTL_SECONDS = 7 * 24 * 3600
+MAX_ENTRIES = 2000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS completions (
+    key          TEXT PRIMARY KEY,
+    provider     TEXT NOT NULL,
+    model        TEXT NOT NULL,
+    response     TEXT NOT NULL,
+    created_at   REAL NOT NULL,
+    accessed_at  REAL NOT NULL,
+    hits         INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_completions_accessed ON completions(accessed_at);
+"""
+
+
+def make_key(provider: str, model: str, messages: List[dict],
+             params: Optional[Dict[str, Any]] = None) -> str:
+    payload = json.dumps(
+        {"provider": provider, "model": model, "messages": messages, "params": params or {}},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMCache:
+    def __init__(self, path: Path = CACHE_PATH, ttl: float = TTL_SECONDS,
+                 max_entries: int = MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM completions WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM completions WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE completions SET accessed_at = ?, hits = hits + 1 WHERE key = ?",
+                (now, key),
+            )
+            return row[0]
+
+    def put(self, key: str, provider: str, model: str, response: str) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions "
+                "(key, provider, model, response, created_at, accessed_at, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0)",
+                (key, provider, model, response, now, now),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        self._conn.execute(
+            "DELETE FROM completions WHERE created_at < ?", (time.time() - self.ttl,)
+        )
+        self._conn.execute(
+            "DELETE FROM completions WHERE key IN ("
+            "  SELECT key FROM completions ORDER BY accessed_at DESC LIMIT -1 OFFSET ?"
+            ")",
+            (self.max_entries,),
+        )
+
+
+_shared: Optional[LLMCache] = None
+_shared_lock = threading.Lock()
+
+
+def get_cache() -> LLMCache:
+    """Process-wide cache instance."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = LLMCache()
+        return _shared
@@ -0,0 +1,386 @@
+"""
+llm_gateway.py
+--------------
+Shared, provider-agnostic guard rails for every LLM call in the portal.
+
+Per provider (process-wide, shared by every session and thread):
+  * token buckets for requests/minute and tokens/minute,
+  * jittered exponential backoff on retryable errors (429, 5xx, timeouts),
+  * a circuit breaker that fails fast after repeated failures and lets a
+    single trial call through once the cool-off has passed.
+
+Async callers use `chat` / `gemini_generate`; sync streaming helpers in
+llm.py go through `guard_sync`. `hedged_json` races Gemini against
+OpenAI (OpenAI starts after a short head start, or at once if Gemini
+fails) and returns the first reply that parses as valid JSON.
+
+Failures raise LLMError (CircuitOpenError when the breaker is open);
+nothing here returns an error message as if it were content.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from llm_cache import get_cache, make_key
+from telemetry import span
+
+# ---------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------
+PROVIDER_LIMITS = {
+    # requests / minute, tokens / minute (prompt + expected completion)
+    "openai": {"rpm": 500, "tpm": 300_000},
+    "gemini": {"rpm": 150, "tpm": 1_000_000},
+}
+COMPLETION_TOKENS_GUESS = 800      # reserved per call on top of the prompt estimate
+MAX_ATTEMPTS     = 4
+BACKOFF_BASE_S   = 0.5
+BACKOFF_CAP_S    = 8.0
+BREAKER_FAILURES = 5               # consecutive failed calls before the breaker opens
+BREAKER_RESET_S  = 30.0
+HEDGE_AFTER_S    = 4.0             # head start the primary provider gets before the hedge fires
+CALL_TIMEOUT_S   = 90.0
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+
+
+class LLMError(Exception):
+    """An LLM call failed after retries (or was refused by the circuit breaker)."""
+
+    def __init__(self, provider: str, message: str):
+        super().__init__(f"{provider}: {message}")
+        self.provider = provider
+
+
+class CircuitOpenError(LLMError):
+    pass
+
+
+# ---------------------------------------------------------------------
+# Rate limits & breakers
+# ---------------------------------------------------------------------
+class TokenBucket:
+    """
+    Continuous-refill bucket. `reserve(n)` books `n` units and returns how
+    long the caller must wait before using them, so sync and async callers
+    share one bucket (the balance may go negative; later callers queue).
+    """
+
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self._level = self.capacity
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, n: float = 1.0) -> float:
+        with self._lock:
+            now = time.monotonic()
+            self._level = min(self.capacity, self._level + (now - self._stamp) * self.rate)
+            self._stamp = now
+            self._level -= min(n, self.capacity)
+            return 0.0 if self._level >= 0 else -self._level / self.rate
+
+
+class CircuitBreaker:
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_after: float = BREAKER_RESET_S):
+        self.failures = failures
+        self.reset_after = reset_after
+        self._count = 0
+        self._opened_at: Optional[float] = None
+        self._trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            return "half-open" if time.monotonic() - self._opened_at >= self.reset_after else "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_after or self._trial:
+                return False
+            self._trial = True  # one trial call while half-open
+            return True
+
+    def release(self) -> None:
+        """The admitted call was abandoned (e.g. lost a hedge race): no verdict either way."""
+        with self._lock:
+            self._trial = False
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._count, self._opened_at = 0, None
+                return
+            self._count += 1
+            if self._count >= self.failures:
+                self._opened_at = time.monotonic()
+
+
+@dataclass
+class _Provider:
+    requests: TokenBucket
+    tokens: TokenBucket
+    breaker: CircuitBreaker
+
+
+_providers: Dict[str, _Provider] = {}
+_providers_lock = threading.Lock()
+
+
+def _provider(name: str) -> _Provider:
+    with _providers_lock:
+        if name not in _providers:
+            limits = PROVIDER_LIMITS.get(name, {"rpm": 60, "tpm": 100_000})
+            _providers[name] = _Provider(TokenBucket(limits["rpm"]), TokenBucket(limits["tpm"]),
+                                         CircuitBreaker())
+        return _providers[name]
+
+
+def breaker_state(provider: str) -> str:
+    return _provider(provider).breaker.state
+
+
+def estimate_tokens(messages: List[dict]) -> int:
+    chars = sum(len(str(m.get("content", ""))) for m in messages)
+    return chars // 4 + COMPLETION_TOKENS_GUESS
+
+
+def is_retryable(exc: BaseException) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(exc, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS
+    if isinstance(exc, (asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    name = type(exc).__name__
+    return any(k in name for k in ("Timeout", "Connection", "RateLimit", "Unavailable", "Exhausted"))
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: uniform over [0, min(cap, base * 2^attempt)]
+    return random.uniform(0, min(BACKOFF_CAP_S, BACKOFF_BASE_S * 2 ** attempt))
+
+
+def _admit(provider: str, tokens: int) -> Tuple[_Provider, float]:
+    p = _provider(provider)
+    if not p.breaker.allow():
+        raise CircuitOpenError(provider, "circuit open after repeated failures; try again shortly")
+    return p, max(p.requests.reserve(1), p.tokens.reserve(tokens))
+
+
+# ---------------------------------------------------------------------
+# Usage (telemetry span attributes)
+# ---------------------------------------------------------------------
+def openai_usage(resp) -> dict:
+    usage = getattr(resp, "usage", None)
+    if usage is None:
+        return {}
+    return {"tokens_in": getattr(usage, "prompt_tokens", None),
+            "tokens_out": getattr(usage, "completion_tokens", None)}
+
+
+def gemini_usage(resp) -> dict:
+    usage = getattr(resp, "usage_metadata", None)
+    if usage is None:
+        return {}
+    return {"tokens_in": getattr(usage, "prompt_token_count", None),
+            "tokens_out": getattr(usage, "candidates_token_count", None)}
+
+
+# ---------------------------------------------------------------------
+# Guarded calls
+# ---------------------------------------------------------------------
+def _settle(p: _Provider, provider: str, last: BaseException) -> LLMError:
+    # Only provider-side trouble counts against the breaker, not e.g. a 400 for a bad request
+    if is_retryable(last):
+        p.breaker.record(False)
+    else:
+        p.breaker.release()
+    return LLMError(provider, str(last) or type(last).__name__)
+
+
+async def guarded(provider: str, call: Callable[[], Any], tokens: int,
+                  attempts: int = MAX_ATTEMPTS, timeout: float = CALL_TIMEOUT_S) -> Any:
+    """Runs the coroutine factory `call` under the provider's limits, retries and breaker."""
+    p, wait = _admit(provider, tokens)
+    last: Optional[BaseException] = None
+    try:
+        for attempt in range(attempts):
+            if wait:
+                await asyncio.sleep(wait)
+            try:
+                result = await asyncio.wait_for(call(), timeout)
+                p.breaker.record(True)
+                return result
+            except Exception as e:
+                last = e
+                if not is_retryable(e) or attempt == attempts - 1:
+                    break
+                wait = _backoff(attempt) + p.requests.reserve(1)
+    except asyncio.CancelledError:
+        p.breaker.release()  # lost a hedge race; not the provider's fault
+        raise
+    raise _settle(p, provider, last) from last
+
+
+def guard_sync(provider: str, call: Callable[[], Any], tokens: int,
+               attempts: int = MAX_ATTEMPTS,
+               can_retry: Callable[[], bool] = lambda: True) -> Any:
+    """
+    Sync twin of `guarded`, for the streaming helpers in llm.py. `call`
+    should read the whole stream, so errors raised mid-stream are retried
+    and judged by the breaker too; `can_retry` returning False (e.g. part
+    of the reply is already on screen) stops retries, not the verdict.
+    """
+    p, wait = _admit(provider, tokens)
+    last: Optional[BaseException] = None
+    for attempt in range(attempts):
+        if wait:
+            time.sleep(wait)
+        try:
+            result = call()
+            p.breaker.record(True)
+            return result
+        except Exception as e:
+            last = e
+            if not is_retryable(e) or not can_retry() or attempt == attempts - 1:
+                break
+            wait = _backoff(attempt) + p.requests.reserve(1)
+    raise _settle(p, provider, last) from last
+
+
+def _usable(text: str, cache_if: Optional[Callable[[str], Any]]) -> bool:
+    if cache_if is None:
+        return True
+    try:
+        return bool(cache_if(text))
+    except Exception:
+        return False
+
+
+async def chat(client, messages: List[dict], model: str = "gpt-4o",
+               cache: bool = True, regenerate: bool = False,
+               cache_if: Optional[Callable[[str], Any]] = None, **params) -> str:
+    """
+    One OpenAI chat completion through the gateway; raises LLMError on
+    failure. With `cache_if` (e.g. a parser), only replies it accepts are
+    cached or served from the cache.
+    """
+    key = make_key("openai", model, messages, params)
+    with span("llm", provider="openai", model=model, cache_hit=False) as sp:
+        if cache and not regenerate:
+            hit = get_cache().get(key)
+            if hit is not None and _usable(hit, cache_if):
+                sp.set(cache_hit=True)
+                return hit
+
+        async def call():
+            resp = await client.chat.completions.create(model=model, messages=messages, **params)
+            sp.set(**openai_usage(resp))
+            return (resp.choices[0].message.content or "").strip()
+
+        text = await guarded("openai", call, estimate_tokens(messages))
+    if cache and text and _usable(text, cache_if):
+        get_cache().put(key, "openai", model, text)
+    return text
+
+
+async def gemini_generate(genai_module, prompt: str, model: str = "gemini-1.5-pro",
+                          json_mode: bool = False, cache: bool = True,
+                          regenerate: bool = False,
+                          cache_if: Optional[Callable[[str], Any]] = None) -> str:
+    """One Gemini generate_content call through the gateway (see `chat` for `cache_if`)."""
+    messages = [{"role": "user", "content": prompt}]
+    key = make_key("gemini", model, messages, {"json": True} if json_mode else None)
+    with span("llm", provider="gemini", model=model, cache_hit=False) as sp:
+        if cache and not regenerate:
+            hit = get_cache().get(key)
+            if hit is not None and _usable(hit, cache_if):
+                sp.set(cache_hit=True)
+                return hit
+
+        async def call():
+            config = {"response_mime_type": "application/json"} if json_mode else None
+            resp = await genai_module.GenerativeModel(model).generate_content_async(
+                prompt, generation_config=config
+            )
+            sp.set(**gemini_usage(resp))
+            return (resp.text or "").strip()
+
+        text = await guarded("gemini", call, estimate_tokens(messages))
+    if cache and text and _usable(text, cache_if):
+        get_cache().put(key, "gemini", model, text)
+    return text
+
+
+# ---------------------------------------------------------------------
+# Hedged JSON
+# ---------------------------------------------------------------------
+async def hedged_json(prompt: str, openai_client=None, genai_module=None,
+                      validate: Optional[Callable[[str], Optional[dict]]] = None,
+                      openai_model: str = "gpt-4o", gemini_model: str = "gemini-1.5-pro",
+                      hedge_after: float = HEDGE_AFTER_S,
+                      regenerate: bool = False) -> Tuple[dict, str]:
+    """
+    Returns (parsed_json, provider) from whichever provider first produces
+    a reply that `validate` accepts. Gemini goes first when configured;
+    OpenAI is launched after `hedge_after` seconds, or straight away if
+    Gemini fails or returns invalid JSON. The slower call is cancelled.
+    """
+    if validate is None:
+        from focus_group import extract_json_object as validate
+
+    starters = []
+    if genai_module is not None:
+        starters.append(("gemini", lambda: gemini_generate(
+            genai_module, prompt, gemini_model, json_mode=True, regenerate=regenerate,
+            cache_if=validate)))
+    if openai_client is not None:
+        starters.append(("openai", lambda: chat(
+            openai_client, [{"role": "user", "content": prompt}], openai_model,
+            regenerate=regenerate, cache_if=validate, response_format={"type": "json_object"})))
+    if not starters:
+        raise LLMError("gateway", "no provider configured")
+
+    pending: Dict[asyncio.Task, str] = {}
+    errors: List[str] = []
+
+    def launch():
+        name, start = starters.pop(0)
+        pending[asyncio.ensure_future(start())] = name
+
+    launch()
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending, timeout=hedge_after if starters else None,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if not done:
+                launch()  # primary is slow: fire the hedge
+                continue
+            for task in done:
+                name = pending.pop(task)
+                try:
+                    parsed = validate(task.result())
+                except Exception as e:
+                    errors.append(str(e))
+                    continue
+                if parsed:
+                    return parsed, name
+                errors.append(f"{name}: reply was not valid JSON")
+            if starters and not pending:
+                launch()
+    finally:
+        for task in pending:
+            task.cancel()
+    raise LLMError("gateway", "; ".join(errors) or "no valid reply")
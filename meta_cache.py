@@ -0,0 +1,179 @@
+"""
+meta_cache.py
+-------------
+On-disk cache of article meta descriptions for the news engine.
+
+Entries are keyed by normalized URL and keep the HTTP validators
+(ETag / Last-Modified) so stale entries can be revalidated with a
+conditional request instead of a full re-download.
+"""
+
+import re
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# ---------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------
+CACHE_PATH   = Path(".cache") / "meta_cache.sqlite"
+TTL_SECONDS  = 6 * 3600        # served without touching the network
+KEEP_SECONDS = 7 * 24 * 3600   # stale entries kept this long for revalidation
+MAX_ENTRIES  = 5000
+
+TRACKING_PARAMS = ("utm_", "fbclid", "gclid", "mc_cid", "mc_eid", "ocid", "cmpid")
+# Transient failures (rate limits, overloaded servers) are never cached,
+# so the next run asks again instead of serving the error for a whole TTL
+TRANSIENT_STATUS = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+# Placeholders the news engine writes instead of a missing field or a
+# description it couldn't fetch (plus "HTTP <status>"). They aren't
+# article content, so e.g. near-duplicate clustering ignores them.
+NO_DESCRIPTION = "No Meta Description"
+INVALID_URL    = "Invalid URL"
+FETCH_ERROR    = "Error Fetching Description"
+PLACEHOLDERS   = frozenset({"No Title", "No Link", "No Snippet",
+                            NO_DESCRIPTION, INVALID_URL, FETCH_ERROR})
+_HTTP_STATUS   = re.compile(r"HTTP \d{3}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS url_meta (
+    url            TEXT PRIMARY KEY,
+    description    TEXT NOT NULL,
+    status         INTEGER NOT NULL,
+    fetched_at     REAL NOT NULL,
+    accessed_at    REAL NOT NULL,
+    etag           TEXT,
+    last_modified  TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_url_meta_accessed ON url_meta(accessed_at);
+"""
+
+# ---------------------------------------------------------------------
+# Helpers
+# ---------------------------------------------------------------------
+def is_placeholder(text: str) -> bool:
+    """True if `text` is one of the engine's placeholders rather than content."""
+    return text in PLACEHOLDERS or bool(_HTTP_STATUS.fullmatch(text or ""))
+
+
+def normalize_url(url: str) -> str:
+    """Canonical cache key: lower-case host, no fragment, no tracking params."""
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or "").lower()
+    if parts.port and not (
+        (parts.scheme == "http" and parts.port == 80)
+        or (parts.scheme == "https" and parts.port == 443)
+    ):
+        host = f"{host}:{parts.port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith(TRACKING_PARAMS)
+    )
+    path = parts.path.rstrip("/") or "/"
+    return urlunsplit((parts.scheme.lower(), host, path, urlencode(query), ""))
+
+
+@dataclass
+class CachedMeta:
+    description: str
+    status: int
+    fetched_at: float
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+    @property
+    def cacheable(self) -> bool:
+        """False for network errors (status 0) and transient HTTP failures."""
+        return bool(self.status) and self.status not in TRANSIENT_STATUS
+
+    def is_fresh(self, ttl: float = TTL_SECONDS, now: Optional[float] = None) -> bool:
+        return ((now or time.time()) - self.fetched_at) < ttl
+
+    def conditional_headers(self) -> Dict[str, str]:
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+# ---------------------------------------------------------------------
+# Cache
+# ---------------------------------------------------------------------
+class MetaCache:
+    def __init__(self, path: Path = CACHE_PATH, ttl: float = TTL_SECONDS,
+                 max_entries: int = MAX_ENTRIES):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        self._conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.evict()
+        self.close()
+
+    def get_many(self, urls: Iterable[str]) -> Dict[str, CachedMeta]:
+        """Returns cached entries (fresh or stale) keyed by the original URL."""
+        keys = {normalize_url(u): u for u in urls}
+        out = {}
+        key_list = list(keys)
+        for i in range(0, len(key_list), 500):
+            chunk = key_list[i:i + 500]
+            rows = self._conn.execute(
+                "SELECT url, description, status, fetched_at, etag, last_modified "
+                f"FROM url_meta WHERE url IN ({','.join('?' * len(chunk))})",
+                chunk,
+            ).fetchall()
+            for key, *fields in rows:
+                out[keys[key]] = CachedMeta(*fields)
+        if out:
+            now = time.time()
+            with self._conn:
+                self._conn.executemany(
+                    "UPDATE url_meta SET accessed_at = ? WHERE url = ?",
+                    [(now, normalize_url(u)) for u in out],
+                )
+        return out
+
+    def put_many(self, entries: Dict[str, CachedMeta]):
+        now = time.time()
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO url_meta "
+                "(url, description, status, fetched_at, accessed_at, etag, last_modified) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (normalize_url(u), m.description, m.status, m.fetched_at, now,
+                     m.etag, m.last_modified)
+                    for u, m in entries.items()
+                ],
+            )
+
+    def evict(self):
+        """Drops entries past KEEP_SECONDS, then the least recently used beyond max_entries."""
+        with self._conn:
+            self._conn.execute(
+                "DELETE FROM url_meta WHERE fetched_at < ?",
+                (time.time() - KEEP_SECONDS,),
+            )
+            self._conn.execute(
+                "DELETE FROM url_meta WHERE url IN ("
+                "  SELECT url FROM url_meta ORDER BY accessed_at DESC LIMIT -1 OFFSET ?"
+                ")",
+                (self.max_entries,),
+            )
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM url_meta").fetchone()[0]
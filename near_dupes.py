@@ -0,0 +1,123 @@
+"""
+near_dupes.py
+-------------
+Near-duplicate clustering for short texts (article title + snippet +
+meta description), so a syndicated story carried by several outlets
+reaches the summariser once, with the number of outlets that ran it.
+
+Each text becomes a set of word shingles, summarised by a MinHash
+signature; locality-sensitive hashing over bands of the signature finds
+candidate pairs without comparing every pair, so the cost grows with the
+number of texts rather than its square. Candidates are kept only if
+their estimated Jaccard similarity clears the threshold.
+
+Clusters are labelled by their earliest member, so callers that pass
+texts in rank order get the best-ranked article as the representative.
+"""
+
+import re
+import zlib
+from typing import Sequence
+
+import numpy as np
+
+# ---------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------
+NUM_PERM  = 128   # MinHash signature length
+BANDS     = 32    # 32 bands x 4 rows: pairs above ~0.42 Jaccard usually collide
+SHINGLE   = 2     # words per shingle
+THRESHOLD = 0.5   # estimated Jaccard for two texts to be the same story
+CHUNK     = 1 << 15  # shingles hashed per numpy pass (bounds memory)
+
+# Multiply-shift hashing: (a*x + b) mod 2^64, top 32 bits. `a` is odd.
+_EMPTY = np.uint64(1 << 32)  # above any hash: the signature of a text with no words
+_SHIFT = np.uint64(32)
+_rng = np.random.default_rng(0x5EED)  # fixed so clusters are stable between runs
+_A = (_rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64) | np.uint64(1))[:, None]
+_B = _rng.integers(0, 1 << 63, NUM_PERM, dtype=np.uint64)[:, None]
+_WORD = re.compile(r"[a-z0-9]+(?:['.][a-z0-9]+)*")
+
+
+def shingles(text: str) -> np.ndarray:
+    """Hashed word shingles of `text` (lower-cased, punctuation dropped)."""
+    words = _WORD.findall((text or "").lower())
+    if len(words) < SHINGLE:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)]
+    hashes = {zlib.crc32(g.encode()) for g in grams}
+    return np.fromiter(hashes, dtype=np.uint64, count=len(hashes))
+
+
+def signatures(texts: Sequence[str]) -> np.ndarray:
+    """
+    (len(texts), NUM_PERM) MinHash signatures. Texts without a single
+    word get an all-max row and should be left out of comparisons.
+    """
+    sets = [shingles(t) for t in texts]
+    sig = np.full((len(sets), NUM_PERM), _EMPTY, dtype=np.uint64)
+    start = 0
+    while start < len(sets):
+        # Hash as many whole texts as fit in one CHUNK-sized pass
+        end, size = start, 0
+        while end < len(sets) and (size == 0 or size + len(sets[end]) <= CHUNK):
+            size += len(sets[end])
+            end += 1
+        batch = [i for i in range(start, end) if len(sets[i])]
+        if batch:
+            flat = np.concatenate([sets[i] for i in batch])
+            offsets = np.cumsum([0] + [len(sets[i]) for i in batch[:-1]])
+            hashed = (_A * flat[None, :] + _B) >> _SHIFT
+            sig[batch] = np.minimum.reduceat(hashed, offsets, axis=1).T
+        start = end
+    return sig
+
+
+def cluster(texts: Sequence[str], threshold: float = THRESHOLD) -> np.ndarray:
+    """
+    Cluster label per text: the index of the cluster's earliest member
+    (a text on its own is labelled with its own index).
+    """
+    n = len(texts)
+    parent = list(range(n))
+
+    def find(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    if n < 2 or threshold <= 0:
+        return np.arange(n)
+
+    sig = signatures(texts)
+    live = np.flatnonzero(sig[:, 0] != _EMPTY)
+    rows = NUM_PERM // BANDS
+    bands = sig[live].reshape(len(live), BANDS, rows)
+    band_key = np.dtype((np.void, rows * sig.itemsize))
+
+    # Candidates: each text paired with the earliest text sharing a band
+    pairs = set()
+    for band in range(BANDS):
+        keys = np.ascontiguousarray(bands[:, band]).view(band_key).ravel()
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        earliest = live[first[inverse.ravel()]]
+        hit = earliest != live
+        pairs.update(zip(earliest[hit].tolist(), live[hit].tolist()))
+    if not pairs:
+        return np.arange(n)
+
+    j, i = np.array(sorted(pairs)).T
+    similar = (sig[j] == sig[i]).mean(axis=1) >= threshold
+    for a, b in zip(j[similar].tolist(), i[similar].tolist()):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    return np.fromiter((find(i) for i in range(n)), dtype=np.int64, count=n)
+
+
+def cluster_sizes(labels: np.ndarray) -> np.ndarray:
+    """Size of each text's cluster."""
+    return np.bincount(labels, minlength=len(labels))[labels]
+
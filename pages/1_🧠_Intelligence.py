@@ -1,73 +1,52 @@
 import streamlit as st
-import datetime as dt
-from utils import get_gspread_client, apply_branding
-from data_retrieval_storage_news_engine import main as retrieve_and_store_data
-from step2_summarisation_with_easier_reading import generate_summary
+from utils import apply_branding
+import briefing
+from briefing_format import legacy_briefs, parse_briefing, render_brief, render_overview, summary_markdown
+from state_store import get_store
 
 # 1. Page Setup
 st.set_page_config(page_title="Intelligence | Briefing", page_icon="🧠")
 apply_branding()
 
-# 2. Connect to Sheets using our new utils
-client = get_gspread_client()
-spreadsheet_id = "1BzTJgX7OgaA0QNfzKs5AgAx2rvZZjDdorgAz0SD9NZg"
-sheet = client.open_by_key(spreadsheet_id)
+# 2. The briefing is precomputed: a background thread (and/or
+# briefing_worker.py) refreshes it on a cadence; this page only reads it.
+briefing.start_background_refresher(briefing.COOLDOWN_HOURS)
 
 # --- Helper Functions ---
-def get_last_run_info(sheet_obj):
-    metadata_ws = sheet_obj.worksheet("Metadata")
-    last_run_time_str = metadata_ws.cell(2, 1).value
-    last_summary_text = metadata_ws.cell(2, 2).value
-    if last_run_time_str:
-        naive_dt = dt.datetime.strptime(last_run_time_str, "%Y-%m-%d %H:%M:%S")
-        last_run_utc = naive_dt.replace(tzinfo=dt.timezone.utc)
-    else:
-        last_run_utc = None
-    return last_run_utc, last_summary_text
-
-def set_last_run_info(sheet_obj, summary_text):
-    metadata_ws = sheet_obj.worksheet("Metadata")
-    now_utc = dt.datetime.now(dt.timezone.utc)
-    run_time_str = now_utc.strftime("%Y-%m-%d %H:%M:%S")
-    metadata_ws.update_cell(2, 1, run_time_str)
-    metadata_ws.update_cell(2, 2, summary_text)
-
 def parse_briefs(summary_text):
     """
-    Splits the AI's giant text block into individual briefs.
-    Based on your prompt's separator: '--------------------------------------------------'
+    Returns (overview_markdown, [(brief_markdown, is_new), ...]).
+    Structured JSON briefings are validated and rendered locally; older
+    plain-text summaries fall back to the separator-based split.
     """
-    sections = summary_text.split("--------------------------------------------------")
-    briefs = []
-    for section in sections:
-        clean_sec = section.strip()
-        # Filter for sections that look like actual briefs
-        if len(clean_sec) > 100 and ("1. *Synopsis*" in clean_sec or "*Brief Title*" in clean_sec):
-            briefs.append(clean_sec)
-    return briefs
+    parsed = parse_briefing(summary_text)
+    if parsed:
+        return render_overview(parsed), [(render_brief(b), b["is_new"]) for b in parsed["briefs"]]
+    return None, [(b, None) for b in legacy_briefs(summary_text)]
 
-def run_all_cooldown(sheet_obj, cooldown_hours=3):
-    now_utc = dt.datetime.now(dt.timezone.utc)
-    last_run_utc, last_summary = get_last_run_info(sheet_obj)
-
-    if last_run_utc is not None:
-        elapsed_hours = (now_utc - last_run_utc).total_seconds() / 3600.0
-    else:
-        elapsed_hours = 9999
+def load_briefing(market_id, cooldown_hours=3):
+    current = briefing.latest(market_id)
+    if not current.summary:
+        # Nothing precomputed yet (first ever run): join or start the refresh
+        with st.spinner("🤖 Building the first briefing – this takes a few minutes..."):
+            try:
+                current = briefing.refresh(cooldown_hours).result().get(market_id, current)
+            except Exception as e:
+                st.error(f"Building the briefing failed: {e}. Click 'Generate Briefing' to try again.")
+                return None
+        if not current.summary:
+            st.warning("No briefing is available for this market yet. Click 'Generate Briefing' to try again.")
+        return current.summary
 
-    if elapsed_hours < cooldown_hours:
-        st.warning(f"⏳ Cooldown active. Briefs were last run {elapsed_hours:.1f} hours ago.")
-        st.write("Here is the existing summary from that run:")
-        return last_summary
+    if current.is_stale(cooldown_hours):
+        briefing.refresh(cooldown_hours)  # joins the in-flight run if there is one
+        st.info(f"🔄 A fresh briefing is being prepared in the background. "
+                f"Showing the one from {current.age_hours():.1f} hours ago.")
+    elif briefing.is_refreshing(market_id):
+        st.info("🔄 A refresh is in progress; this briefing will update shortly.")
     else:
-        with st.status("🤖 AI Agents working...", expanded=True) as status:
-            st.write("Step 1: Scrape Google Trends & News...")
-            retrieve_and_store_data()
-            st.write("Step 2: OpenAI Analysis & Summarization...")
-            summary_text = generate_summary()
-            set_last_run_info(sheet_obj, summary_text)
-            status.update(label="Briefing Complete!", state="complete", expanded=False)
-        return summary_text
+        st.caption(f"Briefing generated {current.age_hours():.1f} hours ago.")
+    return current.summary
 
 # --- Main Page UI ---
 st.title("Daily Market Intelligence")
@@ -77,34 +56,68 @@ st.markdown("### what is the market focusing on?")
 if "briefing_report" not in st.session_state:
     st.session_state.briefing_report = None
 
+# Market picker (sources.json); hidden when only one market is enabled
+markets = {m.id: m for m in briefing.markets()}
+if len(markets) > 1:
+    market_id = st.selectbox("🌐 Market", list(markets),
+                             format_func=lambda m: f"{markets[m].name} · {markets[m].index_name}")
+else:
+    market_id = next(iter(markets))
+
 # 2. Generation Button (Only runs logic, doesn't hold UI)
 if st.button("Generate Briefing"):
-    # Run scraping logic
-    full_summary = run_all_cooldown(sheet, cooldown_hours=3)
+    # Read the precomputed briefing (never scrapes in the click itself)
+    full_summary = load_briefing(market_id, cooldown_hours=briefing.COOLDOWN_HOURS)
     # Save to session state so it persists
-    st.session_state.briefing_report = full_summary
+    st.session_state.briefing_report = (market_id, full_summary)
 
 # 3. Display Logic (Checks State, not the Button)
-if st.session_state.briefing_report:
-    full_summary = st.session_state.briefing_report
+report = st.session_state.briefing_report
+if report and report[0] == market_id and report[1]:
+    full_summary = report[1]
     
     # Parse results
-    individual_briefs = parse_briefs(full_summary)
+    overview, individual_briefs = parse_briefs(full_summary)
     
     st.success(f"Report Ready: {len(individual_briefs)} Opportunities Found")
+    if overview:
+        with st.expander("📊 Summary of Findings", expanded=False):
+            st.markdown(overview)
+
+    # What changed since the previous briefing
+    last_run = get_store().latest(market_id)
+    fresh = get_store().new_articles(last_run.id) if last_run else []
+    if fresh:
+        with st.expander(f"🆕 {len(fresh)} new or updated articles since the previous briefing"):
+            for a in fresh:
+                tag = "" if a["status"] == "new" else " *(updated)*"
+                st.markdown(f"- **{a['source']}**: [{a['title']}]({a['url']}){tag}")
     
     # Display Card Selection
-    for idx, brief in enumerate(individual_briefs):
-        with st.expander(f"📢 Opportunity #{idx+1} (Click to View)", expanded=False):
+    for idx, (brief, is_new) in enumerate(individual_briefs):
+        badge = "🆕 " if is_new else ""
+        with st.expander(f"{badge}📢 Opportunity #{idx+1} (Click to View)", expanded=False):
             st.markdown(brief)
             
             # THE GOLDEN THREAD BUTTON
             # This is now safe because it's outside the first button's scope
             if st.button(f"🚀 Draft Campaign for Opp #{idx+1}", key=f"btn_{idx}"):
                 st.session_state['intelligence_brief'] = brief
-                st.session_state['intelligence_source'] = "Daily Briefing"
+                st.session_state['intelligence_source'] = f"Daily Briefing ({markets[market_id].name})"
                 st.switch_page("pages/2_✍️_Creation.py")
 
     # Fallback for full text
     with st.expander("📄 View Full Raw Report"):
-        st.markdown(full_summary)
+        st.markdown(summary_markdown(full_summary))
+
+# 4. Briefing history (local state store)
+with st.expander("🗂️ Past Briefings"):
+    past = [r for r in get_store().history(limit=20, market=market_id) if r.summary]
+    if not past:
+        st.write("No briefings recorded yet.")
+    else:
+        labels = {r.id: f"{r.finished_at:%Y-%m-%d %H:%M} UTC · {r.status}"
+                  + (f" · {r.token_stats['prompt_tokens']} prompt tokens" if r.token_stats.get("prompt_tokens") else "")
+                  for r in past}
+        chosen = st.selectbox("Run", list(labels), format_func=labels.get)
+        st.markdown(summary_markdown(next(r.summary for r in past if r.id == chosen)))
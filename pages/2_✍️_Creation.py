@@ -1,9 +1,13 @@
-import time, json, pathlib
+import time, json, pathlib, re, zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from itertools import product
 from textwrap import dedent
 import streamlit as st
 from docx import Document
 from io import BytesIO
 from utils import apply_branding, configure_openai
+from llm import RateLimiter, stream_openai, last_timing
+from llm_gateway import LLMError
 
 # 1. Config & Styling
 st.set_page_config(page_title="✍️ Foolish AI Copywriter", initial_sidebar_state="expanded")
@@ -112,6 +116,26 @@ SALES_STRUCT = """
 ### Call‑to‑Action
 """
 
+COPY_TYPES = ["📧 Email", "📝 Sales Page"]
+
+# Trait presets for batch runs ("Sidebar settings" uses the live sliders)
+TRAIT_PRESETS = {
+    "Calm & Informational": {
+        "Urgency": 2, "Data_Richness": 5, "Social_Proof": 4, "Comparative_Framing": 3,
+        "Imagery": 4, "Conversational_Tone": 7, "FOMO": 2, "Repetition": 2,
+    },
+    "Data‑Led": {
+        "Urgency": 4, "Data_Richness": 9, "Social_Proof": 7, "Comparative_Framing": 6,
+        "Imagery": 3, "Conversational_Tone": 5, "FOMO": 3, "Repetition": 3,
+    },
+    "Hard Sell": {
+        "Urgency": 9, "Data_Richness": 6, "Social_Proof": 8, "Comparative_Framing": 7,
+        "Imagery": 7, "Conversational_Tone": 8, "FOMO": 9, "Repetition": 7,
+    },
+}
+
+BATCH_MAX_WORKERS = 8
+
 # 5. Helpers
 if "generated_copy" not in st.session_state: st.session_state.generated_copy = ""
 
@@ -167,6 +191,41 @@ IMPORTANT:
 ### END INSTRUCTIONS
 """.strip()
 
+def add_markdown_to_docx(doc, text):
+    """Minimal Markdown → docx: headings, bullets and paragraphs."""
+    for raw in text.splitlines():
+        ln = raw.strip()
+        if not ln:
+            continue
+        plain = re.sub(r"\*\*?(.+?)\*\*?", r"\1", ln)
+        if ln.startswith("#"):
+            level = min(len(ln) - len(ln.lstrip("#")), 4)
+            doc.add_heading(plain.lstrip("#").strip(), level=level)
+        elif ln.startswith(("- ", "• ")):
+            doc.add_paragraph(plain[2:], style="List Bullet")
+        else:
+            doc.add_paragraph(plain)
+
+def docx_bytes(drafts):
+    doc = Document()
+    for i, d in enumerate(drafts):
+        if i:
+            doc.add_page_break()
+        doc.add_heading(d["label"], level=1)
+        add_markdown_to_docx(doc, d["text"])
+    buf = BytesIO()
+    doc.save(buf)
+    return buf.getvalue()
+
+def batch_zip_bytes(drafts):
+    buf = BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("all_drafts.docx", docx_bytes(drafts))
+        for i, d in enumerate(drafts, 1):
+            slug = re.sub(r"[^A-Za-z0-9]+", "_", d["label"]).strip("_")
+            zf.writestr(f"{i:02d}_{slug}.docx", docx_bytes([d]))
+    return buf.getvalue()
+
 # --- UI START ---
 st.title("✍️ Foolish AI Copywriter")
 
@@ -176,7 +235,7 @@ if 'intelligence_brief' in st.session_state:
     st.success(f"💡 Imported Insight from {st.session_state.get('intelligence_source', 'Intelligence Tool')}")
     default_details = st.session_state['intelligence_brief']
 
-tab_gen, tab_adapt = st.tabs(["✍️ Generate Copy", "🌐 Adapt Copy"])
+tab_gen, tab_adapt, tab_batch = st.tabs(["✍️ Generate Copy", "🌐 Adapt Copy", "🧪 Batch Generate"])
 
 with tab_gen:
     with st.sidebar.expander("🎚️ Linguistic Trait Intensity", True):
@@ -194,19 +253,26 @@ with tab_gen:
             st.form_submit_button("Update Settings")
 
     country = st.selectbox("🌐 Target Country", list(COUNTRY_RULES))
-    copy_type = st.selectbox("Copy Type", ["📧 Email", "📝 Sales Page"])
+    copy_type = st.selectbox("Copy Type", COPY_TYPES)
     length_choice = st.selectbox("Desired Length", list(LENGTH_RULES))
 
     st.subheader("Campaign Brief")
     hook = st.text_area("🪝 Campaign Hook")
     details = st.text_area("📦 Product / Offer Details (or Paste Brief)", value=default_details, height=200)
 
+    regenerate = st.checkbox(
+        "♻️ Regenerate", value=False,
+        help="Identical requests are answered from cache. Tick to force a fresh draft.",
+    )
+
     # --- Robust Generation Logic ---
     if st.button("✨ Generate Copy"):
         if not details and not hook:
             st.warning("Please provide a hook or details.")
         else:
-            with st.spinner("Writing compliant copy..."):
+            draft_slot = st.empty()
+            generation_error = None
+            with draft_slot.container():
                 
                 # 1. Build the Brief Object
                 brief_obj = {"hook": hook, "details": details}
@@ -216,22 +282,148 @@ with tab_gen:
                 sys_msg = SYSTEM_PROMPT.format(country_rules=COUNTRY_RULES[country])
                 user_msg = build_prompt(copy_type, struct, trait_scores, brief_obj, length_choice)
                 
-                # 3. Call OpenAI
-                resp = client.chat.completions.create(
-                    model=OPENAI_MODEL,
-                    messages=[
-                        {"role": "system", "content": sys_msg},
-                        {"role": "user", "content": user_msg}
-                    ]
-                )
-                st.session_state.generated_copy = resp.choices[0].message.content
+                # 3. Call OpenAI, streaming the draft in as it's written
+                st.markdown("### Generated Draft")
+                try:
+                    st.session_state.generated_copy = stream_openai(
+                        client,
+                        [
+                            {"role": "system", "content": sys_msg},
+                            {"role": "user", "content": user_msg}
+                        ],
+                        model=OPENAI_MODEL,
+                        label="copywriter",
+                        regenerate=regenerate,
+                    )
+                except LLMError as e:
+                    generation_error = e
+            # The finished draft is rendered below; drop the streaming preview
+            draft_slot.empty()
+            if generation_error:
+                st.error(f"Draft generation failed: {generation_error}")
 
     if st.session_state.generated_copy:
         st.markdown("### Generated Draft")
         st.markdown(st.session_state.generated_copy)
+        timing = last_timing()
+        if timing and timing.label == "copywriter" and timing.cached:
+            st.caption("⚡ Served from cache — tick ♻️ Regenerate for a fresh draft.")
+        elif timing and timing.label == "copywriter" and timing.ttft_s is not None:
+            st.caption(f"First words in {timing.ttft_s:.1f}s · full draft in {timing.total_s:.1f}s")
         
         # GOLDEN THREAD OUTPUT
         st.divider()
         if st.button("🔬 Test this Draft in Focus Group"):
             st.session_state['draft_for_validation'] = st.session_state.generated_copy
             st.switch_page("pages/3_🔬_Validation.py")
+
+with tab_batch:
+    st.caption("Generate the same brief across markets, formats, lengths and trait presets in one go.")
+    st.session_state.setdefault("batch_drafts", [])
+
+    b1, b2 = st.columns(2)
+    with b1:
+        b_countries = st.multiselect("🌐 Countries", list(COUNTRY_RULES), default=list(COUNTRY_RULES))
+        b_types = st.multiselect("Copy Types", COPY_TYPES, default=COPY_TYPES[:1])
+    with b2:
+        b_lengths = st.multiselect("Lengths", list(LENGTH_RULES), default=list(LENGTH_RULES)[:1])
+        b_presets = st.multiselect("Trait Presets", ["Sidebar settings"] + list(TRAIT_PRESETS),
+                                   default=["Sidebar settings"])
+
+    b_hook = st.text_area("🪝 Campaign Hook", key="batch_hook")
+    b_details = st.text_area("📦 Product / Offer Details (or Paste Brief)", value=default_details,
+                             height=150, key="batch_details")
+
+    r1, r2, r3 = st.columns(3)
+    with r1:
+        b_workers = st.slider("Parallel drafts", 1, BATCH_MAX_WORKERS, 4)
+    with r2:
+        b_rpm = st.slider("Max requests / min", 10, 300, 60, step=10)
+    with r3:
+        b_regenerate = st.checkbox("♻️ Regenerate", value=False, key="batch_regenerate")
+
+    jobs = [
+        {"country": c, "copy_type": t, "length": l, "preset": p,
+         "label": f"{c} · {t} · {l} · {p}"}
+        for c, t, l, p in product(b_countries, b_types, b_lengths, b_presets)
+    ]
+    st.caption(f"{len(jobs)} drafts in this batch.")
+
+    if st.button("🚀 Generate Batch", disabled=not jobs):
+        if not b_details and not b_hook:
+            st.warning("Please provide a hook or details.")
+        else:
+            brief_obj = {"hook": b_hook, "details": b_details}
+            limiter = RateLimiter(b_rpm)
+
+            def generate_one(job):
+                traits = trait_scores if job["preset"] == "Sidebar settings" else TRAIT_PRESETS[job["preset"]]
+                struct = EMAIL_STRUCT if "Email" in job["copy_type"] else SALES_STRUCT
+                sys_msg = SYSTEM_PROMPT.format(country_rules=COUNTRY_RULES[job["country"]])
+                user_msg = build_prompt(job["copy_type"], struct, traits, brief_obj, job["length"])
+                limiter.wait()
+                return stream_openai(
+                    client,
+                    [
+                        {"role": "system", "content": sys_msg},
+                        {"role": "user", "content": user_msg}
+                    ],
+                    model=OPENAI_MODEL, render=False, label="copywriter_batch",
+                    regenerate=b_regenerate,
+                )
+
+            # Results grid: one card per draft, filled in as each completes
+            grid = st.columns(2)
+            slots = []
+            for i, job in enumerate(jobs):
+                with grid[i % 2].container(border=True):
+                    st.markdown(f"**{job['label']}**")
+                    slots.append(st.empty())
+                    slots[-1].caption("⏳ Queued…")
+            progress = st.progress(0.0, text="Generating drafts…")
+
+            drafts = [None] * len(jobs)
+            with ThreadPoolExecutor(max_workers=b_workers) as pool:
+                futures = {pool.submit(generate_one, job): i for i, job in enumerate(jobs)}
+                for done, fut in enumerate(as_completed(futures), 1):
+                    i = futures[fut]
+                    try:
+                        text, error = fut.result(), None
+                    except Exception as e:
+                        text, error = "", str(e)
+                    drafts[i] = {**jobs[i], "text": text, "error": error}
+                    with slots[i].container(height=300):
+                        if error:
+                            st.error(f"Generation failed: {error}")
+                        else:
+                            st.markdown(text)
+                    progress.progress(done / len(jobs), text=f"{done}/{len(jobs)} drafts ready")
+
+            st.session_state.batch_drafts = drafts
+            st.rerun()
+
+    if st.session_state.batch_drafts:
+        drafts = st.session_state.batch_drafts
+        ok = [d for d in drafts if not d.get("error")]
+        st.divider()
+        st.markdown(f"### Batch Results ({len(ok)}/{len(drafts)})")
+        grid = st.columns(2)
+        for i, d in enumerate(drafts):
+            with grid[i % 2].container(border=True):
+                st.markdown(f"**{d['label']}**")
+                with st.container(height=300):
+                    if d.get("error"):
+                        st.error(f"Generation failed: {d['error']}")
+                    else:
+                        st.markdown(d["text"])
+
+        if len(ok) < len(drafts):
+            st.caption(f"{len(drafts) - len(ok)} failed draft(s) are left out of the downloads.")
+        if ok:
+            e1, e2 = st.columns(2)
+            with e1:
+                st.download_button("⬇️ Combined .docx", docx_bytes(ok), "batch_drafts.docx",
+                                   mime="application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+            with e2:
+                st.download_button("⬇️ Zip (one .docx per draft)", batch_zip_bytes(ok),
+                                   "batch_drafts.zip", mime="application/zip")
@@ -6,7 +6,13 @@ from datetime import datetime
 from pathlib import Path
 from typing import Any, Dict, List, Optional, Tuple
 import streamlit as st
-from utils import apply_branding, configure_openai, configure_gemini
+from utils import apply_branding, configure_openai, configure_gemini, configure_async_openai, run_async
+from llm import stream_openai
+from llm_gateway import LLMError, hedged_json
+from focus_group import extract_json_object, format_transcript, moderator_prompt, run_panel
+from persona_registry import PersonaRegistry
+import persona_synth
+import scoring
 
 # ────────────────────────────────────────────────────────────────────────────────
 # PAGE CONFIG & SETUP
@@ -19,104 +25,50 @@ apply_branding()
 openai_client = configure_openai()
 gemini_client = configure_gemini()
 
-# 2. HELPER FUNCTIONS
-DASH_CHARS = "\u2010\u2011\u2012\u2013\u2014\u2015\u2212"
-
-def normalize_dashes(s: str) -> str:
-    return re.sub(f"[{DASH_CHARS}]", "-", s or "")
-
-def extract_json_object(text: str) -> Optional[dict]:
-    if not text: return None
-    start = text.find("{")
-    end = text.rfind("}")
-    if start == -1 or end == -1 or end <= start: return None
-    blob = text[start : end + 1]
-    try:
-        return json.loads(blob)
-    except Exception:
-        return None
-
-# --- AI WRAPPERS (UPDATED) ---
-def query_openai(messages, model="gpt-4o", temperature=0.7):
-    try:
-        # Use the global client instance
-        resp = openai_client.chat.completions.create(
-            model=model, messages=messages, temperature=temperature
-        )
-        return resp.choices[0].message.content.strip()
-    except Exception as e:
-        return f"Error: {e}"
-
-def query_gemini(prompt):
-    # Try Gemini first if available
-    if gemini_client:
-        try:
-            model = gemini_client.GenerativeModel("gemini-1.5-pro")
-            response = model.generate_content(prompt)
-            return response.text.strip()
-        except Exception as e:
-            st.warning(f"Gemini Error: {e}. Falling back to OpenAI.")
-    
-    # Fallback to OpenAI
-    return query_openai([{"role": "user", "content": prompt}])
+# --- AI WRAPPERS ---
+# With render=True a reply is written token by token into the current
+# container (e.g. the st.status box); the full text is always returned.
+# Identical requests are served from the LLM cache unless regenerate=True.
+# Failures raise llm_gateway.LLMError.
+def query_openai(messages, model="gpt-4o", temperature=0.7, render=False, label="focus_group",
+                 regenerate=False):
+    # Use the global client instance
+    return stream_openai(
+        openai_client, messages, model=model, temperature=temperature,
+        render=render, label=label, regenerate=regenerate,
+    ).strip()
+
+def moderate(transcript, creative, regenerate=False):
+    """Races Gemini (if configured) against OpenAI; returns (analysis JSON text, provider)."""
+    async def _run():
+        async with configure_async_openai() as aclient:
+            return await hedged_json(
+                moderator_prompt(transcript, creative),
+                openai_client=aclient, genai_module=gemini_client, regenerate=regenerate,
+            )
+
+    analysis, provider = run_async(_run())
+    return json.dumps(analysis, ensure_ascii=False), provider
 
 # ────────────────────────────────────────────────────────────────────────────────
 # DATA LOADING
 # ────────────────────────────────────────────────────────────────────────────────
-@st.cache_data
+@st.cache_resource
 def load_personas():
+    # Immutable and shared across sessions: uid / segment / attribute indexes
+    # and pre-rendered system prompts are built once per process.
     root_path = Path("personas.json")
     if not root_path.exists():
-        return [], []
+        return PersonaRegistry()
+    return PersonaRegistry.from_json(root_path)
 
-    with open(root_path, "r", encoding="utf-8") as f:
-        raw = json.load(f)
+registry = load_personas()
 
-    segments = raw.get("segments", [])
-    flat = []
-    for seg in segments:
-        seg_lbl = seg.get("label", "Unknown")
-        for p in seg.get("personas", []):
-            p['segment_label'] = seg_lbl
-            p['uid'] = p['id']
-            flat.append(p)
-    return segments, flat
+@st.cache_resource
+def load_score_store():
+    return scoring.ScoreStore()
 
-segments_data, all_personas_flat = load_personas()
-
-# ────────────────────────────────────────────────────────────────────────────────
-# PROMPT LOGIC
-# ────────────────────────────────────────────────────────────────────────────────
-def build_persona_system_prompt(core):
-    return (
-        f"You are {core.get('name')}, {core.get('age')} years old, {core.get('occupation')}.\n"
-        f"Bio: {core.get('narrative')}\n"
-        f"Values: {', '.join(core.get('values', []))}\n"
-        f"Concerns: {', '.join(core.get('concerns', []))}\n"
-        "Respond in character. Be specific. Keep answers under 140 words."
-    )
-
-def moderator_prompt(transcript, creative):
-    return f"""
-    You are a Direct Response Copy Chief. Analyze this focus group debate.
-    
-    TRANSCRIPT:
-    {transcript}
-    
-    CREATIVE:
-    {creative}
-    
-    Output JSON only:
-    {{
-        "executive_summary": "...",
-        "key_objections": ["..."],
-        "actionable_fixes": ["..."],
-        "rewrite": {{
-            "headline": "...",
-            "body": "..."
-        }}
-    }}
-    """
+score_store = load_score_store()
 
 # ────────────────────────────────────────────────────────────────────────────────
 # UI
@@ -132,50 +84,187 @@ if 'draft_for_validation' in st.session_state:
     default_creative = st.session_state['draft_for_validation']
 
 # 2. INPUTS
-c1, c2, c3 = st.columns(3)
-with c1:
-    p1_uid = st.selectbox("Skeptic", [p['uid'] for p in all_personas_flat], index=0)
-with c2:
-    p2_uid = st.selectbox("Believer", [p['uid'] for p in all_personas_flat], index=1)
-with c3:
-    copy_type = st.selectbox("Format", ["Email", "Ads", "Sales Page"])
+mode = st.radio("Mode", ["Debate (Skeptic vs Believer)", "Panel (many personas)", "Score (A/B)"],
+                horizontal=True)
 
-creative_input = st.text_area("Creative to Test", value=default_creative, height=250)
+if mode.startswith("Debate"):
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        p1_uid = st.selectbox("Skeptic", registry.uids(), index=0)
+    with c2:
+        p2_uid = st.selectbox("Believer", registry.uids(), index=1)
+    with c3:
+        copy_type = st.selectbox("Format", ["Email", "Ads", "Sales Page"])
+else:
+    seg_ids = list(registry.segments)
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        panel_segments = st.multiselect("Segments on the panel", seg_ids, default=seg_ids,
+                                        format_func=lambda s: registry.segments[s].label)
+    with c2:
+        copy_type = st.selectbox("Format", ["Email", "Ads", "Sales Page"])
+    audience = st.radio("Audience", ["Hand-written personas", "Synthetic sample"], horizontal=True)
+    if audience == "Synthetic sample":
+        sc1, sc2 = st.columns(2)
+        with sc1:
+            per_segment = st.number_input("Personas per segment", 1, 50, 3)
+        with sc2:
+            sample_seed = st.number_input("Sample seed", 0, 10_000, 0,
+                                          help="Same seed, same panel – re-runs hit the cache.")
+        if not persona_synth.POPULATION_PATH.exists():
+            st.info("No synthetic population yet – one will be generated from personas.json.")
+            if st.button("Generate population"):
+                with st.spinner("Synthesising personas..."):
+                    persona_synth.synthesize(per_segment=1000)
+                st.rerun()
+            panel = []
+        else:
+            # Reads only the Parquet row groups holding the sampled rows
+            panel = persona_synth.sample_panel(int(per_segment), seed=int(sample_seed),
+                                               segments=panel_segments)
+    else:
+        panel = registry.select(segments=panel_segments)
+    pc1, pc2 = st.columns(2)
+    with pc1:
+        panel_rebuttal = mode.startswith("Panel") and st.checkbox("Rebuttal round", value=True)
+    with pc2:
+        panel_concurrency = st.slider("Parallel requests", 1, 10, 5)
+    st.caption(f"{len(panel)} personas selected.")
+
+if mode.startswith("Score"):
+    creative_input = st.text_area("Creative A (baseline)", value=default_creative, height=180)
+    variant_b = st.text_area("Creative B", height=180)
+    variant_c = st.text_area("Creative C (optional)", height=120)
+else:
+    creative_input = st.text_area("Creative to Test", value=default_creative, height=250)
+regenerate = st.checkbox(
+    "♻️ Regenerate", value=False,
+    help="Re-runs with the same personas and creative are answered from cache. Tick to force fresh responses.",
+)
 
 # 3. RUN LOGIC
-if st.button("🚀 Start Debate", type="primary"):
+if mode.startswith("Panel") and st.button("🚀 Start Panel", type="primary"):
+    if not creative_input:
+        st.warning("Please enter creative text.")
+        st.stop()
+    if not panel:
+        st.warning("Select at least one segment.")
+        st.stop()
+
+    with st.status(f"Running a {len(panel)}-persona panel...", expanded=True) as status:
+        st.write(f"🗣️ Round 1: {len(panel)} personas are reading in parallel...")
+
+        def on_turn(t):
+            if t.error:
+                st.write(f"⚠️ {t.name} ({t.segment}) couldn't respond: {t.error}")
+                return
+            verb = "has spoken" if t.round == 1 else "has replied"
+            st.write(f"✅ {t.name} ({t.segment}) {verb}.")
+
+        async def _panel():
+            async with configure_async_openai() as aclient:
+                return await run_panel(
+                    aclient, panel, creative_input,
+                    concurrency=panel_concurrency, rebuttal=panel_rebuttal,
+                    on_turn=on_turn, regenerate=regenerate,
+                )
+
+        turns = run_async(_panel())
+        if all(t.error for t in turns):
+            status.update(label="Panel failed", state="error")
+            st.error(f"No persona could respond: {turns[0].error}")
+            st.stop()
+
+        st.write("👨‍⚖️ Moderator is analyzing the merged transcript...")
+        transcript = format_transcript(turns)
+        try:
+            mod_analysis, mod_provider = moderate(transcript, creative_input, regenerate=regenerate)
+        except LLMError as e:
+            status.update(label="Moderator failed", state="error")
+            st.error(f"Moderator failed: {e}")
+            st.stop()
+        st.write(f"✅ Moderator answered ({mod_provider}).")
+
+        status.update(label="Validation Complete! Reloading...", state="complete", expanded=False)
+
+    st.session_state.fg_last_run = {
+        "transcript": transcript,
+        "analysis": mod_analysis
+    }
+    st.rerun()
+
+if mode.startswith("Score") and st.button("🚀 Score Creatives", type="primary"):
+    creatives = {cid: text.strip() for cid, text in
+                 (("A", creative_input), ("B", variant_b), ("C", variant_c)) if text.strip()}
+    if not creatives:
+        st.warning("Please enter creative text.")
+        st.stop()
+    if not panel:
+        st.warning("Select at least one segment.")
+        st.stop()
+
+    total = len(creatives) * len(panel)
+    with st.status(f"Collecting {total} ratings...", expanded=False) as status:
+        progress = st.progress(0.0)
+        done = [0]
+
+        def on_rating(r):
+            done[0] += 1
+            progress.progress(min(done[0] / total, 1.0))
+
+        async def _score():
+            async with configure_async_openai() as aclient:
+                return await scoring.score_creatives(
+                    aclient, panel, creatives, concurrency=panel_concurrency,
+                    regenerate=regenerate, on_rating=on_rating,
+                )
+
+        ratings = run_async(_score())
+        run_id = score_store.save_run(creatives, ratings, "gpt-4o", len(panel))
+        status.update(label=f"Scored – {len(ratings)}/{total} ratings", state="complete")
+
+    st.session_state.fg_last_score = {"creatives": creatives, "ratings": ratings, "run_id": run_id}
+    st.rerun()
+
+if mode.startswith("Debate") and st.button("🚀 Start Debate", type="primary"):
     if not creative_input:
         st.warning("Please enter creative text.")
         st.stop()
         
-    p1 = next(p for p in all_personas_flat if p['uid'] == p1_uid)
-    p2 = next(p for p in all_personas_flat if p['uid'] == p2_uid)
+    p1 = registry.get(p1_uid)
+    p2 = registry.get(p2_uid)
     
     # We use st.status to show real-time progress
     with st.status("Running Focus Group Simulation...", expanded=True) as status:
         
-        # Step 1
-        st.write(f"🤔 {p1['core']['name']} (Skeptic) is reading...")
-        sys_1 = build_persona_system_prompt(p1['core']) + "\nSTANCE: Skeptical. Look for flaws."
-        msg_1 = query_openai([
-            {"role": "system", "content": sys_1},
-            {"role": "user", "content": f"Review this creative:\n{creative_input}"}
-        ])
-        st.write("✅ Skeptic has spoken.")
-        
-        # Step 2
-        st.write(f"🤩 {p2['core']['name']} (Believer) is responding...")
-        sys_2 = build_persona_system_prompt(p2['core']) + "\nSTANCE: Optimistic. Look for opportunity."
-        msg_2 = query_openai([
-            {"role": "system", "content": sys_2},
-            {"role": "user", "content": f"Review this creative:\n{creative_input}\n\nThe Skeptic said: {msg_1}\nRespond to them."}
-        ])
-        st.write("✅ Believer has spoken.")
-        
-        # Step 3
-        st.write("👨‍⚖️ Moderator is analyzing the transcript...")
-        transcript = f"{p1['core']['name']}: {msg_1}\n{p2['core']['name']}: {msg_2}"
-        mod_analysis = query_gemini(moderator_prompt(transcript, creative_input))
+        try:
+            # Step 1
+            st.write(f"🤔 {p1.name} (Skeptic) is reading...")
+            sys_1 = p1.system_prompt + "\nSTANCE: Skeptical. Look for flaws."
+            msg_1 = query_openai([
+                {"role": "system", "content": sys_1},
+                {"role": "user", "content": f"Review this creative:\n{creative_input}"}
+            ], render=True, label="skeptic", regenerate=regenerate)
+            st.write("✅ Skeptic has spoken.")
+
+            # Step 2
+            st.write(f"🤩 {p2.name} (Believer) is responding...")
+            sys_2 = p2.system_prompt + "\nSTANCE: Optimistic. Look for opportunity."
+            msg_2 = query_openai([
+                {"role": "system", "content": sys_2},
+                {"role": "user", "content": f"Review this creative:\n{creative_input}\n\nThe Skeptic said: {msg_1}\nRespond to them."}
+            ], render=True, label="believer", regenerate=regenerate)
+            st.write("✅ Believer has spoken.")
+
+            # Step 3
+            st.write("👨‍⚖️ Moderator is analyzing the transcript...")
+            transcript = f"{p1.name}: {msg_1}\n{p2.name}: {msg_2}"
+            mod_analysis, mod_provider = moderate(transcript, creative_input, regenerate=regenerate)
+            st.write(f"✅ Moderator answered ({mod_provider}).")
+        except LLMError as e:
+            status.update(label="Validation failed", state="error")
+            st.error(f"AI call failed: {e}")
+            st.stop()
         
         status.update(label="Validation Complete! Reloading...", state="complete", expanded=False)
 
@@ -187,7 +276,36 @@ if st.button("🚀 Start Debate", type="primary"):
     st.rerun()
 
 # 4. RESULTS DISPLAY
-if st.session_state.fg_last_run:
+last_score = st.session_state.get("fg_last_score")
+if mode.startswith("Score") and last_score:
+    ratings = last_score["ratings"]
+    st.divider()
+    if not ratings:
+        st.error("No ratings came back – check the OpenAI key and try again.")
+    else:
+        st.subheader("Scores (mean ± 95% CI)")
+        summary = scoring.summarize(ratings)
+        st.dataframe(summary, hide_index=True, use_container_width=True)
+
+        # The first creative entered is the baseline (A may have been left blank)
+        baseline = next(iter(last_score["creatives"]))
+        if len(last_score["creatives"]) > 1:
+            st.subheader(f"A/B vs. Creative {baseline} (paired)")
+            try:
+                st.dataframe(scoring.compare(ratings, baseline=baseline), hide_index=True,
+                             use_container_width=True)
+            except ValueError as e:
+                st.warning(f"No paired comparison: {e}.")
+
+        with st.expander("Segment breakdown"):
+            st.dataframe(scoring.segment_breakdown(ratings), use_container_width=True)
+        with st.expander("Individual ratings"):
+            st.dataframe(scoring.ratings_frame(ratings), hide_index=True, use_container_width=True)
+        with st.expander(f"History for Creative {baseline}"):
+            st.dataframe(score_store.history(last_score["creatives"][baseline]),
+                         hide_index=True, use_container_width=True)
+
+if not mode.startswith("Score") and st.session_state.fg_last_run:
     st.divider()
     st.subheader("Debate Transcript")
     st.text(st.session_state.fg_last_run["transcript"])
@@ -0,0 +1,43 @@
+import streamlit as st
+from utils import apply_branding
+import telemetry
+
+# 1. Page Setup
+st.set_page_config(page_title="Admin | Telemetry", page_icon="📈")
+apply_branding()
+
+st.title("📈 Portal Telemetry")
+st.markdown("### where does the time (and money) go?")
+
+if not telemetry.ENABLED:
+    st.warning("Telemetry is switched off for this process (PORTAL_TELEMETRY=0).")
+
+days = st.slider("Window (days)", 1, 30, 7)
+spans = telemetry.load_spans(days)
+
+if spans.empty:
+    st.info("No spans recorded in this window yet.")
+    st.stop()
+
+# 2. Latency per stage
+st.subheader("Latency by stage")
+st.dataframe(telemetry.stage_stats(spans), hide_index=True, use_container_width=True)
+
+# 3. Spend
+st.subheader("Daily LLM cost")
+cost = telemetry.daily_cost(spans)
+if cost.empty:
+    st.caption("No completions with token usage in this window.")
+else:
+    c1, c2, c3 = st.columns(3)
+    c1.metric("Total spend", f"${cost['cost_usd'].sum():.2f}")
+    c2.metric("Tokens in", f"{int(cost['tokens_in'].sum()):,}")
+    c3.metric("Tokens out", f"{int(cost['tokens_out'].sum()):,}")
+    st.bar_chart(cost.pivot_table(index="day", columns="model", values="cost_usd", aggfunc="sum"))
+    st.dataframe(cost, hide_index=True, use_container_width=True)
+
+# 4. Raw spans
+with st.expander("🔎 Slowest spans"):
+    stage = st.selectbox("Stage", sorted(spans["stage"].unique()))
+    slow = spans[spans["stage"] == stage].nlargest(25, "duration_ms")
+    st.dataframe(slow.drop(columns=["stage"]), hide_index=True, use_container_width=True)
@@ -0,0 +1,170 @@
+"""
+persona_registry.py
+-------------------
+Indexed, immutable persona store for the focus group.
+
+Personas are loaded once into slotted, frozen dataclasses with their
+system prompt rendered up front. Lookups by uid, segment and attribute
+(age band, risk tolerance, location) are dictionary hits, so selecting
+and rendering a panel stays O(1) per persona however large the registry
+grows (e.g. thousands of synthetic personas).
+"""
+
+import json
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+from focus_group import build_persona_system_prompt
+
+PERSONAS_PATH = Path("personas.json")
+
+AGE_BANDS = ((18, 24), (25, 34), (35, 49), (50, 64), (65, 200))
+INDEXED_ATTRS = ("age_band", "risk_tolerance", "location")
+
+
+# ---------------------------------------------------------------------
+# Normalisers
+# ---------------------------------------------------------------------
+def age_band(age: Optional[int]) -> str:
+    if not isinstance(age, (int, float)):
+        return "unknown"
+    for lo, hi in AGE_BANDS:
+        if lo <= age <= hi:
+            return f"{lo}+" if hi >= 200 else f"{lo}–{hi}"
+    return "under 18"
+
+
+def risk_band(text: str) -> str:
+    """'Low-to-Moderate; seeks growth…' → 'low-moderate', 'Moderately-High (…)' → 'moderate-high'."""
+    head = re.split(r"[;(]", text or "", maxsplit=1)[0].strip().lower()
+    words = re.findall(r"low|moderate|high", head)
+    return "-".join(dict.fromkeys(words)) or "unknown"
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+# ---------------------------------------------------------------------
+# Records
+# ---------------------------------------------------------------------
+@dataclass(frozen=True, slots=True)
+class Segment:
+    id: str
+    label: str
+    summary: str = ""
+
+
+@dataclass(frozen=True, slots=True, eq=False)
+class Persona:
+    uid: str
+    segment_id: str
+    segment_label: str
+    name: str
+    age: Optional[int]
+    age_band: str
+    risk_tolerance: str
+    location: str
+    system_prompt: str
+    core: Mapping[str, Any]
+
+    @classmethod
+    def from_record(cls, record: dict, segment: Segment) -> "Persona":
+        core = record.get("core", {})
+        return cls(
+            uid=record["id"],
+            segment_id=segment.id,
+            segment_label=segment.label,
+            name=core.get("name", record["id"]),
+            age=core.get("age"),
+            age_band=age_band(core.get("age")),
+            risk_tolerance=risk_band(core.get("behavioural_traits", {}).get("risk_tolerance", "")),
+            location=(core.get("location") or "unknown").split(",")[0].strip(),
+            system_prompt=build_persona_system_prompt(core),
+            core=_freeze(core),
+        )
+
+
+# ---------------------------------------------------------------------
+# Registry
+# ---------------------------------------------------------------------
+class PersonaRegistry:
+    def __init__(self, segments: Iterable[Segment] = (), personas: Iterable[Persona] = ()):
+        self.segments: Dict[str, Segment] = {s.id: s for s in segments}
+        self._by_uid: Dict[str, Persona] = {}
+        self._by_segment: Dict[str, List[str]] = defaultdict(list)
+        self._by_attr: Dict[str, Dict[str, List[str]]] = {a: defaultdict(list) for a in INDEXED_ATTRS}
+        for p in personas:
+            self.add(p)
+
+    @classmethod
+    def from_json(cls, path: Path = PERSONAS_PATH) -> "PersonaRegistry":
+        with open(path, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        reg = cls()
+        for seg in raw.get("segments", []):
+            segment = Segment(seg["id"], seg.get("label", "Unknown"), seg.get("summary", ""))
+            reg.segments[segment.id] = segment
+            for record in seg.get("personas", []):
+                reg.add(Persona.from_record(record, segment))
+        return reg
+
+    def add(self, persona: Persona) -> None:
+        if persona.uid in self._by_uid:
+            raise ValueError(f"Duplicate persona uid: {persona.uid}")
+        self._by_uid[persona.uid] = persona
+        self._by_segment[persona.segment_id].append(persona.uid)
+        for attr in INDEXED_ATTRS:
+            self._by_attr[attr][getattr(persona, attr)].append(persona.uid)
+
+    # --- lookups ---
+    def get(self, uid: str) -> Persona:
+        return self._by_uid[uid]
+
+    def __contains__(self, uid: str) -> bool:
+        return uid in self._by_uid
+
+    def __len__(self) -> int:
+        return len(self._by_uid)
+
+    def __iter__(self) -> Iterator[Persona]:
+        return iter(self._by_uid.values())
+
+    def uids(self) -> List[str]:
+        return list(self._by_uid)
+
+    def segment(self, segment_id: str) -> List[Persona]:
+        return [self._by_uid[u] for u in self._by_segment.get(segment_id, ())]
+
+    def values(self, attr: str) -> Tuple[str, ...]:
+        """Distinct values of an indexed attribute, e.g. values('age_band')."""
+        return tuple(self._by_attr[attr])
+
+    def where(self, **attrs: str) -> List[Persona]:
+        """Personas matching every indexed attribute given, e.g. where(risk_tolerance='low')."""
+        if not attrs:
+            return list(self)
+        lists = sorted((self._by_attr[a].get(v, []) for a, v in attrs.items()), key=len)
+        others = [set(l) for l in lists[1:]]
+        return [self._by_uid[u] for u in lists[0] if all(u in o for o in others)]
+
+    def select(self, segments: Optional[Iterable[str]] = None,
+               uids: Optional[Iterable[str]] = None) -> List[Persona]:
+        """
+        Union of whole segments and individual uids. Passing neither means
+        everyone; an empty selection means no one.
+        """
+        if segments is None and uids is None:
+            return list(self)
+        segments, uids = list(segments or []), list(uids or [])
+        chosen = dict.fromkeys(u for s in segments for u in self._by_segment.get(s, ()))
+        chosen.update(dict.fromkeys(u for u in uids if u in self._by_uid))
+        return [self._by_uid[u] for u in chosen]
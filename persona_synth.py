@@ -0,0 +1,298 @@
+"""
+persona_synth.py
+----------------
+Synthetic audience generator for the focus group.
+
+Learns per-segment attribute distributions from the hand-written personas
+in personas.json (age, income, risk tolerance, values, concerns, goals,
+occupation, location …), generates large panels deterministically from a
+seed, and stores them as a segment-sorted Parquet file.
+
+Validation draws a stratified sample of N personas per segment by reading
+only the Parquet row groups that hold the sampled rows, so the full
+population never has to be loaded into memory.
+
+    python persona_synth.py --per-segment 2000 --seed 7
+"""
+
+import argparse
+import json
+import re
+from collections import Counter
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from persona_registry import PERSONAS_PATH, Persona, Segment
+
+POPULATION_PATH = Path(".cache") / "synthetic_personas.parquet"
+ROW_GROUP_SIZE  = 2048
+LIST_FIELDS     = ("values", "concerns", "goals", "personality_traits")
+CATEGORICAL     = ("occupation", "education", "marital_status", "location",
+                   "risk_tolerance", "investment_experience", "decision_making", "gender")
+
+FIRST_NAMES = {
+    "male":   ["James", "Oliver", "Noah", "Jack", "William", "Lucas", "Henry", "Thomas",
+               "Ethan", "Samuel", "Daniel", "Ryan", "Arjun", "Wei", "Mohammed", "Luca",
+               "Peter", "Graham", "Stephen", "Kevin"],
+    "female": ["Charlotte", "Olivia", "Amelia", "Isla", "Mia", "Grace", "Chloe", "Sophie",
+               "Priya", "Mei", "Aisha", "Sofia", "Hannah", "Zoe", "Ruth", "Helen",
+               "Susan", "Karen", "Joanne", "Leah"],
+}
+LAST_NAMES = ["Smith", "Jones", "Williams", "Brown", "Wilson", "Taylor", "Nguyen", "Johnson",
+              "Martin", "White", "Anderson", "Walker", "Thompson", "Kelly", "Chen", "Patel",
+              "Singh", "Ryan", "Murphy", "Lee", "Harris", "Clarke", "Roberts", "O'Brien"]
+
+
+# ---------------------------------------------------------------------
+# Learned distributions
+# ---------------------------------------------------------------------
+@dataclass
+class SegmentModel:
+    segment: Segment
+    age_range: tuple
+    age_mean: float
+    age_std: float
+    log_income_mean: float
+    log_income_std: float
+    categorical: Dict[str, Counter] = field(default_factory=dict)
+    items: Dict[str, Counter] = field(default_factory=dict)
+    list_len: Dict[str, List[int]] = field(default_factory=dict)
+
+
+def _age_range(label: str, ages: List[int]) -> tuple:
+    """'(18–24 years)' → (18, 24); '(65+ years)' → (65, 90)."""
+    m = re.search(r"(\d+)\s*[–-]\s*(\d+)", label)
+    if m:
+        return int(m.group(1)), int(m.group(2))
+    m = re.search(r"(\d+)\s*\+", label)
+    if m:
+        return int(m.group(1)), 90
+    return (min(ages) - 5, max(ages) + 5) if ages else (18, 90)
+
+
+def learn_models(path: Path = PERSONAS_PATH) -> List[SegmentModel]:
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+
+    models = []
+    for seg in raw.get("segments", []):
+        segment = Segment(seg["id"], seg.get("label", "Unknown"), seg.get("summary", ""))
+        records = seg.get("personas", [])
+        cores = [p.get("core", {}) for p in records]
+        ages = [c["age"] for c in cores if isinstance(c.get("age"), (int, float))]
+        incomes = [c["income"] for c in cores if isinstance(c.get("income"), (int, float)) and c["income"] > 0]
+        lo, hi = _age_range(segment.label, ages)
+
+        model = SegmentModel(
+            segment=segment,
+            age_range=(lo, hi),
+            age_mean=float(np.mean(ages)) if ages else (lo + hi) / 2,
+            # Two personas per segment can't pin down a spread; floor it at a quarter of the band
+            age_std=max(float(np.std(ages)) if ages else 0.0, (hi - lo) / 4),
+            log_income_mean=float(np.mean(np.log(incomes))) if incomes else np.log(80000),
+            log_income_std=max(float(np.std(np.log(incomes))) if incomes else 0.0, 0.25),
+        )
+        for name in CATEGORICAL:
+            model.categorical[name] = Counter(
+                v for v in (_categorical_value(p, name) for p in records) if v
+            )
+        for name in LIST_FIELDS:
+            model.items[name] = Counter(item for c in cores for item in c.get(name, []))
+            model.list_len[name] = [len(c.get(name, [])) for c in cores if c.get(name)]
+        models.append(model)
+    return models
+
+
+def _categorical_value(record: dict, name: str) -> Optional[str]:
+    core = record.get("core", {})
+    if name == "gender":
+        return record.get("gender")
+    if name in ("risk_tolerance", "investment_experience"):
+        return core.get("behavioural_traits", {}).get(name)
+    return core.get(name)
+
+
+# ---------------------------------------------------------------------
+# Generation
+# ---------------------------------------------------------------------
+def _pick(rng: np.random.Generator, counts: Counter, default: str = "") -> str:
+    if not counts:
+        return default
+    keys = list(counts)
+    weights = np.fromiter(counts.values(), dtype=float)
+    return keys[rng.choice(len(keys), p=weights / weights.sum())]
+
+
+def _pick_many(rng: np.random.Generator, counts: Counter, lengths: List[int]) -> List[str]:
+    if not counts:
+        return []
+    keys = list(counts)
+    k = min(len(keys), int(rng.choice(lengths)) if lengths else 3)
+    weights = np.fromiter(counts.values(), dtype=float) + 0.5  # smooth so rare items still appear
+    idx = rng.choice(len(keys), size=k, replace=False, p=weights / weights.sum())
+    return [keys[i] for i in idx]
+
+
+def _narrative(row: dict, segment: Segment) -> str:
+    return (
+        f"{row['name']} is a {row['age']}-year-old {row['occupation'].lower() or 'professional'} "
+        f"in {row['location']} earning about ${row['income']:,} a year. "
+        f"{segment.summary} They describe their risk appetite as "
+        f"'{row['risk_tolerance'].split(';')[0]}', care most about "
+        f"{', '.join(row['values'][:2]).lower() or 'financial security'}, and worry about "
+        f"{(row['concerns'][0] if row['concerns'] else 'making the wrong call').lower()}."
+    )
+
+
+def generate_segment(model: SegmentModel, n: int, seed: int, seg_index: int) -> Dict[str, list]:
+    # Seeded per segment so one segment's output doesn't depend on the others
+    rng = np.random.default_rng([seed, seg_index])
+    lo, hi = model.age_range
+    ages = np.clip(np.rint(rng.normal(model.age_mean, model.age_std, n)), lo, hi).astype(int)
+    incomes = np.rint(np.exp(rng.normal(model.log_income_mean, model.log_income_std, n)) / 1000) * 1000
+
+    cols: Dict[str, list] = {k: [] for k in (
+        "uid", "segment_id", "segment_label", "name", "age", "income", *CATEGORICAL,
+        *LIST_FIELDS, "narrative",
+    )}
+    for i in range(n):
+        row = {name: _pick(rng, model.categorical[name]) for name in CATEGORICAL}
+        gender = row["gender"] if row["gender"] in FIRST_NAMES else ("male", "female")[i % 2]
+        row.update(
+            uid=f"syn_{model.segment.id}_{i:06d}",
+            segment_id=model.segment.id,
+            segment_label=model.segment.label,
+            name=f"{FIRST_NAMES[gender][rng.integers(len(FIRST_NAMES[gender]))]} "
+                 f"{LAST_NAMES[rng.integers(len(LAST_NAMES))]}",
+            age=int(ages[i]),
+            income=int(incomes[i]),
+            gender=gender,
+            **{f: _pick_many(rng, model.items[f], model.list_len[f]) for f in LIST_FIELDS},
+        )
+        row["narrative"] = _narrative(row, model.segment)
+        for k in cols:
+            cols[k].append(row[k])
+    return cols
+
+
+def synthesize(per_segment: int, seed: int = 0, path: Path = POPULATION_PATH,
+               source: Path = PERSONAS_PATH) -> Path:
+    """Generates `per_segment` personas for every segment and writes them to Parquet."""
+    models = learn_models(source)
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    ranges, start, writer = {}, 0, None
+    try:
+        for seg_index, model in enumerate(models):
+            table = pa.table(generate_segment(model, per_segment, seed, seg_index))
+            # Dictionary-encode repetitive text columns to keep the file compact
+            for name in ("segment_id", "segment_label", *CATEGORICAL):
+                idx = table.schema.get_field_index(name)
+                table = table.set_column(idx, name, table.column(name).dictionary_encode())
+            if writer is None:
+                meta = {b"synth": json.dumps({"seed": seed, "per_segment": per_segment}).encode()}
+                writer = pq.ParquetWriter(path, table.schema.with_metadata(meta), compression="zstd")
+            writer.write_table(table, row_group_size=ROW_GROUP_SIZE)
+            ranges[model.segment.id] = {"label": model.segment.label,
+                                        "summary": model.segment.summary,
+                                        "start": start, "stop": start + per_segment}
+            start += per_segment
+    finally:
+        if writer is not None:
+            writer.close()
+
+    # Segment row ranges live in a sidecar so samplers can plan reads from metadata alone
+    path.with_suffix(".segments.json").write_text(json.dumps(ranges, indent=2))
+    return path
+
+
+# ---------------------------------------------------------------------
+# Sampling
+# ---------------------------------------------------------------------
+def population_segments(path: Path = POPULATION_PATH) -> Dict[str, dict]:
+    sidecar = Path(path).with_suffix(".segments.json")
+    return json.loads(sidecar.read_text()) if sidecar.exists() else {}
+
+
+def sample_rows(path: Path, n_per_segment: int, seed: int = 0,
+                segments: Optional[Iterable[str]] = None) -> List[dict]:
+    """
+    Stratified sample: `n_per_segment` rows from each segment, chosen with a
+    seeded RNG. Only the row groups that contain sampled rows are read.
+    `segments=None` samples every segment; an empty list samples none.
+    """
+    ranges = population_segments(path)
+    wanted = list(ranges) if segments is None else list(segments)
+    rng = np.random.default_rng(seed)
+
+    rows = []
+    for seg_id in wanted:
+        r = ranges.get(seg_id)
+        if r:
+            size = r["stop"] - r["start"]
+            picks = rng.choice(size, size=min(n_per_segment, size), replace=False) + r["start"]
+            rows.extend(int(x) for x in np.sort(picks))
+
+    pf = pq.ParquetFile(path)
+    bounds = np.cumsum([0] + [pf.metadata.row_group(i).num_rows for i in range(pf.num_row_groups)])
+    by_group: Dict[int, List[int]] = {}
+    for row in rows:
+        g = int(np.searchsorted(bounds, row, side="right")) - 1
+        by_group.setdefault(g, []).append(row - int(bounds[g]))
+
+    out = []
+    for g, offsets in sorted(by_group.items()):
+        out.extend(pf.read_row_group(g).take(offsets).to_pylist())
+    return out
+
+
+def row_to_persona(row: dict) -> Persona:
+    segment = Segment(row["segment_id"], row["segment_label"])
+    core = {
+        "name": row["name"],
+        "age": row["age"],
+        "location": row["location"],
+        "education": row["education"],
+        "occupation": row["occupation"],
+        "income": row["income"],
+        "marital_status": row["marital_status"],
+        "values": row["values"],
+        "concerns": row["concerns"],
+        "goals": row["goals"],
+        "personality_traits": row["personality_traits"],
+        "decision_making": row["decision_making"],
+        "narrative": row["narrative"],
+        "behavioural_traits": {
+            "risk_tolerance": row["risk_tolerance"],
+            "investment_experience": row["investment_experience"],
+        },
+    }
+    return Persona.from_record({"id": row["uid"], "gender": row["gender"], "core": core}, segment)
+
+
+def sample_panel(n_per_segment: int, seed: int = 0, segments: Optional[Iterable[str]] = None,
+                 path: Path = POPULATION_PATH) -> List[Persona]:
+    return [row_to_persona(r) for r in sample_rows(path, n_per_segment, seed, segments)]
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Generate a synthetic persona population.")
+    ap.add_argument("--per-segment", type=int, default=1000)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("-o", "--output", type=Path, default=POPULATION_PATH)
+    ap.add_argument("--source", type=Path, default=PERSONAS_PATH)
+    args = ap.parse_args()
+
+    path = synthesize(args.per_segment, args.seed, args.output, args.source)
+    print(f"Wrote {args.per_segment} personas × {len(population_segments(path))} segments "
+          f"to {path} ({path.stat().st_size / 1024:.0f} KiB)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+scoring.py
+----------
+Quantitative creative scoring across a persona panel.
+
+Each persona rates each creative on a fixed set of 1–10 metrics through
+structured outputs (a strict JSON schema), so the replies can be stacked
+into a NumPy array instead of parsed out of prose. From there we get
+per-creative means with 95% confidence intervals, segment breakdowns and
+paired A/B differences (every persona rates every creative, so variants
+are compared persona by persona).
+
+Runs are persisted to SQLite so a creative's scores can be tracked over
+time.
+"""
+
+import asyncio
+import bisect
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from focus_group import extract_json_object
+from llm_gateway import LLMError, chat
+
+# ---------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------
+METRICS = ("clarity", "trust", "urgency", "intent_to_click")
+SCALE   = (1, 10)
+DB_PATH = Path(".cache") / "scores.sqlite"
+
+RATING_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "creative_rating",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                **{m: {"type": "integer"} for m in METRICS},
+                "comment": {"type": "string"},
+            },
+            "required": [*METRICS, "comment"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Two-sided 95% t critical values, used when scipy isn't installed. An
+# untabulated df takes the next smaller row (a slightly wider interval).
+_T95 = {1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571, 6: 2.447, 7: 2.365, 8: 2.306,
+        9: 2.262, 10: 2.228, 11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131,
+        16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086, 21: 2.080, 22: 2.074,
+        23: 2.069, 24: 2.064, 25: 2.060, 26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045,
+        30: 2.042, 40: 2.021, 50: 2.009, 60: 2.000, 80: 1.990, 100: 1.984, 120: 1.980}
+_T95_DF = sorted(_T95)
+
+
+def scoring_prompt(creative: str) -> str:
+    lo, hi = SCALE
+    return (
+        f"Read this creative as yourself:\n{creative}\n\n"
+        f"Rate it from {lo} (very poor) to {hi} (excellent) on:\n"
+        "- clarity: how easy it is to understand what is being offered\n"
+        "- trust: how credible and honest it feels to you\n"
+        "- urgency: how much it makes you want to act now\n"
+        "- intent_to_click: how likely you are to click through\n"
+        "Add a one-sentence comment explaining your ratings. Reply in JSON."
+    )
+
+
+@dataclass
+class Rating:
+    creative_id: str
+    uid: str
+    name: str
+    segment: str
+    scores: Dict[str, int]
+    comment: str
+
+
+# ---------------------------------------------------------------------
+# Collection
+# ---------------------------------------------------------------------
+def _parse_rating(text: str) -> Optional[dict]:
+    data = extract_json_object(text)
+    if not data:
+        return None
+    lo, hi = SCALE
+    try:
+        scores = {m: int(np.clip(int(data[m]), lo, hi)) for m in METRICS}
+    except (KeyError, TypeError, ValueError):
+        return None
+    return {"scores": scores, "comment": str(data.get("comment", ""))}
+
+
+async def _rate(client, sem: asyncio.Semaphore, persona, creative: str, model: str,
+                temperature: float, regenerate: bool) -> Optional[dict]:
+    messages = [
+        {"role": "system", "content": persona.system_prompt},
+        {"role": "user", "content": scoring_prompt(creative)},
+    ]
+    async with sem:
+        try:
+            text = await chat(client, messages, model, regenerate=regenerate,
+                              cache_if=_parse_rating, temperature=temperature,
+                              response_format=RATING_SCHEMA)
+        except LLMError as e:
+            print(f"[scoring] {persona.uid}: {e}")
+            return None
+    return _parse_rating(text)
+
+
+async def score_creatives(client, personas, creatives: Dict[str, str],
+                          concurrency: int = 8, model: str = "gpt-4o",
+                          temperature: float = 0.7, regenerate: bool = False,
+                          on_rating: Optional[Callable[[Rating], None]] = None) -> List[Rating]:
+    """
+    Every persona rates every creative (`creatives` maps an id such as 'A'
+    to its text), at most `concurrency` requests in flight. Failed or
+    unparseable ratings are dropped.
+    """
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(cid, text, p):
+        parsed = await _rate(client, sem, p, text, model, temperature, regenerate)
+        if parsed is None:
+            return None
+        r = Rating(cid, p.uid, p.name, p.segment_label, parsed["scores"], parsed["comment"])
+        if on_rating:
+            on_rating(r)
+        return r
+
+    results = await asyncio.gather(*(
+        one(cid, text, p) for cid, text in creatives.items() for p in personas
+    ))
+    return [r for r in results if r is not None]
+
+
+# ---------------------------------------------------------------------
+# Aggregation
+# ---------------------------------------------------------------------
+@lru_cache(maxsize=1)
+def _student_t():
+    try:
+        from scipy.stats import t
+        return t
+    except Exception:
+        return None
+
+
+def t_critical(df: int) -> float:
+    """Two-sided 95% critical value of Student's t with `df` degrees of freedom."""
+    if df <= 0:
+        return float("nan")
+    t = _student_t()
+    if t is not None:
+        return float(t.ppf(0.975, df))
+    return _T95[_T95_DF[bisect.bisect_right(_T95_DF, df) - 1]]
+
+
+def _mean_ci(x: np.ndarray) -> tuple:
+    """Column means and 95% CI half-widths of an (n, metrics) array."""
+    n = x.shape[0]
+    mean = x.mean(axis=0)
+    if n < 2:
+        return mean, np.full_like(mean, np.nan)
+    half = t_critical(n - 1) * x.std(axis=0, ddof=1) / np.sqrt(n)
+    return mean, half
+
+
+def ratings_frame(ratings: List[Rating]) -> pd.DataFrame:
+    return pd.DataFrame([
+        {"creative_id": r.creative_id, "uid": r.uid, "name": r.name, "segment": r.segment,
+         **r.scores, "comment": r.comment}
+        for r in ratings
+    ])
+
+
+def summarize(ratings: List[Rating]) -> pd.DataFrame:
+    """One row per creative: n, then mean and ±CI for each metric."""
+    df = ratings_frame(ratings)
+    rows = []
+    for cid, grp in df.groupby("creative_id", sort=False):
+        mean, half = _mean_ci(grp[list(METRICS)].to_numpy(dtype=float))
+        row = {"creative_id": cid, "n": len(grp)}
+        for m, mu, h in zip(METRICS, mean, half):
+            row[m] = round(float(mu), 2)
+            row[f"{m}_ci"] = round(float(h), 2)
+        rows.append(row)
+    return pd.DataFrame(rows)
+
+
+def segment_breakdown(ratings: List[Rating]) -> pd.DataFrame:
+    """Mean score per creative × segment × metric."""
+    df = ratings_frame(ratings)
+    return df.groupby(["creative_id", "segment"], sort=False)[list(METRICS)].mean().round(2)
+
+
+def compare(ratings: List[Rating], baseline: str) -> pd.DataFrame:
+    """
+    Paired differences of every other creative against `baseline`, using
+    only personas who rated both. A difference whose CI excludes zero is
+    flagged significant. Raises ValueError if `baseline` has no ratings.
+    """
+    df = ratings_frame(ratings)
+    if baseline not in set(df.get("creative_id", ())):
+        raise ValueError(f"baseline creative '{baseline}' has no ratings")
+    wide = df.pivot_table(index="uid", columns="creative_id", values=list(METRICS))
+    rows = []
+    for cid in df["creative_id"].unique():
+        if cid == baseline:
+            continue
+        for m in METRICS:
+            pair = wide[m][[baseline, cid]].dropna().to_numpy(dtype=float)
+            if len(pair) == 0:
+                continue
+            diff = pair[:, 1] - pair[:, 0]
+            mean, half = _mean_ci(diff[:, None])
+            lo, hi = float(mean[0] - half[0]), float(mean[0] + half[0])
+            rows.append({
+                "creative_id": cid, "metric": m, "n": len(diff),
+                "diff": round(float(mean[0]), 2), "ci_low": round(lo, 2), "ci_high": round(hi, 2),
+                "significant": bool(len(diff) > 1 and (lo > 0 or hi < 0)),
+            })
+    return pd.DataFrame(rows)
+
+
+# ---------------------------------------------------------------------
+# Persistence
+# ---------------------------------------------------------------------
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id      TEXT PRIMARY KEY,
+    created_at  REAL NOT NULL,
+    model       TEXT NOT NULL,
+    panel_size  INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS creatives (
+    run_id       TEXT NOT NULL,
+    creative_id  TEXT NOT NULL,
+    text_hash    TEXT NOT NULL,
+    text         TEXT NOT NULL,
+    PRIMARY KEY (run_id, creative_id)
+);
+CREATE INDEX IF NOT EXISTS idx_creatives_hash ON creatives(text_hash);
+CREATE TABLE IF NOT EXISTS ratings (
+    run_id           TEXT NOT NULL,
+    creative_id      TEXT NOT NULL,
+    uid              TEXT NOT NULL,
+    segment          TEXT NOT NULL,
+    clarity          INTEGER NOT NULL,
+    trust            INTEGER NOT NULL,
+    urgency          INTEGER NOT NULL,
+    intent_to_click  INTEGER NOT NULL,
+    comment          TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_ratings_run ON ratings(run_id, creative_id);
+"""
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+
+class ScoreStore:
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def save_run(self, creatives: Dict[str, str], ratings: List[Rating],
+                 model: str, panel_size: int) -> str:
+        run_id = uuid.uuid4().hex[:12]
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO runs VALUES (?, ?, ?, ?)",
+                               (run_id, time.time(), model, panel_size))
+            self._conn.executemany(
+                "INSERT INTO creatives VALUES (?, ?, ?, ?)",
+                [(run_id, cid, text_hash(text), text) for cid, text in creatives.items()],
+            )
+            self._conn.executemany(
+                f"INSERT INTO ratings VALUES (?, ?, ?, ?, {', '.join('?' * len(METRICS))}, ?)",
+                [(run_id, r.creative_id, r.uid, r.segment, *(r.scores[m] for m in METRICS), r.comment)
+                 for r in ratings],
+            )
+        return run_id
+
+    def history(self, text: str) -> pd.DataFrame:
+        """Per-run mean scores for a creative (matched on whitespace-normalised text)."""
+        means = ", ".join(f"AVG(r.{m}) AS {m}" for m in METRICS)
+        with self._lock:
+            return pd.read_sql_query(
+                f"SELECT datetime(u.created_at, 'unixepoch') AS run_at, u.run_id, u.model, "
+                f"COUNT(*) AS n, {means} "
+                "FROM creatives c JOIN runs u USING (run_id) "
+                "JOIN ratings r ON r.run_id = c.run_id AND r.creative_id = c.creative_id "
+                "WHERE c.text_hash = ? GROUP BY u.run_id ORDER BY u.created_at",
+                self._conn, params=(text_hash(text),),
+            )
+
+    def recent_runs(self, limit: int = 20) -> pd.DataFrame:
+        with self._lock:
+            return pd.read_sql_query(
+                "SELECT datetime(u.created_at, 'unixepoch') AS run_at, u.run_id, u.model, "
+                "u.panel_size, GROUP_CONCAT(c.creative_id, ', ') AS creatives "
+                "FROM runs u JOIN creatives c USING (run_id) "
+                "GROUP BY u.run_id ORDER BY u.created_at DESC LIMIT ?",
+                self._conn, params=(limit,),
+            )
+
+    def close(self) -> None:
+        self._conn.close()
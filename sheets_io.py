@@ -0,0 +1,135 @@
+"""
+sheets_io.py
+------------
+Batched Google Sheets reads and writes for the briefing pipeline.
+
+All tabs go out in at most three API calls regardless of how many
+worksheets are touched: one metadata read, one structural batch_update
+(add / resize tabs) and one values_batch_update. Reads fetch every
+requested tab with a single values_batch_get.
+"""
+
+from typing import Dict, Iterable, List, Sequence, Tuple
+import pandas as pd
+from gspread.utils import rowcol_to_a1
+from telemetry import span
+
+# (header, rows) for a single worksheet
+TabData = Tuple[List[str], List[List]]
+
+# Last values written per (spreadsheet id, tab title), used by diff mode.
+_SNAPSHOTS: Dict[Tuple[str, str], List[List]] = {}
+
+
+def _quote(title: str) -> str:
+    return "'" + title.replace("'", "''") + "'"
+
+
+def _a1(title: str, first_row: int, last_row: int, n_cols: int) -> str:
+    return f"{_quote(title)}!A{first_row}:{rowcol_to_a1(last_row, max(n_cols, 1))}"
+
+
+def _changed_runs(old: Sequence[List], new: Sequence[List]) -> List[Tuple[int, int]]:
+    """Returns [start, end) index runs of rows in `new` that differ from `old`."""
+    runs, start = [], None
+    for i, row in enumerate(new):
+        same = i < len(old) and list(old[i]) == list(row)
+        if not same and start is None:
+            start = i
+        elif same and start is not None:
+            runs.append((start, i))
+            start = None
+    if start is not None:
+        runs.append((start, len(new)))
+    return runs
+
+
+def write_tabs(spreadsheet, tabs: Dict[str, TabData], diff: bool = False) -> None:
+    """
+    Replaces the contents of each worksheet in `tabs`, creating missing tabs
+    and resizing existing ones to fit. With `diff=True`, only rows that
+    changed since this process last wrote the tab are sent.
+    """
+    with span("sheets_write", tabs=len(tabs), diff=diff) as sp:
+        _write_tabs(spreadsheet, tabs, diff, sp)
+
+
+def _write_tabs(spreadsheet, tabs: Dict[str, TabData], diff: bool, sp) -> None:
+    meta = spreadsheet.fetch_sheet_metadata(params={"fields": "sheets.properties"})
+    existing = {s["properties"]["title"]: s["properties"] for s in meta.get("sheets", [])}
+
+    structural, data, written = [], [], {}
+    for title, (header, rows) in tabs.items():
+        values = [list(header)] + [list(r) for r in rows]
+        n_rows, n_cols = len(values), len(header)
+        props = existing.get(title)
+        key = (spreadsheet.id, title)
+
+        if props is None:
+            structural.append({"addSheet": {"properties": {
+                "title": title,
+                "gridProperties": {"rowCount": n_rows, "columnCount": n_cols},
+            }}})
+            _SNAPSHOTS.pop(key, None)
+        else:
+            grid = props.get("gridProperties", {})
+            if grid.get("rowCount") != n_rows or grid.get("columnCount") != n_cols:
+                structural.append({"updateSheetProperties": {
+                    "properties": {
+                        "sheetId": props["sheetId"],
+                        "gridProperties": {"rowCount": n_rows, "columnCount": n_cols},
+                    },
+                    "fields": "gridProperties(rowCount,columnCount)",
+                }})
+
+        previous = _SNAPSHOTS.get(key)
+        if diff and previous is not None and previous and len(previous[0]) == n_cols:
+            for start, end in _changed_runs(previous, values):
+                data.append({"range": _a1(title, start + 1, end, n_cols),
+                             "values": values[start:end]})
+        else:
+            data.append({"range": _a1(title, 1, n_rows, n_cols), "values": values})
+        written[key] = values
+
+    sp.set(ranges=len(data), cells=sum(len(d["values"]) * len(d["values"][0]) for d in data if d["values"]))
+    try:
+        if structural:
+            spreadsheet.batch_update({"requests": structural})
+        if data:
+            spreadsheet.values_batch_update({
+                "valueInputOption": "USER_ENTERED",
+                "data": data,
+            })
+    except Exception:
+        # The sheet may hold a partial write; the next export sends whole tabs
+        for key in written:
+            _SNAPSHOTS.pop(key, None)
+        raise
+    _SNAPSHOTS.update(written)
+
+
+def _to_frame(values: List[List]) -> pd.DataFrame:
+    if not values:
+        return pd.DataFrame()
+    header, rows = values[0], values[1:]
+    # The API drops trailing empty cells, so pad ragged rows to the header width
+    width = len(header)
+    rows = [list(r[:width]) + [""] * (width - len(r)) for r in rows]
+    return pd.DataFrame(rows, columns=header)
+
+
+def tabs_to_frames(tabs: Dict[str, TabData]) -> Dict[str, pd.DataFrame]:
+    """Builds DataFrames straight from in-memory (header, rows) tab data."""
+    return {title: _to_frame([header] + rows) for title, (header, rows) in tabs.items()}
+
+
+def read_tabs(spreadsheet, titles: Iterable[str]) -> Dict[str, pd.DataFrame]:
+    """Reads several worksheets (header row + records) in one values_batch_get."""
+    titles = list(titles)
+    with span("sheets_read", tabs=len(titles)):
+        resp = spreadsheet.values_batch_get(
+            [_quote(t) for t in titles],
+            params={"valueRenderOption": "UNFORMATTED_VALUE"},
+        )
+    ranges = resp.get("valueRanges", [])
+    return {t: _to_frame(r.get("values", [])) for t, r in zip(titles, ranges)}
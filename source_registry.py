@@ -0,0 +1,151 @@
+"""
+source_registry.py
+------------------
+Markets and the SerpAPI queries behind each market's briefing, loaded
+from sources.json.
+
+A market defines its locale (gl / hl / google_domain / location), the
+News and Top Stories queries, the Google Trends topics, and where its
+briefing is exported (spreadsheet_id; null means no Sheets export).
+A query may be a plain string or an object whose extra keys override
+the default SerpAPI parameters. Only enabled markets are scraped.
+
+The "serpapi" block sets the budget shared by every query of every
+market in a refresh: requests per minute and requests in flight.
+"""
+
+import json
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+SOURCES_PATH = Path(__file__).resolve().parent / "sources.json"
+KINDS = ("news", "top_stories", "trends")
+
+
+@dataclass(frozen=True)
+class Query:
+    market: str
+    kind: str        # news | top_stories | trends
+    params: dict     # SerpAPI parameters, without api_key
+
+    @property
+    def label(self) -> str:
+        return f"{self.market}/{self.kind}: {self.params.get('q')}"
+
+
+@dataclass(frozen=True)
+class Market:
+    id: str
+    name: str
+    demonym: str
+    index_name: str
+    timezone: str
+    locale: dict
+    spreadsheet_id: Optional[str] = None
+    enabled: bool = True
+    news: Tuple = ()
+    top_stories: Tuple = ()
+    trends: Tuple = ()
+
+    def queries(self) -> List[Query]:
+        """Every SerpAPI request for this market, with the engine's default parameters."""
+        loc = self.locale
+        out = []
+        for q in self.news:
+            out.append(Query(self.id, "news", {
+                "engine": "google", "no_cache": "true", "google_domain": loc.get("google_domain"),
+                "tbs": "qdr:d", "gl": loc.get("gl"), "hl": loc.get("hl"),
+                "location": loc.get("location"), "tbm": "nws", "num": "40", **q,
+            }))
+        for q in self.top_stories:
+            out.append(Query(self.id, "top_stories", {"hl": loc.get("hl"), "gl": loc.get("gl"), **q}))
+        for q in self.trends:
+            out.append(Query(self.id, "trends", {
+                "engine": "google_trends", "geo": (loc.get("gl") or "").upper(),
+                "data_type": "RELATED_QUERIES", "tz": "0", "date": "now 4-H", **q,
+            }))
+        return out
+
+
+@dataclass(frozen=True)
+class Registry:
+    markets: Tuple[Market, ...]
+    requests_per_minute: float = 60
+    max_in_flight: int = 6
+    by_id: Dict[str, Market] = field(default_factory=dict, compare=False)
+
+    def enabled(self) -> List[Market]:
+        return [m for m in self.markets if m.enabled]
+
+    def get(self, market_id: str) -> Market:
+        try:
+            return self.by_id[market_id]
+        except KeyError:
+            raise KeyError(f"unknown market '{market_id}' (known: {', '.join(self.by_id)})") from None
+
+    @property
+    def default(self) -> Market:
+        """The first enabled market: the one single-market callers get."""
+        enabled = self.enabled()
+        return enabled[0] if enabled else self.markets[0]
+
+
+def _queries(raw, market_id: str, kind: str) -> Tuple:
+    out = []
+    for q in raw or []:
+        q = {"q": q} if isinstance(q, str) else dict(q)
+        if not q.get("q"):
+            raise ValueError(f"{market_id}/{kind}: every query needs a 'q'")
+        out.append(q)
+    return tuple(out)
+
+
+def parse_registry(data: dict) -> Registry:
+    markets = []
+    for raw in data.get("markets") or []:
+        mid = raw.get("id")
+        if not mid:
+            raise ValueError("every market needs an 'id'")
+        markets.append(Market(
+            id=mid,
+            name=raw.get("name", mid),
+            demonym=raw.get("demonym", raw.get("name", mid)),
+            index_name=raw["index_name"],
+            timezone=raw.get("timezone", "UTC"),
+            locale=dict(raw.get("locale") or {}),
+            spreadsheet_id=raw.get("spreadsheet_id"),
+            enabled=bool(raw.get("enabled", True)),
+            **{kind: _queries(raw.get(kind), mid, kind) for kind in KINDS},
+        ))
+    if not markets:
+        raise ValueError("sources.json defines no markets")
+    by_id = {}
+    for m in markets:
+        if m.id in by_id:
+            raise ValueError(f"duplicate market id '{m.id}'")
+        by_id[m.id] = m
+    budget = data.get("serpapi") or {}
+    return Registry(tuple(markets), float(budget.get("requests_per_minute", 60)),
+                    int(budget.get("max_in_flight", 6)), by_id)
+
+
+_cached: Dict[Path, Tuple[float, Registry]] = {}
+_cached_lock = threading.Lock()
+
+
+def load_registry(path: Path = SOURCES_PATH) -> Registry:
+    """Parsed sources.json, re-read only when the file changes."""
+    path = Path(path)
+    mtime = path.stat().st_mtime
+    with _cached_lock:
+        hit = _cached.get(path)
+        if hit is None or hit[0] != mtime:
+            hit = (mtime, parse_registry(json.loads(path.read_text(encoding="utf-8"))))
+            _cached[path] = hit
+        return hit[1]
+
+
+def default_market() -> Market:
+    return load_registry().default
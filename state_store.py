@@ -0,0 +1,379 @@
+"""
+state_store.py
+--------------
+Local SQLite state for the briefing pipeline: run history, timestamps,
+summaries, per-source scraped payloads and prompt token stats.
+
+The cooldown is an atomic compare-and-set: `try_begin_run` takes SQLite's
+write lock (BEGIN IMMEDIATE), checks the last finished run and any run
+still in progress, and only then inserts a new 'running' row. Two
+sessions or processes asking at once get exactly one winner, and the
+check is a local read instead of a round trip to the Metadata tab.
+Sheets is only an export target, written after the fact.
+
+Articles are fingerprinted (normalised URL, plus a title hash to spot
+edits) with first-seen / last-seen times, so a run can tell which items
+are new or changed since the previous one. They are recorded when a run
+finishes, so a failed run doesn't mark anything as seen.
+
+Each market (see source_registry) has its own runs, cooldown and article
+history; rows from before markets existed belong to DEFAULT_MARKET.
+"""
+
+import datetime as dt
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from meta_cache import normalize_url
+
+DB_PATH         = Path(".cache") / "state.sqlite"
+STALE_RUNNING_S = 30 * 60  # a 'running' row older than this is from a crashed process
+DEFAULT_MARKET  = "au"
+
+_ARTICLES_TABLE = """
+CREATE TABLE IF NOT EXISTS articles (
+    market          TEXT NOT NULL,
+    fingerprint     TEXT NOT NULL,       -- sha1 of the normalised URL
+    url             TEXT NOT NULL,
+    source          TEXT NOT NULL,
+    title           TEXT NOT NULL,
+    title_hash      TEXT NOT NULL,
+    first_seen      REAL NOT NULL,
+    last_seen       REAL NOT NULL,
+    first_run_id    INTEGER NOT NULL,
+    last_run_id     INTEGER NOT NULL,
+    changed_run_id  INTEGER,             -- last run in which the title changed
+    PRIMARY KEY (market, fingerprint)
+);
+CREATE INDEX IF NOT EXISTS idx_articles_runs ON articles(first_run_id, changed_run_id);
+"""
+
+_SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS runs (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at   REAL NOT NULL,
+    finished_at  REAL,
+    status       TEXT NOT NULL,          -- running | done | failed | imported
+    summary      TEXT,
+    token_stats  TEXT,                   -- JSON
+    error        TEXT,
+    exported_at  REAL,
+    export_error TEXT,
+    market       TEXT NOT NULL DEFAULT '{DEFAULT_MARKET}'
+);
+CREATE INDEX IF NOT EXISTS idx_runs_status ON runs(status, finished_at);
+CREATE TABLE IF NOT EXISTS payloads (
+    run_id   INTEGER NOT NULL REFERENCES runs(id),
+    source   TEXT NOT NULL,
+    payload  TEXT NOT NULL,              -- JSON {{"header": [...], "rows": [[...]]}}
+    PRIMARY KEY (run_id, source)
+);
+{_ARTICLES_TABLE}"""
+
+# Stores created before markets existed: runs gain a market column and
+# articles are rebuilt keyed on (market, fingerprint).
+_MIGRATE_ARTICLES = f"""
+BEGIN;
+DROP INDEX IF EXISTS idx_articles_runs;
+ALTER TABLE articles RENAME TO articles_v1;
+{_ARTICLES_TABLE}
+INSERT INTO articles SELECT '{DEFAULT_MARKET}', * FROM articles_v1;
+DROP TABLE articles_v1;
+COMMIT;
+"""
+
+_RUN_COLUMNS = "id, started_at, finished_at, status, summary, token_stats, error, exported_at, market"
+
+
+@dataclass
+class RunRecord:
+    id: int
+    started_at: dt.datetime
+    finished_at: Optional[dt.datetime]
+    status: str
+    summary: str
+    token_stats: dict
+    error: Optional[str] = None
+    exported_at: Optional[dt.datetime] = None
+    market: str = DEFAULT_MARKET
+
+
+def url_fingerprint(url: str) -> str:
+    return hashlib.sha1(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def title_hash(title: str) -> str:
+    return hashlib.sha1(re.sub(r"\s+", " ", (title or "").strip().lower()).encode("utf-8")).hexdigest()[:16]
+
+
+def _ts(value: Optional[float]) -> Optional[dt.datetime]:
+    return dt.datetime.fromtimestamp(value, dt.timezone.utc) if value is not None else None
+
+
+class StateStore:
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        # Autocommit mode so BEGIN IMMEDIATE is ours to issue
+        self._conn = sqlite3.connect(self.path, check_same_thread=False,
+                                     isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._migrate()
+        self._conn.executescript(_SCHEMA)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_market ON runs(market, status, finished_at)")
+
+    def _columns(self, table: str) -> set:
+        return {row[1] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+
+    def _migrate(self) -> None:
+        if "market" not in self._columns("runs") and self._columns("runs"):
+            self._conn.execute(
+                f"ALTER TABLE runs ADD COLUMN market TEXT NOT NULL DEFAULT '{DEFAULT_MARKET}'"
+            )
+        if "market" not in self._columns("articles") and self._columns("articles"):
+            self._conn.executescript(_MIGRATE_ARTICLES)
+
+    # --- cooldown (compare-and-set) ---
+    def try_begin_run(self, cooldown_s: float, market: str = DEFAULT_MARKET,
+                      stale_running_s: float = STALE_RUNNING_S) -> Optional[int]:
+        """
+        Atomically claims the next run of `market`. Returns the new run id,
+        or None if that market's last run finished less than `cooldown_s`
+        ago or another of its runs is still in progress.
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE runs SET status = 'failed', error = 'abandoned' "
+                    "WHERE status = 'running' AND started_at < ?", (now - stale_running_s,)
+                )
+                running = self._conn.execute(
+                    "SELECT 1 FROM runs WHERE status = 'running' AND market = ? LIMIT 1", (market,)
+                ).fetchone()
+                last = self._conn.execute(
+                    "SELECT MAX(finished_at) FROM runs WHERE status IN ('done', 'imported') AND market = ?",
+                    (market,),
+                ).fetchone()[0]
+                if running or (last is not None and now - last < cooldown_s):
+                    self._conn.execute("COMMIT")
+                    return None
+                run_id = self._conn.execute(
+                    "INSERT INTO runs (started_at, status, market) VALUES (?, 'running', ?)", (now, market)
+                ).lastrowid
+                self._conn.execute("COMMIT")
+                return run_id
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def is_running(self, market: Optional[str] = None) -> bool:
+        """Whether a run of `market` (of any market if None) is in progress."""
+        sql = "SELECT 1 FROM runs WHERE status = 'running' AND started_at >= ?"
+        params: tuple = (time.time() - STALE_RUNNING_S,)
+        if market is not None:
+            sql, params = sql + " AND market = ?", params + (market,)
+        with self._lock:
+            return self._conn.execute(sql + " LIMIT 1", params).fetchone() is not None
+
+    # --- run lifecycle ---
+    def finish_run(self, run_id: int, summary: str, token_stats: Optional[dict] = None,
+                   articles: Iterable[Tuple[str, str, str]] = (),
+                   market: str = DEFAULT_MARKET) -> None:
+        """
+        Marks the run done and, in the same transaction, records the
+        (source, url, title) `articles` it summarised (see classify_articles).
+        """
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.execute(
+                    "UPDATE runs SET status = 'done', finished_at = ?, summary = ?, token_stats = ? "
+                    "WHERE id = ?",
+                    (time.time(), summary, json.dumps(token_stats or {}), run_id),
+                )
+                self._record_articles(run_id, articles, market)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def fail_run(self, run_id: int, error: str) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE runs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                (time.time(), error, run_id),
+            )
+
+    def mark_exported(self, run_id: int, error: Optional[str] = None) -> None:
+        with self._lock:
+            self._conn.execute(
+                "UPDATE runs SET exported_at = ?, export_error = ? WHERE id = ?",
+                (time.time(), error, run_id),
+            )
+
+    def import_run(self, finished_at: dt.datetime, summary: str, market: str = DEFAULT_MARKET) -> int:
+        """Seeds the history with a briefing produced elsewhere (e.g. the old Metadata tab)."""
+        ts = finished_at.timestamp()
+        with self._lock:
+            return self._conn.execute(
+                "INSERT INTO runs (started_at, finished_at, status, summary, exported_at, market) "
+                "VALUES (?, ?, 'imported', ?, ?, ?)", (ts, ts, summary, ts, market),
+            ).lastrowid
+
+    # --- payloads ---
+    def save_payloads(self, run_id: int, tabs: Dict[str, tuple]) -> None:
+        records = [(run_id, title, json.dumps({"header": header, "rows": rows}, ensure_ascii=False))
+                   for title, (header, rows) in tabs.items()]
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO payloads (run_id, source, payload) VALUES (?, ?, ?)", records
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def payloads(self, run_id: int) -> Dict[str, tuple]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, payload FROM payloads WHERE run_id = ?", (run_id,)
+            ).fetchall()
+        out = {}
+        for source, payload in rows:
+            data = json.loads(payload)
+            out[source] = (data["header"], data["rows"])
+        return out
+
+    # --- article fingerprints ---
+    @staticmethod
+    def _unique_articles(articles: Iterable[Tuple[str, str, str]]):
+        keyed = [(url_fingerprint(url), (source, url, title)) for source, url, title in articles]
+        items: Dict[str, tuple] = {}
+        for fp, item in keyed:
+            items.setdefault(fp, item)  # first occurrence wins
+        return keyed, items
+
+    def _known_titles(self, fps: List[str], market: str) -> Dict[str, str]:
+        known = {}
+        for i in range(0, len(fps), 500):
+            chunk = fps[i:i + 500]
+            known.update(self._conn.execute(
+                f"SELECT fingerprint, title_hash FROM articles "
+                f"WHERE market = ? AND fingerprint IN ({', '.join('?' * len(chunk))})",
+                [market, *chunk],
+            ).fetchall())
+        return known
+
+    def classify_articles(self, articles: Iterable[Tuple[str, str, str]],
+                          market: str = DEFAULT_MARKET) -> Dict[str, str]:
+        """
+        Returns {url: 'new' | 'changed' | 'seen'} for (source, url, title)
+        items relative to `market`'s finished runs. Read-only: the items
+        are recorded by finish_run, so a failed run leaves the history as
+        it was.
+        """
+        keyed, items = self._unique_articles(articles)
+        with self._lock:
+            known = self._known_titles(list(items), market)
+        status = {}
+        for fp, (_, url, title) in items.items():
+            if fp not in known:
+                status[url] = "new"
+            else:
+                status[url] = "changed" if known[fp] != title_hash(title) else "seen"
+        # Variants of the same URL (tracking params etc.) share its status
+        for fp, (_, url, _) in keyed:
+            status.setdefault(url, status[items[fp][1]])
+        return status
+
+    def _record_articles(self, run_id: int, articles: Iterable[Tuple[str, str, str]],
+                         market: str) -> None:
+        # Caller holds the lock and an open transaction
+        now = time.time()
+        _, items = self._unique_articles(articles)
+        known = self._known_titles(list(items), market)
+        for fp, (source, url, title) in items.items():
+            th = title_hash(title)
+            if fp not in known:
+                self._conn.execute(
+                    "INSERT INTO articles VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                    (market, fp, url, source, title, th, now, now, run_id, run_id),
+                )
+            elif known[fp] != th:
+                self._conn.execute(
+                    "UPDATE articles SET title = ?, title_hash = ?, last_seen = ?, "
+                    "last_run_id = ?, changed_run_id = ? WHERE market = ? AND fingerprint = ?",
+                    (title, th, now, run_id, run_id, market, fp),
+                )
+            else:
+                self._conn.execute(
+                    "UPDATE articles SET last_seen = ?, last_run_id = ? "
+                    "WHERE market = ? AND fingerprint = ?",
+                    (now, run_id, market, fp),
+                )
+
+    def new_articles(self, run_id: int) -> List[dict]:
+        """Articles first seen, or retitled, in `run_id`."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT source, title, url, first_run_id = ? FROM articles "
+                "WHERE first_run_id = ? OR changed_run_id = ? ORDER BY source, rowid",
+                (run_id, run_id, run_id),
+            ).fetchall()
+        return [{"source": r[0], "title": r[1], "url": r[2], "status": "new" if r[3] else "changed"}
+                for r in rows]
+
+    # --- reads ---
+    def _record(self, row) -> RunRecord:
+        return RunRecord(
+            id=row[0], started_at=_ts(row[1]), finished_at=_ts(row[2]), status=row[3],
+            summary=row[4] or "", token_stats=json.loads(row[5] or "{}"),
+            error=row[6], exported_at=_ts(row[7]), market=row[8],
+        )
+
+    def latest(self, market: str = DEFAULT_MARKET) -> Optional[RunRecord]:
+        """The most recent successful briefing of `market`."""
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {_RUN_COLUMNS} FROM runs WHERE status IN ('done', 'imported') AND market = ? "
+                "ORDER BY finished_at DESC LIMIT 1", (market,)
+            ).fetchone()
+        return self._record(row) if row else None
+
+    def history(self, limit: int = 20, market: Optional[str] = None) -> List[RunRecord]:
+        """Most recent runs first, of `market` (of every market if None)."""
+        where, params = ("WHERE market = ? ", (market,)) if market is not None else ("", ())
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {_RUN_COLUMNS} FROM runs {where}ORDER BY started_at DESC LIMIT ?",
+                params + (limit,),
+            ).fetchall()
+        return [self._record(r) for r in rows]
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+_shared: Optional[StateStore] = None
+_shared_lock = threading.Lock()
+
+
+def get_store() -> StateStore:
+    """Process-wide store instance."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = StateStore()
+        return _shared
@@ -1,70 +1,235 @@
-import streamlit as st
-from openai import OpenAI
-import gspread
 import pandas as pd
+import numpy as np
 import time
 import datetime as dt
-import pytz
-from google.oauth2.service_account import Credentials
-
-# Define the scope for Google Sheets
-scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-
-# Load the service account info from Streamlit secrets
-creds_dict = st.secrets["service_account"]
-creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
-client_gs = gspread.authorize(creds)
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+from briefing_format import BRIEFING_SCHEMA, summary_markdown
+from llm import stream_openai
+from meta_cache import is_placeholder
+from near_dupes import cluster, cluster_sizes
+from sheets_io import read_tabs, tabs_to_frames
+from source_registry import default_market
+from telemetry import span
+from utils import configure_openai, get_spreadsheet
 
 # Spreadsheet ID
 spreadsheet_id = "1BzTJgX7OgaA0QNfzKs5AgAx2rvZZjDdorgAz0SD9NZg"
-sheet = client_gs.open_by_key(spreadsheet_id)
 
-# Initialize OpenAI Client
-client = OpenAI(api_key=st.secrets["openai"]["api_key"])
+# NOTE: Nothing here touches secrets or the network at import time. The
+# Sheets and OpenAI clients are created on first use and shared process-wide
+# through utils.
 
+# Worksheets written by the news engine, in prompt order
+SOURCE_TABS = ["Google News", "Top Stories", "Google Trends Rising", "Google Trends Top"]
 
-def read_data(sheet, title):
-    """Reads data from a specified Google Sheet worksheet into a pandas DataFrame."""
-    worksheet = sheet.worksheet(title)
-    data = worksheet.get_all_records()
-    return pd.DataFrame(data)
+# Prompt-token budget per source. Rows past the budget are dropped in rank
+# order (SerpAPI order); 0 means no limit.
+PROMPT_BUDGETS = {
+    "Google News":          4000,
+    "Top Stories":          3000,
+    "Google Trends Rising": 600,
+    "Google Trends Top":    600,
+}
+SNIPPET_CHARS  = 300          # snippets are clipped to this before budgeting
+TOKEN_ENCODING = "o200k_base" # gpt-4o tokenizer
 
+# Near-duplicate articles (e.g. one wire story on several outlets) reach
+# the prompt once, with a coverage count; see near_dupes. 0 disables.
+CLUSTER_THRESHOLD = 0.5
+ARTICLE_SOURCES = ("Google News", "Top Stories")
 
-def format_data_for_prompt(news_data, top_stories_data, rising_data, top_data):
+
+def read_data(sheet, source_tabs=None):
     """
-    Formats data from four different sources (news, top stories, trends rising, trends top)
-    into a single string for the prompt.
+    Returns the four source DataFrames, in SOURCE_TABS order.
+    If `source_tabs` ({title: (header, rows)}) is given, e.g. straight from
+    the scraper in the same process, the sheet isn't read at all; otherwise
+    all four tabs are fetched in one batched request.
+    """
+    if source_tabs is not None:
+        frames = tabs_to_frames(source_tabs)
+    else:
+        frames = read_tabs(sheet, SOURCE_TABS)
+    return [frames.get(title, pd.DataFrame()) for title in SOURCE_TABS]
+
+
+@dataclass
+class PromptData:
+    """Rendered prompt data plus a per-source token report."""
+    text: str
+    tokens: Dict[str, int] = field(default_factory=dict)
+    rows_kept: Dict[str, int] = field(default_factory=dict)
+    rows_dropped: Dict[str, int] = field(default_factory=dict)
+    rows_merged: Dict[str, int] = field(default_factory=dict)
+
+    @property
+    def total_tokens(self) -> int:
+        return count_tokens(self.text)
+
+    def report(self) -> str:
+        parts = [
+            f"{src}: {self.tokens[src]} tok, {self.rows_kept[src]} rows"
+            + (f" (-{self.rows_dropped[src]})" if self.rows_dropped[src] else "")
+            + (f" ({self.rows_merged[src]} merged)" if self.rows_merged.get(src) else "")
+            for src in self.tokens
+        ]
+        return f"Prompt data {self.total_tokens} tokens | " + " | ".join(parts)
+
+
+@lru_cache(maxsize=1)
+def _encoder():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TOKEN_ENCODING)
+    except Exception:
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """tiktoken count when available, otherwise a ~4 chars/token estimate."""
+    enc = _encoder()
+    if enc is not None:
+        return len(enc.encode(text, disallowed_special=()))
+    return -(-len(text) // 4)
+
+
+def _count_many(lines: List[str]) -> np.ndarray:
+    enc = _encoder()
+    if enc is not None:
+        return np.fromiter((len(t) for t in enc.encode_batch(lines, disallowed_special=())),
+                           dtype=np.int64, count=len(lines))
+    return -(-np.fromiter(map(len, lines), dtype=np.int64, count=len(lines)) // 4)
+
+
+def _col(df: pd.DataFrame, name: str, max_chars: int = 0) -> pd.Series:
+    col = df[name].fillna("").astype(str) if name in df else pd.Series("", index=df.index)
+    if max_chars:
+        clipped = col.str.len() > max_chars
+        col = col.where(~clipped, col.str.slice(0, max_chars).str.rstrip() + "…")
+    return col
+
+
+def _render_section(df: pd.DataFrame, fields: List[str], budget: int) -> Tuple[List[str], int]:
+    """
+    Renders one "- Field: value, ..." line per row (column-wise, no
+    iterrows) and keeps rows in rank order until `budget` tokens are used.
     """
-    formatted_data = "Google News Data:\n"
-    for index, row in news_data.iterrows():
-        formatted_data += f"- Title: {row.get('Title', '')}, Link: {row.get('Link', '')}, Snippet: {row.get('Snippet', '')}\n"
+    if df.empty:
+        return [], 0
+    line = "- " + f"{fields[0]}: " + _col(df, fields[0], SNIPPET_CHARS)
+    for f in fields[1:]:
+        line = line + f", {f}: " + _col(df, f, SNIPPET_CHARS if f == "Snippet" else 0)
+    if "Coverage" in df:
+        line = line + df["Coverage"].map(lambda n: f", Coverage: {n} articles" if n > 1 else "")
+    lines = line.tolist()
+    used = np.cumsum(_count_many([l + "\n" for l in lines]))
+    keep = int(np.searchsorted(used, budget, side="right")) if budget else len(lines)
+    return lines[:keep], int(used[keep - 1]) if keep else 0
 
-    formatted_data += "\nTop Stories Data:\n"
-    for index, row in top_stories_data.iterrows():
-        formatted_data += f"- Title: {row.get('Title', '')}, Link: {row.get('Link', '')}, Snippet: {row.get('Snippet', '')}\n"
 
-    formatted_data += "\nGoogle Trends Rising Data:\n"
-    for index, row in rising_data.iterrows():
-        formatted_data += f"- Query: {row.get('Query', '')}, Value: {row.get('Value', '')}\n"
+def cluster_articles(frames: List[pd.DataFrame], only_links=None,
+                     threshold: float = CLUSTER_THRESHOLD) -> Tuple[List[pd.DataFrame], List[int]]:
+    """
+    Collapses near-duplicate articles across the article frames (title,
+    snippet and meta description compared together, placeholders such as
+    "HTTP 403" left out). Each story keeps one row, its first copy in frame
+    order, with a "Coverage" column counting every copy across all frames.
+    Also returns how many rows of each frame were merged into another.
+
+    With `only_links`, only stories with at least one of those links are
+    kept (an incremental run), still counted against every article.
+    """
+    sizes = [len(df) for df in frames]
+    if not sum(sizes):
+        return frames, [0] * len(frames)
+    combined = pd.concat(frames, ignore_index=True)
+    fields = []
+    for name in ("Title", "Snippet", "Meta Description"):
+        col = _col(combined, name)
+        fields.append(col.where(~col.map(is_placeholder), ""))
+    texts = fields[0] + " " + fields[1] + " " + fields[2]
+    labels = cluster(texts.tolist(), threshold)
+    first_copy = ~pd.Series(labels).duplicated().to_numpy()
+    coverage = cluster_sizes(labels)
+    wanted = None
+    if only_links is not None:
+        links = _col(combined, "Link")
+        wanted = set(labels[links.isin(only_links).to_numpy()])
+
+    out, merged, start = [], [], 0
+    for df, n in zip(frames, sizes):
+        lab = labels[start:start + n]
+        keep = first_copy[start:start + n].copy()
+        merged.append(int(n - keep.sum()))
+        if wanted is not None:
+            keep &= np.isin(lab, list(wanted))
+        kept = df.loc[keep].copy()
+        kept["Coverage"] = coverage[start:start + n][keep]
+        out.append(kept)
+        start += n
+    return out, merged
 
-    formatted_data += "\nGoogle Trends Top Data:\n"
-    for index, row in top_data.iterrows():
-        formatted_data += f"- Query: {row.get('Query', '')}, Value: {row.get('Value', '')}\n"
 
-    return formatted_data
+def format_data_for_prompt(news_data, top_stories_data, rising_data, top_data,
+                           budgets: Optional[Dict[str, int]] = None,
+                           only_links=None) -> PromptData:
+    """
+    Formats data from four different sources (news, top stories, trends rising, trends top)
+    into a single prompt string, trimming each source to its token budget.
+    Near-duplicate articles are merged first (see cluster_articles; pass
+    `only_links` to keep just the stories touching those links). Rows are
+    kept in source rank order; long snippets are clipped first.
+    """
+    budgets = {**PROMPT_BUDGETS, **(budgets or {})}
+    merged = {}
+    if CLUSTER_THRESHOLD or only_links is not None:
+        (news_data, top_stories_data), counts = cluster_articles([news_data, top_stories_data], only_links)
+        merged = dict(zip(ARTICLE_SOURCES, counts))
+    sections = [
+        ("Google News",          "Google News Data",         news_data,        ["Title", "Link", "Snippet"]),
+        ("Top Stories",          "Top Stories Data",         top_stories_data, ["Title", "Link", "Snippet"]),
+        ("Google Trends Rising", "Google Trends Rising Data", rising_data,      ["Query", "Value"]),
+        ("Google Trends Top",    "Google Trends Top Data",    top_data,         ["Query", "Value"]),
+    ]
+    out = PromptData(text="")
+    blocks = []
+    for source, heading, df, fields in sections:
+        lines, used = _render_section(df, fields, budgets.get(source, 0))
+        blocks.append(f"{heading}:\n" + "".join(l + "\n" for l in lines))
+        out.tokens[source] = used
+        out.rows_kept[source] = len(lines)
+        out.rows_dropped[source] = len(df) - len(lines)
+        out.rows_merged[source] = merged.get(source, 0)
+    out.text = "\n".join(blocks)
+    return out
 
 
-def summarize_data(formatted_data):
+def summarize_data(formatted_data, stream=False, carry_over=None, incremental=False, market=None):
     """
     Summarize data using the new OpenAI v1.0+ client structure.
+    The reply is JSON in the briefing_format schema; parse it with
+    briefing_format.parse_briefing. With `stream=True` the raw reply is
+    rendered token by token into the current Streamlit container.
+
+    `carry_over` is a digest of the previous briefing (see
+    briefing_format.carry_over_digest); with `incremental=True` the data
+    holds only articles that are new or changed since that briefing.
+
+    `market` (a source_registry.Market, the default market if None) sets
+    the publisher's country, the index and the local date.
     """
-    local_tz = pytz.timezone("Australia/Sydney")
-    now_local = dt.datetime.now(local_tz)
+    market = market or default_market()
+    now_local = dt.datetime.now(ZoneInfo(market.timezone))
     current_date = now_local.strftime("%Y-%m-%d")
+    article = "an" if market.demonym[:1].lower() in "aeiou" else "a"
+    publisher = f"{article} {market.demonym} financial news publisher"
 
     # System-like context for the prompt
     system_like_context = (
-        "You are a seasoned financial news editor for an Australian financial news publisher. "
+        f"You are a seasoned financial news editor for {publisher}. "
         "Your responsibilities include analyzing financial data and news sources to identify "
         "key trends, notable events, and opportunities for in-depth reporting. "
         "You provide insightful summaries and detailed briefs to help financial journalists "
@@ -76,43 +241,47 @@ def summarize_data(formatted_data):
 
     # Instructions for the summarization
     instructions = (
-        f"As a news editor for an Australian financial news publisher, your task is to analyze "
-        f"and summarize the latest data from various sources related to the Australian stock market. "
+        f"As a news editor for {publisher}, your task is to analyze "
+        f"and summarize the latest data from various sources related to the {market.demonym} stock market. "
         f"Your goal is to identify key trends, recurring themes, and interesting opportunities for "
         f"our financial journalists to cover.\n\n"
         f"Using the provided data, please perform the following tasks:\n"
         f"1. Analyze the \"Google Trends Rising\" data to identify the top 10 rising search queries, "
         f"paying special attention to high-volume queries and those marked as 'Breakout'.\n"
         f"2. Analyze the \"Google Trends Top\" data to identify the top search queries.\n"
-        f"3. Review the articles from \"Google News\" to identify recurring themes and notable entities.\n"
-        f"4. Review the articles from \"Top Stories\" for the query \"ASX 200\" to identify significant news stories.\n\n"
-        f"Please include the following sections in your report using plain text with single asterisks (*) for bold text. "
-        f"Use lines of hyphens (\"-\" repeated) to create horizontal lines as separators before and after major sections "
-        f"and brief titles. Do not use Markdown headers or `###`.\n\n"
-        f"Include the date of summarization ({current_date}) in your report.\n\n"
-        f"The report should have the following structure:\n\n"
-        f"--------------------------------------------------\n"
-        f"*Summary of Findings [{current_date}]*\n"
-        f"--------------------------------------------------\n"
-        f"*Google Trends Insights*: List the top 10 trends from the \"Google Trends Rising\" data, along with their volumes.\n\n"
-        f"*Key Trends & Recurring Themes*: Identify the top 5 trends with brief descriptions and their volumes.\n\n"
-        f"*Notable Entities*: List key companies, institutions, and market insights discussed in the data.\n\n"
-        f"--------------------------------------------------\n"
-        f"*5 Detailed Briefs for Journalists*\n"
-        f"--------------------------------------------------\n\n"
-        f"For each brief, use the following structure, separated by horizontal lines:\n\n"
-        f"--------------------------------------------------\n"
-        f"*Brief Title*\n"
-        f"--------------------------------------------------\n"
-        f"1. *Synopsis*: Brief summary of the findings.\n"
-        f"2. *Key Themes*: Main themes identified in the data.\n"
-        f"3. *Entities*: Relevant companies, indexes, or key individuals.\n"
-        f"4. *Source Insights*: Data sources these insights come from.\n"
-        f"5. *Suggested Angles*: Recommended angles for journalists to pursue.\n\n"
-        f"Include emojis at the beginning of important sections to visually highlight them. "
-        f"Do not use Markdown headers or `###`.\n"
+        f"3. Review the articles from \"Google News\" to identify recurring themes and notable entities. "
+        f"An article marked \"Coverage: N articles\" stands for N near-identical reports across "
+        f"outlets in Google News and Top Stories; count it once, but treat wide coverage as a sign "
+        f"of importance.\n"
+        f"4. Review the articles from \"Top Stories\" for the query \"{market.index_name}\" to identify significant news stories. "
+        f"A story already listed under \"Google News\" is not repeated here; its coverage count "
+        f"includes its Top Stories copies.\n\n"
+        f"Return the report as JSON matching the provided schema (no prose outside the JSON):\n"
+        f"- \"date\": the date of summarization ({current_date}).\n"
+        f"- \"trends\": the top 10 trends from the \"Google Trends Rising\" data, each with its "
+        f"query and volume (use 'Breakout' where marked).\n"
+        f"- \"key_themes\": the top 5 trends or recurring themes, each with a brief description "
+        f"and its volume.\n"
+        f"- \"notable_entities\": key companies, institutions, and market insights discussed in the data.\n"
+        f"- \"briefs\": 5 detailed briefs for journalists. Each brief has a \"title\", a "
+        f"\"synopsis\" (brief summary of the findings), \"themes\" (main themes identified in the "
+        f"data), \"entities\" (relevant companies, indexes, or key individuals), \"sources\" (data "
+        f"sources these insights come from) and \"angles\" (recommended angles for journalists to pursue).\n"
+        f"  Set \"is_new\" to true when a brief is driven by developments not covered by the previous "
+        f"briefing (always true if no previous briefing is given).\n"
+        f"Keep each list item short and self-contained. Do not use Markdown inside the JSON values.\n"
     )
 
+    if carry_over:
+        instructions += (
+            f"\n{carry_over}\n\n"
+            + ("The news and top stories below are only the articles that are NEW or CHANGED since "
+               "that briefing. Lead with what is new; carry a previous brief forward (with "
+               "\"is_new\": false) only if it is still among the most important stories.\n"
+               if incremental else
+               "Use it only to decide which briefs are new.\n")
+        )
+
     # Combine context, instructions, and data into one user prompt
     big_prompt = (
         f"{system_like_context}"
@@ -128,40 +297,44 @@ def summarize_data(formatted_data):
         }
     ]
 
-    # Call the OpenAI API (New v1.0+ Syntax)
-    response = client.chat.completions.create(
+    # Call the OpenAI API (streamed)
+    summary = stream_openai(
+        configure_openai(),
+        messages,
         model="gpt-4o",  # Using gpt-4o as 'gpt-4.1' is not a standard public model alias
-        messages=messages
+        render=stream,
+        label="briefing",
+        cache=False,  # briefings should always reflect the latest run
+        response_format=BRIEFING_SCHEMA,
     )
-    
-    # New Access Method
-    summary = response.choices[0].message.content
     return summary
 
 
 def store_summary_in_google_sheets(sheet, summary):
-    """Stores the summary data in a 'Summaries' worksheet, appending a row."""
-    summary_sheet = sheet.worksheet("Summaries")
-    summary_sheet.append_row([summary])
+    """Stores the summary, rendered as readable text, in a 'Summaries' worksheet, appending a row."""
+    with span("sheets_write", tab="Summaries"):
+        summary_sheet = sheet.worksheet("Summaries")
+        summary_sheet.append_row([summary_markdown(summary)])
     time.sleep(1)  # Delay to prevent exceeding quota
 
 
-def generate_summary():
+def generate_summary(source_tabs=None, stream=False):
     """
-    Pulls data from Google Sheets, summarizes using the AI model,
+    Pulls data from Google Sheets (or takes freshly scraped `source_tabs`),
+    summarizes using the AI model (optionally streaming it to the page),
     stores the summary in the 'Summaries' worksheet, and returns it.
     """
+    sheet = get_spreadsheet(spreadsheet_id)
+
     # Read data from relevant worksheets
-    news_data = read_data(sheet, "Google News")
-    top_stories_data = read_data(sheet, "Top Stories")
-    rising_data = read_data(sheet, "Google Trends Rising")
-    top_data = read_data(sheet, "Google Trends Top")
+    news_data, top_stories_data, rising_data, top_data = read_data(sheet, source_tabs)
 
-    # Format all data into a single string
-    formatted_data = format_data_for_prompt(news_data, top_stories_data, rising_data, top_data)
+    # Format all data into a single, token-budgeted string
+    prompt_data = format_data_for_prompt(news_data, top_stories_data, rising_data, top_data)
+    print(prompt_data.report())
 
     # Generate summary via OpenAI
-    summary = summarize_data(formatted_data)
+    summary = summarize_data(prompt_data.text, stream=stream)
 
     # Store the summary in "Summaries" worksheet
     store_summary_in_google_sheets(sheet, summary)
@@ -0,0 +1,222 @@
+"""
+telemetry.py
+------------
+Lightweight spans for latency, token and cost accounting.
+
+    with span("serpapi", engine="google_news") as sp:
+        result = search.get_dict()
+        sp.set(results=len(result.get("news_results", [])))
+
+Each span records its stage, duration, success and free-form attributes.
+Known attributes (model, tokens_in, tokens_out, cache_hit, status) get
+their own columns so the admin page can compute p50/p95 per stage and
+daily spend. Spans are buffered in memory and flushed to SQLite by a
+background thread, so instrumenting a hot path (e.g. one span per
+article fetch) costs microseconds.
+
+Set PORTAL_TELEMETRY=0 to turn recording off.
+"""
+
+import asyncio
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# ---------------------------------------------------------------------
+# CONFIG
+# ---------------------------------------------------------------------
+DB_PATH     = Path(".cache") / "telemetry.sqlite"
+ENABLED     = os.environ.get("PORTAL_TELEMETRY", "1") != "0"
+FLUSH_EVERY = 2.0    # seconds
+FLUSH_AT    = 500    # buffered spans
+
+# USD per 1M tokens (input, output)
+PRICES = {
+    "gpt-4o":           (2.50, 10.00),
+    "gpt-4o-mini":      (0.15, 0.60),
+    "gpt-4.1":          (2.00, 8.00),
+    "gemini-1.5-pro":   (1.25, 5.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS spans (
+    ts          REAL NOT NULL,      -- start, unix seconds
+    stage       TEXT NOT NULL,
+    duration_ms REAL NOT NULL,
+    ok          INTEGER NOT NULL,
+    model       TEXT,
+    tokens_in   INTEGER,
+    tokens_out  INTEGER,
+    cache_hit   INTEGER,
+    status      INTEGER,
+    cost_usd    REAL,
+    attrs       TEXT               -- JSON, everything else
+);
+CREATE INDEX IF NOT EXISTS idx_spans_stage_ts ON spans(stage, ts);
+"""
+_COLUMNS = ("model", "tokens_in", "tokens_out", "cache_hit", "status")
+
+
+def cost_usd(model: Optional[str], tokens_in: Optional[int], tokens_out: Optional[int]) -> Optional[float]:
+    if not model or (tokens_in is None and tokens_out is None):
+        return None
+    # Dated snapshots ("gpt-4o-2024-08-06") price like their family
+    price = PRICES.get(model) or next(
+        (p for name, p in sorted(PRICES.items(), key=lambda kv: -len(kv[0])) if model.startswith(name)),
+        None,
+    )
+    if price is None:
+        return None
+    return ((tokens_in or 0) * price[0] + (tokens_out or 0) * price[1]) / 1_000_000
+
+
+class Span:
+    __slots__ = ("stage", "attrs", "start", "ok")
+
+    def __init__(self, stage: str, attrs: Dict[str, Any]):
+        self.stage = stage
+        self.attrs = attrs
+        self.start = time.time()
+        self.ok = True
+
+    def set(self, **attrs: Any) -> None:
+        self.attrs.update(attrs)
+
+
+class _Sink:
+    def __init__(self, path: Path = DB_PATH):
+        self.path = Path(path)
+        self._buffer: List[tuple] = []
+        self._lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+
+    def add(self, row: tuple) -> None:
+        with self._lock:
+            self._buffer.append(row)
+            full = len(self._buffer) >= FLUSH_AT
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._loop, name="telemetry-flush", daemon=True)
+                self._flusher.start()
+        if full:
+            self.flush()
+
+    def _loop(self) -> None:
+        while True:
+            time.sleep(FLUSH_EVERY)
+            self.flush()
+
+    def connect(self) -> sqlite3.Connection:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def flush(self) -> None:
+        with self._lock:
+            rows, self._buffer = self._buffer, []
+        if not rows:
+            return
+        try:
+            conn = self.connect()
+            with conn:
+                conn.executemany(f"INSERT INTO spans VALUES ({', '.join('?' * 11)})", rows)
+            conn.close()
+        except sqlite3.Error as e:
+            print(f"[telemetry] dropped {len(rows)} spans: {e}")
+
+
+_sink = _Sink()
+atexit.register(_sink.flush)
+
+
+def _record(sp: Span, duration_ms: float) -> None:
+    attrs = dict(sp.attrs)
+    cols = {k: attrs.pop(k, None) for k in _COLUMNS}
+    cache_hit = cols["cache_hit"]
+    cost = 0.0 if cache_hit else cost_usd(cols["model"], cols["tokens_in"], cols["tokens_out"])
+    _sink.add((
+        sp.start, sp.stage, duration_ms, int(sp.ok), cols["model"], cols["tokens_in"],
+        cols["tokens_out"], None if cache_hit is None else int(bool(cache_hit)), cols["status"],
+        cost, json.dumps(attrs, default=str) if attrs else None,
+    ))
+
+
+@contextmanager
+def span(stage: str, **attrs: Any) -> Iterator[Span]:
+    """
+    Times the block as one span of `stage`. An exception marks the span
+    failed and propagates; cancellation is recorded but not as a failure.
+    """
+    sp = Span(stage, attrs)
+    started = time.perf_counter()
+    try:
+        yield sp
+    except asyncio.CancelledError:
+        sp.set(cancelled=True)  # e.g. lost a hedge race: not a failure
+        raise
+    except BaseException as e:
+        sp.ok = False
+        sp.attrs.setdefault("error", type(e).__name__)
+        raise
+    finally:
+        if ENABLED:
+            _record(sp, (time.perf_counter() - started) * 1000)
+
+
+def flush() -> None:
+    _sink.flush()
+
+
+# ---------------------------------------------------------------------
+# Queries (admin page)
+# ---------------------------------------------------------------------
+def load_spans(days: float = 7, path: Optional[Path] = None) -> pd.DataFrame:
+    flush()
+    sink = _Sink(path) if path else _sink
+    conn = sink.connect()
+    try:
+        return pd.read_sql_query(
+            "SELECT * FROM spans WHERE ts >= ? ORDER BY ts", conn,
+            params=(time.time() - days * 86400,),
+        )
+    finally:
+        conn.close()
+
+
+def stage_stats(spans: pd.DataFrame) -> pd.DataFrame:
+    """Count, error rate and p50/p95/max latency (ms) per stage."""
+    rows = []
+    for stage, grp in spans.groupby("stage"):
+        d = grp["duration_ms"].to_numpy(dtype=float)
+        p50, p95 = np.percentile(d, [50, 95])
+        rows.append({
+            "stage": stage, "count": len(grp),
+            "error_rate": round(1 - grp["ok"].mean(), 3),
+            "p50_ms": round(float(p50), 1), "p95_ms": round(float(p95), 1),
+            "max_ms": round(float(d.max()), 1),
+            "cache_hit_rate": round(float(grp["cache_hit"].dropna().mean()), 3)
+                              if grp["cache_hit"].notna().any() else None,
+        })
+    return pd.DataFrame(rows).sort_values("p95_ms", ascending=False) if rows else pd.DataFrame()
+
+
+def daily_cost(spans: pd.DataFrame) -> pd.DataFrame:
+    """Spend and tokens per day and model, from spans that carry token counts."""
+    llm = spans[spans["model"].notna()].copy()
+    if llm.empty:
+        return pd.DataFrame()
+    llm["day"] = pd.to_datetime(llm["ts"], unit="s", utc=True).dt.date
+    return (llm.groupby(["day", "model"])
+               .agg(calls=("stage", "size"), tokens_in=("tokens_in", "sum"),
+                    tokens_out=("tokens_out", "sum"), cost_usd=("cost_usd", "sum"))
+               .reset_index())
@@ -1,8 +1,11 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
-from openai import OpenAI
-import gspread
-from google.oauth2.service_account import Credentials
-import google.generativeai as genai
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# SDK imports are deferred to the functions that need them so that importing
+# utils (and every page / module that does) stays cheap and does no I/O.
 
 # --- 1. Shared Styling ---
 def apply_branding():
@@ -15,34 +18,86 @@ def apply_branding():
     """, unsafe_allow_html=True)
 
 # --- 2. Shared Google Sheets Auth ---
+# Clients are process-wide resources: built on first use, shared by every
+# session and every module (news engine, summariser, pages).
+@st.cache_resource(show_spinner=False)
+def _authorize_gspread():
+    import gspread
+    from google.oauth2.service_account import Credentials
+
+    scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
+    creds = Credentials.from_service_account_info(st.secrets["service_account"], scopes=scope)
+    return gspread.authorize(creds)
+
 def get_gspread_client():
-    if "gspread_client" not in st.session_state:
-        try:
-            scope = ["https://spreadsheets.google.com/feeds", "https://www.googleapis.com/auth/drive"]
-            if "service_account" not in st.secrets:
-                st.error("🚨 Secret 'service_account' missing.")
-                st.stop()
-            
-            creds_dict = st.secrets["service_account"]
-            creds = Credentials.from_service_account_info(creds_dict, scopes=scope)
-            st.session_state.gspread_client = gspread.authorize(creds)
-        except Exception as e:
-            st.error(f"🚨 Google Sheets Error: {e}")
-            st.stop()
-    return st.session_state.gspread_client
+    if "service_account" not in st.secrets:
+        st.error("🚨 Secret 'service_account' missing.")
+        st.stop()
+    try:
+        return _authorize_gspread()
+    except Exception as e:
+        st.error(f"🚨 Google Sheets Error: {e}")
+        st.stop()
+
+@st.cache_resource(show_spinner=False)
+def get_spreadsheet(spreadsheet_id: str):
+    """Opens (once per process) the spreadsheet with the given key."""
+    return get_gspread_client().open_by_key(spreadsheet_id)
 
 # --- 3. Shared OpenAI Auth (UPDATED FOR v1.0+) ---
+@st.cache_resource(show_spinner=False)
+def _openai_client(api_key: str):
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
 def configure_openai():
     if "openai" not in st.secrets:
         st.error("🚨 Secret '[openai]' section is missing.")
         st.stop()
     
-    # Return a proper Client Instance
-    return OpenAI(api_key=st.secrets["openai"]["api_key"])
+    # Return the shared Client Instance
+    return _openai_client(st.secrets["openai"]["api_key"])
+
+def configure_async_openai():
+    """
+    Fresh AsyncOpenAI client for one batch of concurrent calls. Not cached:
+    async clients are bound to the event loop they were first used on.
+    Use as `async with configure_async_openai() as client:`.
+    """
+    if "openai" not in st.secrets:
+        st.error("🚨 Secret '[openai]' section is missing.")
+        st.stop()
+
+    from openai import AsyncOpenAI
+    return AsyncOpenAI(api_key=st.secrets["openai"]["api_key"])
 
 # --- 4. Shared Gemini Auth ---
 def configure_gemini():
     if "GOOGLE_API_KEY" in st.secrets:
+        import google.generativeai as genai
         genai.configure(api_key=st.secrets["GOOGLE_API_KEY"])
         return genai
     return None
+
+# --- 5. Async Bridge ---
+def run_async(coro):
+    """
+    Runs a coroutine to completion from sync code. If this thread already has
+    a running event loop (Streamlit sometimes does), the coroutine is driven
+    on a private loop in a worker thread instead of failing.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+
+    # Carry the script context over so the coroutine can still write to the page
+    ctx = get_script_run_ctx()
+
+    def _run():
+        if ctx is not None:
+            add_script_run_ctx(threading.current_thread(), ctx)
+        return asyncio.run(coro)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(_run).result()